@@ -1,156 +1,3900 @@
 import os
 import shutil
-import base64
-import webview
 from threading import Thread
 import sys
 import io
+import bisect
 import datetime
-from flask import Flask, send_file, request, Response
-from flask_cors import CORS
-from functools import lru_cache
+import functools
+import hashlib
+import heapq
+import importlib
+import inspect
+import json
+import mmap
+import re
+import struct
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import closing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Heavy dependencies (pywebview, Flask, PIL, NumPy, OpenCV, PyAV) are imported
+# where they are first needed: this module is also re-imported by every
+# thumbnail worker process, and the window should not wait on the server.
+
+@functools.lru_cache(maxsize=None)
+def optional_module(name):
+    """Import an optional dependency once; None if it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+# --- Startup Timing ---
+
+def _process_start_time():
+    """Wall-clock creation time of this process, or None where unknown."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            times = [wintypes.FILETIME() for _ in range(4)]
+            kernel32 = ctypes.windll.kernel32
+            if kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), *(ctypes.byref(t) for t in times)):
+                ticks = (times[0].dwHighDateTime << 32) | times[0].dwLowDateTime
+                return ticks / 10000000 - 11644473600  # FILETIME counts from 1601
+        elif sys.platform.startswith('linux'):
+            with open('/proc/self/stat') as f:
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/stat') as f:
+                boot = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+            return boot + start_ticks / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        pass
+    return None
+
+class StartupTimer:
+    """
+    Launch timeline: named marks in seconds since process start (or since
+    this module began loading, where the OS doesn't say). Once the first
+    image is on screen the breakdown is printed and appended to startup.json.
+    """
+
+    HISTORY = 20
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._launched = time.time()
+        started = _process_start_time()
+        self._offset = 0.0
+        if started is not None and 0 <= self._launched - started < 600:
+            self._offset = self._launched - started
+            self._launched = started
+        self.marks = OrderedDict(python_ready=round(self._offset, 4))
+        self._lock = threading.Lock()
+        self._saved = False
+
+    def mark(self, name):
+        """Record the first occurrence of a milestone."""
+        with self._lock:
+            if name in self.marks:
+                return
+            self.marks[name] = round(time.perf_counter() - self._t0 + self._offset, 4)
+        if name == 'first_image':
+            self.save()
+
+    def report(self):
+        with self._lock:
+            marks = OrderedDict(sorted(self.marks.items(), key=lambda m: m[1]))
+        names = list(marks)
+        phases = OrderedDict((f"{a} -> {b}", round(marks[b] - marks[a], 4)) for a, b in zip(names, names[1:]))
+        folder_to_image = None
+        if 'first_image' in marks and 'folder_opened' in marks:
+            folder_to_image = round(marks['first_image'] - marks['folder_opened'], 4)
+        return {
+            "launched_at": datetime.datetime.fromtimestamp(self._launched).isoformat(timespec='seconds'),
+            "marks": dict(marks),
+            "phases": dict(phases),
+            "time_to_first_image": marks.get('first_image'),
+            "folder_to_first_image": folder_to_image,
+        }
+
+    def save(self):
+        with self._lock:
+            if self._saved:
+                return
+            self._saved = True
+        report = self.report()
+        print("Startup timeline:")
+        for name, seconds in report["marks"].items():
+            print(f"  {seconds * 1000:9.1f} ms  {name}")
+        path = os.path.join(get_cache_dir(), 'startup.json')
+        try:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    history = json.load(f)
+            except (OSError, ValueError):
+                history = []
+            history = (history + [report])[-self.HISTORY:]
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(history, f, indent=1)
+        except OSError as e:
+            print(f"Startup report not saved: {e}")
+
+startup = StartupTimer()
+
+# --- Instrumentation ---
+
+# MEDIASORT_METRICS=1 installs the latency hooks below; when unset they are
+# never installed, and /metrics only reports gauges read at scrape time.
+METRICS_ENABLED = os.environ.get('MEDIASORT_METRICS', '').lower() not in ('', '0', 'false', 'no')
+
+class Histogram:
+    """Cumulative latency histogram (seconds) with Prometheus default-like buckets."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+def _metric_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+class Metrics:
+    """
+    In-process registry rendered in the Prometheus text format. Histograms
+    are only recorded when enabled; collectors read gauges and counters from
+    the live caches and queues on every scrape.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def collector(self, fn):
+        """Register fn() -> [(name, type, labels dict, value)], called per scrape."""
+        self._collectors.append(fn)
+        return fn
+
+    def timed(self, name, **labels):
+        """Decorator recording call latency; returns fn untouched when disabled."""
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            # pywebview reads parameter names with getfullargspec
+            wrapper.__signature__ = inspect.signature(fn)
+            return wrapper
+        return decorate
+
+    def render(self):
+        families = OrderedDict()
+        with self._lock:
+            for (name, labels), h in sorted(self._histograms.items()):
+                families.setdefault((name, 'histogram'), []).append((labels, list(h.counts), h.total, h.count))
+        for fn in self._collectors:
+            try:
+                for name, kind, labels, value in fn():
+                    families.setdefault((name, kind), []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+        lines = []
+        for (name, kind), samples in families.items():
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind != 'histogram':
+                lines.extend(f"{name}{_metric_labels(labels)} {value}" for labels, value in samples)
+                continue
+            for labels, counts, total, count in samples:
+                cumulative = 0
+                for bound, n in zip(Histogram.BUCKETS + ('+Inf',), counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_metric_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_metric_labels(labels)} {total}")
+                lines.append(f"{name}_count{_metric_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(METRICS_ENABLED)
+metrics.describe('mediasort_http_request_seconds', 'Media server latency to response start, by route.')
+metrics.describe('mediasort_render_seconds', 'Render time by stage (decode, hash, encode) and size class.')
+metrics.describe('mediasort_api_seconds', 'JS bridge call latency by Api method.')
+
+def instrument_methods(cls):
+    """Class decorator timing every public method (JS bridge calls) when enabled."""
+    if metrics.enabled:
+        for name, fn in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.isfunction(fn):
+                setattr(cls, name, metrics.timed('mediasort_api_seconds', method=name)(fn))
+    return cls
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: while running, a daemon thread snapshots
+    every thread's stack each `interval` seconds and counts folded stacks
+    (the flamegraph.pl / speedscope input format). Free while stopped.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._deadline = None
+        self._lock = threading.Lock()
+
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def start(self, seconds=None):
+        """Begin sampling, for at most `seconds` if given; False if already running."""
+        with self._lock:
+            if self.running():
+                return False
+            self._counts = Counter()
+            self._stop.clear()
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._thread = Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling and return the folded stacks ("frame;frame count" lines)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return '\n'.join(f"{stack} {n}" for stack, n in self._counts.most_common())
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._counts[';'.join(reversed(stack))] += 1
+
+profiler = SamplingProfiler()
+
+# --- Persistent Thumbnail Cache ---
+
+def get_cache_dir():
+    """Per-user folder for MediaSort caches (created on demand)."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'MediaSort')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it is gone."""
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+class LazyConnection:
+    """
+    SQLite connection opened (and its schema set up) on first use, so merely
+    importing this module - in the window process or a thumbnail worker -
+    touches no database files.
+    """
+
+    def __init__(self, db_path, setup):
+        self.db_path = db_path
+        self._setup = setup
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        conn = self._conn
+        if conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+                    self._setup(conn)
+                    self._conn = conn
+                conn = self._conn
+        return conn
+
+    def execute(self, *args):
+        return self.connect().execute(*args)
+
+    def executemany(self, *args):
+        return self.connect().executemany(*args)
+
+class ThumbnailCache:
+    """
+    On-disk, content-addressed thumbnail store backed by SQLite.
+    Entries are keyed on path + mtime + size (+ a variant tag), so editing a
+    file naturally invalidates its thumbnail. The total blob size is kept
+    under `max_bytes` by evicting the least recently used entries.
+    """
+
+    def __init__(self, db_path=None, max_bytes=512 * 1024 * 1024):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'thumbnails.db')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total = 0
+        self._conn = LazyConnection(self.db_path, self._setup)
+
+    def _setup(self, conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS thumbs ('
+            ' key TEXT PRIMARY KEY, path TEXT, variant TEXT, data BLOB, size INTEGER, last_access REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS thumbs_access ON thumbs(last_access)')
+        conn.execute('CREATE INDEX IF NOT EXISTS thumbs_path ON thumbs(path)')
+        # Covering index: summing sizes must not read through every blob
+        conn.execute('CREATE INDEX IF NOT EXISTS thumbs_size ON thumbs(size)')
+        self._total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM thumbs').fetchone()[0]
+
+    @staticmethod
+    def make_key(path, signature, variant='thumb'):
+        mtime_ns, size = signature
+        raw = f"{os.path.abspath(path)}|{mtime_ns}|{size}|{variant}"
+        return hashlib.sha1(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def get(self, path, variant='thumb', signature=None):
+        signature = signature or file_signature(path)
+        if signature is None:
+            return None
+        key = self.make_key(path, signature, variant)
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM thumbs WHERE key=?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute('UPDATE thumbs SET last_access=? WHERE key=?', (time.time(), key))
+            return bytes(row[0])
+
+    def contains(self, path, variant='thumb'):
+        """Whether an entry exists, for internal checks: no hit/miss counting, no LRU touch."""
+        signature = file_signature(path)
+        if signature is None:
+            return False
+        key = self.make_key(path, signature, variant)
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM thumbs WHERE key=?', (key,)).fetchone() is not None
+
+    def warm(self, paths, variant='thumb'):
+        """Page entries in from disk without counting hits or touching LRU order."""
+        keys = []
+        for path in paths:
+            signature = file_signature(path)
+            if signature is not None:
+                keys.append(self.make_key(path, signature, variant))
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                self._conn.execute(f'SELECT data FROM thumbs WHERE key IN ({marks})', chunk).fetchall()
+
+    def put(self, path, data, variant='thumb', signature=None):
+        signature = signature or file_signature(path)
+        if signature is None or not data:
+            return
+        key = self.make_key(path, signature, variant)
+        abspath = os.path.abspath(path)
+        with self._lock:
+            # Drop older renditions of the same file/variant (stale mtime/size)
+            old = self._conn.execute(
+                'SELECT key, size FROM thumbs WHERE path=? AND variant=?', (abspath, variant)
+            ).fetchall()
+            for old_key, old_size in old:
+                self._conn.execute('DELETE FROM thumbs WHERE key=?', (old_key,))
+                self._total -= old_size
+            self._conn.execute(
+                'INSERT OR REPLACE INTO thumbs (key, path, variant, data, size, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, abspath, variant, sqlite3.Binary(data), len(data), time.time())
+            )
+            self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def discard(self, path):
+        """Forget every variant cached for a path (e.g. after delete)."""
+        abspath = os.path.abspath(path)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, size FROM thumbs WHERE path=?', (abspath,)
+            ).fetchall()
+            for key, size in rows:
+                self._conn.execute('DELETE FROM thumbs WHERE key=?', (key,))
+                self._total -= size
+
+    def _evict(self):
+        # Trim down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute('SELECT key, size FROM thumbs ORDER BY last_access ASC').fetchall()
+        self._conn.execute('BEGIN')
+        for key, size in rows:
+            if self._total <= target:
+                break
+            self._conn.execute('DELETE FROM thumbs WHERE key=?', (key,))
+            self._total -= size
+        self._conn.execute('COMMIT')
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM thumbs').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+thumb_cache = ThumbnailCache()
+
+# --- Fast Decode Layer ---
+# Cheapest route from a file on disk to a small RGB image:
+#  - RAW containers: pull the camera's embedded JPEG preview (no demosaic)
+#  - JPEG thumbnails: use the EXIF thumbnail when it is big enough
+#  - JPEG otherwise: let libjpeg downscale during decode (Image.draft)
+
+# PIL modules, bound by _import_pil() the first time a process decodes
+Image = ImageOps = ImageDraw = None
+
+def _import_pil():
+    global Image, ImageOps, ImageDraw
+    if Image is None:
+        from PIL import Image, ImageDraw, ImageOps
+
+RAW_EXTS = {".arw", ".cr2", ".cr3", ".nef", ".raf", ".dng", ".orf", ".rw2"}
+JPEG_EXTS = {".jpg", ".jpeg"}
+
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+# Most IFD offsets _tiff_ifds will look at; real files have a handful, a
+# crafted one can list thousands of SubIFDs
+MAX_TIFF_IFD_OFFSETS = 256
+
+def _tiff_ifds(buf, base=0):
+    """
+    Walk every IFD of the TIFF structure starting at `base` in `buf`
+    (IFD chain, SubIFDs and the EXIF IFD). Returns (endian, [ifd, ...]) where
+    each ifd maps tag -> (type, count, absolute data offset).
+    """
+    head = bytes(buf[base:base + 8])
+    if head[:2] == b'II':
+        e = '<'
+    elif head[:2] == b'MM':
+        e = '>'
+    else:
+        return None, []
+    try:
+        first = struct.unpack_from(e + 'I', head, 4)[0]
+    except struct.error:
+        return None, []
+
+    ifds = []
+    # Offsets already visited, so a cyclic chain or SubIFD list ends
+    seen = set()
+    pending = deque([first])
+    size = len(buf)
+    while pending and len(ifds) < 32 and len(seen) < MAX_TIFF_IFD_OFFSETS:
+        off = pending.popleft()
+        if off <= 0 or off in seen or base + off + 2 > size:
+            continue
+        seen.add(off)
+        count = struct.unpack_from(e + 'H', buf, base + off)[0]
+        if count > 1000:
+            continue
+        tags = {}
+        for i in range(count):
+            p = base + off + 2 + 12 * i
+            if p + 12 > size:
+                break
+            tag, typ, n = struct.unpack_from(e + 'HHI', buf, p)
+            if _TIFF_TYPE_SIZES.get(typ, 1) * n <= 4:
+                tags[tag] = (typ, n, p + 8)
+            else:
+                tags[tag] = (typ, n, base + struct.unpack_from(e + 'I', buf, p + 8)[0])
+        ifds.append(tags)
+        nxt = base + off + 2 + 12 * count
+        if nxt + 4 <= size:
+            pending.append(struct.unpack_from(e + 'I', buf, nxt)[0])
+        for sub in (0x14A, 0x8769):  # SubIFDs, Exif IFD
+            if sub in tags:
+                values = _tiff_value(buf, e, tags[sub])
+                if isinstance(values, list):
+                    pending.extend(v for v in values if isinstance(v, int))
+    return e, ifds
+
+def _tiff_value(buf, e, entry):
+    """Decode a tag entry into a list of values (str for ASCII)."""
+    typ, n, off = entry
+    if n > 4096 or off < 0 or off + _TIFF_TYPE_SIZES.get(typ, 1) * n > len(buf):
+        return []
+    if typ == 2:
+        return bytes(buf[off:off + n]).split(b'\0', 1)[0].decode('latin-1').strip()
+    if typ in (1, 7):
+        return list(bytes(buf[off:off + n]))
+    fmt = {3: 'H', 4: 'I', 8: 'h', 9: 'i', 11: 'f', 12: 'd', 13: 'I'}.get(typ)
+    if fmt:
+        return list(struct.unpack_from(f"{e}{n}{fmt}", buf, off))
+    if typ in (5, 10):
+        raw = struct.unpack_from(f"{e}{2 * n}{'I' if typ == 5 else 'i'}", buf, off)
+        return [(raw[i], raw[i + 1]) for i in range(0, len(raw), 2)]
+    return []
+
+def _tiff_int(buf, e, entry, default=None):
+    """First value of a tag that should hold an integer, else default."""
+    values = _tiff_value(buf, e, entry) if entry else []
+    if isinstance(values, list) and values and isinstance(values[0], int):
+        return values[0]
+    return default
+
+def _jpeg_size(buf, off, limit=None):
+    """(width, height) of a baseline/progressive JPEG at `off`, else None."""
+    end = min(len(buf), limit if limit is not None else len(buf))
+    if off < 0 or bytes(buf[off:off + 2]) != b'\xff\xd8':
+        return None
+    p = off + 2
+    while p + 4 <= end:
+        if buf[p] != 0xFF:
+            return None
+        marker = buf[p + 1]
+        if marker == 0xFF:
+            p += 1
+            continue
+        seg_len = struct.unpack_from('>H', buf, p + 2)[0]
+        if seg_len < 2:
+            return None
+        if marker in (0xC0, 0xC1, 0xC2):
+            if p + 9 > end:
+                return None
+            h, w = struct.unpack_from('>HH', buf, p + 5)
+            return (w, h) if w and h else None
+        if marker in (0xC3, 0xDA, 0xD9) or 0xC5 <= marker <= 0xCF and marker not in (0xC8, 0xCC):
+            # Lossless/hierarchical JPEG (e.g. CR2/DNG raw data) or no frame header
+            return None
+        p += 2 + seg_len
+    return None
+
+def _embedded_jpegs(buf, base=0):
+    """Candidate embedded JPEGs inside TIFF data: [(offset, length, (w, h))], plus orientation."""
+    e, ifds = _tiff_ifds(buf, base)
+    found = []
+    orientation = _tiff_int(buf, e, ifds[0].get(0x112), 1) if ifds else 1
+    for tags in ifds:
+        spans = []
+        if 0x201 in tags and 0x202 in tags:
+            spans.append((_tiff_value(buf, e, tags[0x201]), _tiff_value(buf, e, tags[0x202]), base))
+        if 0x111 in tags and 0x117 in tags and _tiff_int(buf, e, tags.get(0x103)) in (6, 7):
+            spans.append((_tiff_value(buf, e, tags[0x111]), _tiff_value(buf, e, tags[0x117]), base))
+        if 0x2E in tags:  # Panasonic RW2 JpgFromRaw
+            spans.append(([tags[0x2E][2]], [tags[0x2E][1]], 0))
+        for offs, lens, rel in spans:
+            # Single strips only; offsets and lengths must be plain integers
+            if not (isinstance(offs, list) and isinstance(lens, list) and len(offs) == len(lens) == 1):
+                continue
+            if not (isinstance(offs[0], int) and isinstance(lens[0], int)):
+                continue
+            start = offs[0] + rel
+            length = lens[0]
+            if start < 0 or length <= 0 or start + length > len(buf):
+                continue
+            dims = _jpeg_size(buf, start, start + length)
+            if dims:
+                found.append((start, length, dims))
+    return found, orientation
+
+def _pick_preview(candidates, max_size):
+    """Smallest candidate that still covers max_size, else the largest one."""
+    if not candidates:
+        return None
+    by_area = sorted(candidates, key=lambda c: c[2][0] * c[2][1])
+    for cand in by_area:
+        w, h = cand[2]
+        if max(w, h) >= max(max_size) and min(w, h) >= min(max_size):
+            return cand
+    return by_area[-1]
+
+def _raw_preview(path, max_size):
+    """Embedded JPEG preview of a RAW file as (bytes, orientation), or (None, 1)."""
+    if os.path.getsize(path) == 0:
+        return None, 1  # mmap refuses empty files
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        orientation = 1
+        candidates = []
+        if mm[:15] == b'FUJIFILMCCD-RAW':
+            # RAF header points straight at the JPEG preview
+            off, length = struct.unpack_from('>II', mm, 84) if len(mm) >= 92 else (0, 0)
+            dims = _jpeg_size(mm, off, off + length) if length and off + length <= len(mm) else None
+            if dims:
+                candidates.append((off, length, dims))
+                # The preview's own EXIF block carries orientation and a smaller thumbnail
+                inner, orientation = _embedded_jpegs(mm, off + 12)
+                candidates.extend(inner)
+        else:
+            candidates, orientation = _embedded_jpegs(mm)
+        if not candidates:
+            # Non-TIFF containers (e.g. CR3): scan the head of the file for JPEG frames
+            window = min(len(mm), 8 * 1024 * 1024)
+            pos = mm.find(b'\xff\xd8\xff', 0, window)
+            while pos != -1:
+                dims = _jpeg_size(mm, pos, window)
+                if dims:
+                    candidates.append((pos, window - pos, dims))
+                pos = mm.find(b'\xff\xd8\xff', pos + 3, window)
+        best = _pick_preview(candidates, max_size)
+        if best is None:
+            return None, 1
+        off, length, _ = best
+        return mm[off:off + length], orientation
+
+def _exif_thumbnail(path):
+    """EXIF (IFD1) thumbnail of a JPEG as (bytes, (w, h), orientation), or None."""
+    with open(path, 'rb') as f:
+        head = f.read(128 * 1024)
+    p = 2
+    while p + 4 <= len(head) and head[p] == 0xFF:
+        marker = head[p + 1]
+        seg_len = struct.unpack_from('>H', head, p + 2)[0]
+        if seg_len < 2:
+            break
+        if marker == 0xE1 and head[p + 4:p + 10] == b'Exif\0\0':
+            candidates, orientation = _embedded_jpegs(head[:p + 2 + seg_len], p + 10)
+            if candidates:
+                off, length, dims = min(candidates, key=lambda c: c[1])
+                return head[off:off + length], dims, orientation
+            return None
+        if marker == 0xDA:
+            break
+        p += 2 + seg_len
+    return None
+
+def _apply_orientation(img, orientation):
+    _import_pil()
+    method = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90,
+    }.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+def _finish(img, max_size):
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail(max_size)
+    return img
+
+def decode_image(path, max_size):
+    """
+    Open an image as an upright RGB PIL image fitting inside max_size,
+    using embedded previews and DCT scaling where possible.
+    """
+    _import_pil()
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in RAW_EXTS:
+        try:
+            data, orientation = _raw_preview(path, max_size)
+            if data:
+                with Image.open(io.BytesIO(data)) as img:
+                    img.draft('RGB', max_size[::-1] if orientation in (5, 6, 7, 8) else max_size)
+                    img = _apply_orientation(img.convert('RGB'), orientation)
+                    return _finish(img, max_size)
+        except Exception as e:
+            print(f"RAW preview extraction failed for {path}: {e}")
+
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            orientation = img.getexif().get(0x112, 1)
+            box = max_size[::-1] if orientation in (5, 6, 7, 8) else max_size
+            if max(max_size) <= 256:
+                try:
+                    thumb = _exif_thumbnail(path)
+                    if thumb:
+                        data, (tw, th), _ = thumb
+                        # Only when it covers the target and isn't letterboxed
+                        if max(tw, th) >= max(box) and abs(tw / th - img.width / img.height) < 0.02:
+                            with Image.open(io.BytesIO(data)) as t:
+                                t = _apply_orientation(t.convert('RGB'), orientation)
+                                return _finish(t, max_size)
+                except Exception as e:
+                    print(f"EXIF thumbnail read failed for {path}: {e}")
+            img.draft('RGB', box)
+        img = ImageOps.exif_transpose(img)
+        return _finish(img, max_size)
+
+# --- Video Previews ---
+
+# Poster frame offset (skips fade-ins) and the hover-scrub strip layout
+POSTER_SECONDS = 1.0
+SCRUB_FRAMES = 10
+SCRUB_FRAME_SIZE = (160, 90)
+
+def _scaled_size(width, height, max_size):
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+class _AVVideo:
+    """PyAV decoder that only decodes keyframes, so a seek costs one frame."""
+
+    def __init__(self, path):
+        import av
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        self.stream.codec_context.skip_frame = 'NONKEY'
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self.fps = float(self.stream.average_rate or 0)
+        if self.stream.duration and self.stream.time_base:
+            self.duration = float(self.stream.duration * self.stream.time_base)
+        else:
+            self.duration = (self.container.duration or 0) / 1000000
+
+    def frame_at(self, seconds, max_size):
+        time_base = self.stream.time_base
+        target = self.stream.start_time or 0
+        if time_base:
+            target += int(seconds / time_base)
+        # The seek lands on the keyframe at or before the target (often frame 0
+        # for a poster); decode forward, keyframes only, to the first one at or
+        # after it, falling back to the last keyframe of the stream
+        self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        frame = None
+        for frame in self.container.decode(self.stream):
+            if frame.pts is None or frame.pts >= target:
+                break
+        if frame is None:
+            return None
+        width, height = _scaled_size(frame.width, frame.height, max_size)
+        return frame.reformat(width=width, height=height, format='rgb24').to_image()
+
+    def close(self):
+        self.container.close()
+
+class _CVVideo:
+    """OpenCV fallback (no keyframe-only mode: seeks decode from the previous keyframe)."""
+
+    def __init__(self, path):
+        import cv2
+        self.cv2 = cv2
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise OSError(f"Could not open video file: {path}")
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+        frames = self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        self.duration = frames / self.fps if self.fps > 0 else 0
+
+    def frame_at(self, seconds, max_size):
+        _import_pil()
+        cv2 = self.cv2
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        height, width = frame.shape[:2]
+        size = _scaled_size(width, height, max_size)
+        if size != (width, height):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def close(self):
+        self.cap.release()
+
+def open_video(path):
+    """Keyframe-seeking decoder for a video: PyAV when installed, else OpenCV."""
+    if optional_module('av') is None:
+        return _CVVideo(path)
+    return _AVVideo(path)
+
+def grab_video_frame(path, max_size=(1920, 1080)):
+    """Poster frame about a second into a video (nearest keyframe), or None."""
+    try:
+        with closing(open_video(path)) as video:
+            return video.frame_at(min(POSTER_SECONDS, video.duration / 2), max_size)
+    except ImportError as e:
+        print(f"Video decoder unavailable: {e}")
+    except Exception as e:
+        print(f"Warning: Could not read frame from {path}: {e}")
+    return None
+
+def render_scrub_strip(path, frames=SCRUB_FRAMES):
+    """
+    JPEG sprite of `frames` evenly spaced keyframes, each letterboxed into a
+    SCRUB_FRAME_SIZE cell, for hover scrubbing without decoding on demand.
+    """
+    _import_pil()
+    cell_w, cell_h = SCRUB_FRAME_SIZE
+    with closing(open_video(path)) as video:
+        duration = video.duration
+        times = [duration * (i + 0.5) / frames for i in range(frames)] if duration > 0 else [0] * frames
+        images = []
+        for t in times:
+            img = video.frame_at(t, SCRUB_FRAME_SIZE)
+            # Past the last keyframe: repeat the previous frame
+            images.append(img if img is not None else (images[-1] if images else None))
+    if not any(images):
+        return None
+    strip = Image.new('RGB', (cell_w * frames, cell_h))
+    for i, img in enumerate(images):
+        if img is not None:
+            strip.paste(img.convert('RGB'), (i * cell_w + (cell_w - img.width) // 2, (cell_h - img.height) // 2))
+    buffer = io.BytesIO()
+    strip.save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+def scrub_job(path):
+    """Pool task: scrub strip bytes, or None if the video cannot be decoded."""
+    try:
+        return render_scrub_strip(path)
+    except Exception as e:
+        print(f"Scrub Gen Error {path}: {e}")
+        return None
+
+# --- Preview Render Cache ---
+
+# Web-safe formats that browser can render directly
+WEB_SAFE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp', '.mp4', '.mov', '.webm', '.ogg'}
+VIDEO_EXTS = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+PREVIEW_SIZE = (1920, 1080)
+# Previewed as the original file: a JPEG would lose the animation / vectors
+ORIGINAL_PREVIEW_EXTS = {'.gif', '.svg'}
+
+# Size classes shared by every rendered output: (bounding box, encoder quality)
+SIZE_CLASSES = {
+    'thumb': ((150, 150), 70),
+    'preview': (PREVIEW_SIZE, 85),
+}
+# Output formats: (PIL encoder, mimetype)
+RENDER_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+def video_placeholder(size=150):
+    """Film-strip placeholder for videos OpenCV cannot open."""
+    _import_pil()
+    img = Image.new('RGB', (150, 150), color='#334155')
+    draw = ImageDraw.Draw(img)
+    for y in range(10, 150, 20):
+        draw.rectangle([5, y, 15, y+10], fill='white')
+        draw.rectangle([135, y, 145, y+10], fill='white')
+    draw.rectangle([40, 60, 110, 90], outline='white', width=2)
+    draw.line([50, 65, 75, 85], fill='white', width=3)
+    draw.line([75, 85, 100, 65], fill='white', width=3)
+    if size != 150:
+        img = img.resize((size, size))
+    return img
+
+def source_image(path, size_class='preview'):
+    """Oriented RGB PIL image bounded by the size class box (videos: a frame)."""
+    box = SIZE_CLASSES[size_class][0]
+    if os.path.splitext(path)[1].lower() in VIDEO_EXTS:
+        img = grab_video_frame(path, box) or video_placeholder(min(box))
+    else:
+        img = decode_image(path, box)
+    img.thumbnail(box)
+    return img
+
+def encode_image(img, size_class='preview', fmt='jpeg'):
+    encoder = RENDER_FORMATS[fmt][0]
+    buffer = io.BytesIO()
+    img.save(buffer, format=encoder, quality=SIZE_CLASSES[size_class][1])
+    return buffer.getvalue()
+
+def render_image(path, size_class='preview', fmt='jpeg'):
+    """Decode and encode one rendition of a file (no caching)."""
+    if not metrics.enabled:
+        return encode_image(source_image(path, size_class), size_class, fmt)
+    start = time.perf_counter()
+    img = source_image(path, size_class)
+    decoded = time.perf_counter()
+    data = encode_image(img, size_class, fmt)
+    metrics.observe('mediasort_render_seconds', decoded - start, stage='decode', size_class=size_class)
+    metrics.observe('mediasort_render_seconds', time.perf_counter() - decoded, stage='encode', size_class=size_class)
+    return data
+
+# Request threads that may render or wait on a preview render at once:
+# /render's extra renditions render in the slot, /view and preview requests
+# that miss the preview LRU hold one while they wait on the preview pool.
+# Thumbnails and scrub strips only wait on their pool. Past RENDER_WAIT_TIMEOUT
+# without a slot the request gets a 503, so streaming always has threads left.
+RENDER_SLOTS = 6
+RENDER_WAIT_TIMEOUT = 5
+render_slots = threading.BoundedSemaphore(RENDER_SLOTS)
+# How long a request waits on the thumbnail/scrub/preview pools before a 503
+POOL_WAIT_TIMEOUT = 20
+
+class RenderBusy(Exception):
+    """No render slot freed up within RENDER_WAIT_TIMEOUT, or the render was dropped."""
+
+class PreviewCache:
+    """
+    Memory-budgeted LRU of rendered preview JPEGs with a neighbour prefetcher.
+    The UI reports the current index and direction; the next `ahead` files
+    (and `behind` in the other direction) are rendered on worker threads so
+    arrow-key navigation is served from memory.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ahead=3, behind=1, workers=2):
+        self.max_bytes = max_bytes
+        self.ahead = ahead
+        self.behind = behind
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+
+    @staticmethod
+    def needs_render(path):
+        """True if the browser can't show the original (/view renders it instead)."""
+        ext = os.path.splitext(path)[1].lower()
+        return ext not in WEB_SAFE_EXTS and ext not in VIDEO_EXTS
+
+    @staticmethod
+    def has_preview(path):
+        """True if the viewer shows a PREVIEW_SIZE rendition rather than the original."""
+        ext = os.path.splitext(path)[1].lower()
+        return ext not in VIDEO_EXTS and ext not in ORIGINAL_PREVIEW_EXTS
+
+    def get(self, path):
+        """
+        Rendered preview bytes. A miss holds a render slot while it waits up
+        to POOL_WAIT_TIMEOUT on the render (FutureTimeoutError past that).
+        Raises RenderBusy if no slot frees up or set_position dropped the
+        queued render because the user moved on.
+        """
+        signature = file_signature(path)
+        if signature is None:
+            return None
+        key = (path, signature)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return data
+            self.misses += 1
+        if not render_slots.acquire(timeout=RENDER_WAIT_TIMEOUT):
+            raise RenderBusy(path)
+        try:
+            with self._lock:
+                data = self._entries.get(key)
+                if data is not None:
+                    return data
+                future = self._schedule(key)
+            return future.result(timeout=POOL_WAIT_TIMEOUT)
+        except CancelledError:
+            # Out of the window now; not worth rendering again
+            raise RenderBusy(path)
+        finally:
+            render_slots.release()
+
+    def set_position(self, paths, index, direction=1):
+        """Prefetch around `index` of `paths`, favouring the travel direction."""
+        step = 1 if direction >= 0 else -1
+        wanted = [index] + [index + step * i for i in range(1, self.ahead + 1)]
+        wanted += [index - step * i for i in range(1, self.behind + 1)]
+        targets = []
+        for i in wanted:
+            if 0 <= i < len(paths) and self.has_preview(paths[i]):
+                signature = file_signature(paths[i])
+                if signature is not None:
+                    targets.append((paths[i], signature))
+        with self._lock:
+            # Drop queued work that fell out of the window
+            for key, future in list(self._pending.items()):
+                if key not in targets and future.cancel():
+                    self._pending.pop(key, None)
+            for key in targets:
+                if key not in self._entries:
+                    self._schedule(key)
+
+    def discard(self, path):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._bytes -= len(self._entries.pop(key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _schedule(self, key):
+        # Caller holds self._lock
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pool.submit(self._render, key)
+            self._pending[key] = future
+        return future
+
+    def _render(self, key):
+        try:
+            data = render_image(key[0], 'preview')
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+        return data
+
+preview_cache = PreviewCache()
+
+class RenderService:
+    """
+    Single entry point for rendered media, keyed by (path, size class, format).
+    JPEG thumbnails come from the disk cache / prefetch pool and JPEG previews
+    from the preview LRU; other renditions are stored in the disk cache under
+    their own variant. Concurrent requests for the same key share one render.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._rendering = 0
+
+    def rendering(self):
+        """Renders currently holding a slot."""
+        with self._lock:
+            return self._rendering
+
+    def get(self, path, size_class='preview', fmt='jpeg'):
+        """Rendered bytes for a file, or None if it no longer exists."""
+        if size_class not in SIZE_CLASSES or fmt not in RENDER_FORMATS:
+            raise ValueError(f"Unknown rendition {size_class}/{fmt}")
+        signature = file_signature(path)
+        if signature is None:
+            return None
+        if fmt == 'jpeg' and size_class == 'preview':
+            return preview_cache.get(path)
+        variant = 'thumb' if fmt == 'jpeg' else f"{size_class}.{fmt}"
+        data = thumb_cache.get(path, variant=variant, signature=signature)
+        if data is not None:
+            return data
+        if variant == 'thumb':
+            # Generated on the prefetch pool, which also records its hashes
+            return thumb_prefetcher.request(path).result(timeout=POOL_WAIT_TIMEOUT)
+        return self._single_flight((path, signature, variant),
+                                   lambda: self._render(path, size_class, fmt, variant, signature))
+
+    def scrub_strip(self, path):
+        """Hover-scrub sprite for a video (pre-generated by the prefetcher), or None."""
+        signature = file_signature(path)
+        if signature is None:
+            return None
+        data = thumb_cache.get(path, variant='scrub', signature=signature)
+        if data is None:
+            data = thumb_prefetcher.request_scrub(path).result(timeout=POOL_WAIT_TIMEOUT)
+        return data
+
+    @staticmethod
+    def _query(path):
+        import urllib.parse
+        signature = file_signature(path)
+        version = f"{signature[0]:x}" if signature else "0"
+        return f"path={urllib.parse.quote(path)}&v={version}"
+
+    def url(self, path, size_class='preview', fmt='jpeg'):
+        """Media server URL for a rendition, versioned by the file signature."""
+        query = self._query(path)
+        base = f"http://127.0.0.1:{PORT}"
+        if fmt == 'jpeg' and size_class == 'thumb':
+            return f"{base}/thumbnail?{query}"
+        if fmt == 'jpeg' and size_class == 'preview' and not PreviewCache.has_preview(path):
+            return f"{base}/view?{query}"
+        return f"{base}/render?{query}&size={size_class}&fmt={fmt}"
+
+    def original_url(self, path):
+        """/view URL: the file itself, or a rendered preview if browsers can't show it."""
+        return f"http://127.0.0.1:{PORT}/view?{self._query(path)}"
+
+    @staticmethod
+    def mimetype(fmt):
+        return RENDER_FORMATS[fmt][1]
+
+    def _render(self, path, size_class, fmt, variant, signature):
+        # The slot covers the render itself, not time spent queued elsewhere
+        if not render_slots.acquire(timeout=RENDER_WAIT_TIMEOUT):
+            raise RenderBusy(path)
+        with self._lock:
+            self._rendering += 1
+        try:
+            data = render_image(path, size_class, fmt)
+        finally:
+            with self._lock:
+                self._rendering -= 1
+            render_slots.release()
+        thumb_cache.put(path, data, variant=variant, signature=signature)
+        return data
+
+    def _single_flight(self, key, fn):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            data = fn()
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+render_service = RenderService()
 
 # --- Flask Server for Streaming ---
-server = Flask(__name__)
-CORS(server)
+
+# Flask is imported on the server thread by create_media_server(), so the
+# window doesn't wait for it. Until then routes are only recorded, and the
+# Flask names the handlers use are stand-ins that fail with a clear error;
+# create_media_server() binds the real ones once.
+class _FlaskPending:
+    """Stand-in for a Flask name until create_media_server() imports Flask."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def _fail(self, *args, **kwargs):
+        raise RuntimeError(f"flask.{self._name} used before create_media_server()")
+
+    __call__ = __setattr__ = _fail
+
+    def __getattr__(self, attr):
+        self._fail()
+
+server = None
+request, Response, send_file, g = (_FlaskPending(name) for name in ('request', 'Response', 'send_file', 'g'))
+MEDIA_ROUTES = []
+_server_lock = threading.Lock()
+
+def media_route(rule):
+    """Register a media server route (installed by create_media_server)."""
+    def decorate(view):
+        MEDIA_ROUTES.append((rule, view))
+        return view
+    return decorate
+
+def create_media_server():
+    """The Flask app serving media, built on first use."""
+    global server, request, Response, send_file, g
+    with _server_lock:
+        if server is None:
+            from flask import Flask, Response, g, request, send_file
+            from flask_cors import CORS
+            flask_app = Flask(__name__)
+            CORS(flask_app)
+            for rule, view in MEDIA_ROUTES:
+                flask_app.add_url_rule(rule, view_func=view)
+            if metrics.enabled:
+                flask_app.before_request(_start_request_timer)
+                flask_app.after_request(_record_request_latency)
+            server = flask_app
+    return server
+
+def _start_request_timer():
+    g.metrics_start = time.perf_counter()
+
+def _record_request_latency(response):
+    # Streamed bodies (/video, /view files) are timed to the response start
+    start = g.pop('metrics_start', None)
+    if start is not None and request.url_rule is not None:
+        metrics.observe('mediasort_http_request_seconds', time.perf_counter() - start,
+                        route=request.url_rule.rule, status=response.status_code)
+    return response
 PORT = 23456
 
-@server.route('/view')
-def serve_file():
-    path = request.args.get('path')
-    if not path or not os.path.exists(path):
-        return "File not found", 404
-        
-    ext = os.path.splitext(path)[1].lower()
-    # Web-safe formats that browser can render directly
-    web_safe = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp', '.mp4', '.mov', '.webm', '.ogg'}
-    
-    if ext in web_safe:
-        return send_file(path)
-    else:
-        # For RAW files or others (CR2, ARW, TIFF), convert to JPEG preview
+# Browser cache lifetime for media responses; URLs carrying a version token
+# (?v=<mtime>) never change content, so they can be cached for good.
+MEDIA_MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def busy_response():
+    response = Response("Busy", status=503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+def media_etag(path, variant='file'):
+    """Strong ETag from mtime + size (+ the rendition), or None if the file is gone."""
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    return f"{variant}-{signature[0]:x}-{signature[1]:x}"
+
+def media_max_age():
+    return IMMUTABLE_MAX_AGE if request.args.get('v') else MEDIA_MAX_AGE
+
+def not_modified(etag):
+    """304 response if the browser already holds this ETag, else None."""
+    if etag and request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = media_max_age()
+        return response
+    return None
+
+def send_media_file(path, etag):
+    """Stream a file with Range (206), ETag/304 and Cache-Control handling."""
+    # Werkzeug answers Range requests by seeking the file, so only the
+    # requested bytes are read; waitress then copies them out in blocks
+    # (it has no sendfile path)
+    return send_file(path, conditional=True, etag=etag, max_age=media_max_age())
+
+def send_rendered(data, etag, mimetype='image/jpeg'):
+    """Serve generated image bytes with the same validators as the source file."""
+    return send_file(io.BytesIO(data), mimetype=mimetype, conditional=True,
+                     etag=etag, max_age=media_max_age())
+
+@media_route('/view')
+def serve_file():
+    path = request.args.get('path')
+    if not path or not os.path.exists(path):
+        return "File not found", 404
+        
+    if not PreviewCache.needs_render(path):
+        return send_media_file(path, media_etag(path))
+    else:
+        # For RAW files or others (CR2, ARW, TIFF), serve a cached/prefetched JPEG preview
+        etag = media_etag(path, 'view')
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        try:
+            # Rendered on the preview pool, which bounds the decode work
+            data = render_service.get(path, 'preview')
+            if data is None:
+                return "File not found", 404
+            return send_rendered(data, etag)
+        except (RenderBusy, FutureTimeoutError):
+            return busy_response()
+        except Exception as e:
+            print(f"Error converting view for {path}: {e}")
+            return str(e), 500
+
+@media_route('/video')
+def serve_video():
+    path = request.args.get('path')
+    if not path: return "No path", 400
+    if not os.path.isfile(path): return "File not found", 404
+    return send_media_file(path, media_etag(path))
+
+def get_thumbnail_bytes(path):
+    """Return thumbnail bytes, served from the on-disk cache when possible."""
+    if not path:
+        return None
+    return render_service.get(path, 'thumb')
+
+def thumbnail_job(path):
+    """
+    Pool task: thumbnail JPEG plus perceptual hashes of the same pixels, and
+    the stage timings (workers can't record metrics themselves).
+    """
+    timings = {}
+    start = time.perf_counter()
+    try:
+        img = source_image(path, 'thumb')
+    except Exception as e:
+        print(f"Thumb Gen Error {path}: {e}")
+        return None, None, timings
+    timings['decode'] = time.perf_counter() - start
+    hashes = None
+    if os.path.splitext(path)[1].lower() not in VIDEO_EXTS:
+        start = time.perf_counter()
+        try:
+            hashes = image_hashes(img)
+        except Exception as e:
+            print(f"Hash Error {path}: {e}")
+        timings['hash'] = time.perf_counter() - start
+    start = time.perf_counter()
+    data = encode_image(img, 'thumb')
+    timings['encode'] = time.perf_counter() - start
+    return data, hashes, timings
+
+def hash_job(path):
+    """Pool task: perceptual hashes of the same pixels thumbnail_job hashes."""
+    try:
+        return image_hashes(source_image(path, 'thumb'))
+    except Exception as e:
+        print(f"Hash Error {path}: {e}")
+        return None
+
+@media_route('/thumbnail')
+def serve_thumbnail():
+    path = request.args.get('path')
+    if not path: return "Missing path", 400
+
+    etag = media_etag(path, 'thumb')
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    # Cache lookup (counted once), else generated on the prefetch pool's
+    # urgent queue while this thread only waits
+    try:
+        data = render_service.get(path, 'thumb')
+    except FutureTimeoutError:
+        return busy_response()
+    except Exception as e:
+        print(f"Thumb request failed {path}: {e}")
+        data = None
+    if data:
+        return send_rendered(data, etag)
+    return "Error", 500
+
+@media_route('/render')
+def serve_render():
+    """Any (size class, format) rendition, e.g. WebP previews."""
+    path = request.args.get('path')
+    size_class = request.args.get('size', 'preview')
+    fmt = request.args.get('fmt', 'jpeg')
+    if not path: return "Missing path", 400
+    if size_class not in SIZE_CLASSES or fmt not in RENDER_FORMATS:
+        return "Unknown rendition", 400
+    if not os.path.exists(path):
+        return "File not found", 404
+
+    etag = media_etag(path, f"{size_class}.{fmt}")
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    try:
+        data = render_service.get(path, size_class, fmt)
+        if data is None:
+            return "File not found", 404
+        return send_rendered(data, etag, render_service.mimetype(fmt))
+    except (RenderBusy, FutureTimeoutError):
+        return busy_response()
+    except Exception as e:
+        print(f"Error rendering {path}: {e}")
+        return str(e), 500
+
+@media_route('/scrub')
+def serve_scrub():
+    """Scrub strip: SCRUB_FRAMES cells of SCRUB_FRAME_SIZE side by side."""
+    path = request.args.get('path')
+    if not path: return "Missing path", 400
+    if os.path.splitext(path)[1].lower() not in VIDEO_EXTS:
+        return "Not a video", 400
+    if not os.path.exists(path):
+        return "File not found", 404
+
+    etag = media_etag(path, 'scrub')
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    try:
+        data = render_service.scrub_strip(path)
+    except FutureTimeoutError:
+        return busy_response()
+    except Exception as e:
+        print(f"Scrub request failed {path}: {e}")
+        data = None
+    if data:
+        return send_rendered(data, etag)
+    return "Error", 500
+
+@metrics.collector
+def collect_runtime_metrics():
+    """Cache counters and queue depths, read from the live objects."""
+    samples = []
+    for name, stats in (('thumbnail', thumb_cache.stats()), ('preview', preview_cache.stats())):
+        labels = {'cache': name}
+        samples += [
+            ('mediasort_cache_hits_total', 'counter', labels, stats['hits']),
+            ('mediasort_cache_misses_total', 'counter', labels, stats['misses']),
+            ('mediasort_cache_entries', 'gauge', labels, stats['entries']),
+            ('mediasort_cache_bytes', 'gauge', labels, stats['bytes']),
+        ]
+    progress = thumb_prefetcher.progress()
+    for queue, depth in (('thumbnail', progress['queued']), ('thumbnail_running', progress['in_flight']),
+                         ('scrub', progress['scrub_queued']), ('preview', preview_cache.stats()['pending'])):
+        samples.append(('mediasort_queue_depth', 'gauge', {'queue': queue}, depth))
+    for status, count in file_ops.summary().items():
+        samples.append(('mediasort_file_ops', 'gauge', {'status': status}, count))
+    samples.append(('mediasort_renders_in_flight', 'gauge', {}, render_service.rendering()))
+    for mark, seconds in startup.report()['marks'].items():
+        samples.append(('mediasort_startup_seconds', 'gauge', {'mark': mark}, seconds))
+    return samples
+
+@media_route('/metrics')
+def serve_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Longest /profile capture, so a stray request can't keep sampling forever
+MAX_PROFILE_SECONDS = 30
+
+@media_route('/profile')
+def serve_profile():
+    """
+    ?seconds=N starts sampling all threads for N seconds and returns 202 at
+    once; a plain GET /profile then returns the folded stacks (202 while
+    the capture is still running).
+    """
+    if 'seconds' in request.args:
+        try:
+            seconds = min(float(request.args['seconds']), MAX_PROFILE_SECONDS)
+        except ValueError:
+            return "Bad seconds", 400
+        if seconds <= 0:
+            return "Bad seconds", 400
+        if not profiler.start(seconds):
+            return "Profiler already running", 409
+        return Response(f"Profiling for {seconds:g}s; GET /profile for the stacks\n", status=202,
+                        mimetype='text/plain', headers={'Retry-After': str(int(seconds) + 1)})
+    if profiler.running():
+        return Response("Profiler still running\n", status=202, mimetype='text/plain', headers={'Retry-After': '1'})
+    return Response(profiler.stop(), mimetype='text/plain')
+
+# Upper bound on one /thumbnails batch (the filmstrip shows ~15 at a time)
+MAX_THUMBNAIL_BATCH = 200
+
+@media_route('/thumbnails')
+def serve_thumbnail_batch():
+    """
+    Thumbnails for ?folder=...&name=...&name=... in one response: a 4-byte
+    big-endian header length, a JSON header with per-item {name, offset,
+    length} (offsets relative to the end of the header), then the JPEGs back
+    to back. Only cached thumbnails are included; misses have length 0.
+    Files are named rather than addressed by listing index, so the reply
+    matches what the UI shows while a scan streams in or moves settle.
+    """
+    folder = request.args.get('folder')
+    names = request.args.getlist('name')[:MAX_THUMBNAIL_BATCH]
+    if not folder:
+        return "Missing folder", 400
+    if any(name in ('', os.curdir, os.pardir) or os.path.basename(name) != name for name in names):
+        return "Bad name", 400
+    paths = [os.path.join(folder, name) for name in names]
+
+    # Cached hits only: a miss goes out empty and the UI loads it through
+    # /thumbnail, so one slow render never holds back the whole window
+    blobs = [thumb_cache.get(p) for p in paths]
+
+    items = []
+    offset = 0
+    for name, data in zip(names, blobs):
+        length = len(data) if data else 0
+        items.append({"name": name, "offset": offset, "length": length})
+        offset += length
+    header = json.dumps({"folder": folder, "items": items}).encode('utf-8')
+
+    body = b''.join([struct.pack('>I', len(header)), header] + [d for d in blobs if d])
+    response = Response(body, mimetype='application/octet-stream')
+    response.cache_control.no_store = True  # Misses fill in later
+    return response
+
+# Media server tuning: a bounded worker pool, idle keep-alive connections
+# closed after a while, and CPU-heavy render routes limited separately so
+# file streaming always has threads left.
+SERVER_THREADS = 16
+SERVER_CONNECTION_LIMIT = 128
+SERVER_CHANNEL_TIMEOUT = 60
+PORT_FALLBACK_TRIES = 10
+server_ready = threading.Event()
+
+def _bind_media_server(port):
+    """Create (bind) the server on `port`; waitress if installed, else Werkzeug."""
+    try:
+        from waitress.server import create_server
+    except ImportError:
+        from werkzeug.serving import make_server
+        return make_server('127.0.0.1', port, create_media_server(), threaded=True)
+    return create_server(
+        create_media_server(),
+        host='127.0.0.1',
+        port=port,
+        threads=SERVER_THREADS,
+        connection_limit=SERVER_CONNECTION_LIMIT,
+        channel_timeout=SERVER_CHANNEL_TIMEOUT,
+        ident='MediaSort',
+    )
+
+def start_server():
+    global PORT
+    # Fall back to the next ports (then any free port) if 23456 is taken
+    candidates = [PORT + i for i in range(PORT_FALLBACK_TRIES)] + [0]
+    for port in candidates:
+        try:
+            srv = _bind_media_server(port)
+            break
+        except OSError as e:
+            print(f"Server: port {port} unavailable ({e})")
+    else:
+        print("Server: could not bind any port")
+        return
+    PORT = srv.effective_port if hasattr(srv, 'effective_port') else srv.server_port
+    server_ready.set()
+    startup.mark('server_ready')
+    print(f"Server: listening on http://127.0.0.1:{PORT}")
+    if hasattr(srv, 'serve_forever'):
+        srv.serve_forever()
+    else:
+        srv.run()
+
+# --- Background Thumbnail Pre-generation ---
+
+class FolderListing:
+    """The folder currently shown in the UI, mirrored in display order."""
+
+    def __init__(self):
+        self.folder = None
+        self.names = []
+        self.source = None
+        self._lock = threading.Lock()
+
+    def set(self, folder, names, source=None):
+        with self._lock:
+            self.folder = folder
+            self.names = list(names)
+            self.source = source
+
+    def extend(self, source, names):
+        """Append a streamed page, unless a newer listing replaced `source`'s."""
+        with self._lock:
+            if source is not None and source == self.source:
+                self.names.extend(names)
+                return True
+            return False
+
+    def remove(self, folder, name):
+        with self._lock:
+            if folder == self.folder and name in self.names:
+                self.names.remove(name)
+
+    def insert_front(self, folder, name):
+        # Mirrors the UI, which puts undone files back at the start
+        with self._lock:
+            if folder == self.folder and name not in self.names:
+                self.names.insert(0, name)
+
+    def paths(self, start=0, end=None):
+        with self._lock:
+            if not self.folder:
+                return []
+            return [os.path.join(self.folder, n) for n in self.names[start:end]]
+
+current_listing = FolderListing()
+
+class ThumbnailPrefetcher:
+    """
+    Pre-generates thumbnails on a bounded process pool (PIL decoding is
+    CPU-bound and holds the GIL). Paths are processed in display order, with
+    the currently visible range jumping the queue. On-demand requests from
+    /thumbnail go through the same pool, so a fast scroll can never start
+    more decodes than there are workers. Once every thumbnail is done, the
+    idle pool renders hover-scrub strips for the folder's videos.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._urgent = deque()
+        self._inflight = {}
+        self._scrub_queue = deque()
+        self._scrub_jobs = {}
+        self._cancelled = set()
+        self._finished = set()
+        self._listed = set()
+        self._total = 0
+        self._done = 0
+        # Bumped by start(); jobs carry the one they were queued under, so
+        # completions left over from the previous folder don't count
+        self._generation = 0
+        self._pool = None
+        self._thread = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            try:
+                import multiprocessing
+                # Spawn, never fork: this process runs many threads, and a forked
+                # worker could inherit a lock some other thread was holding
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            except Exception as e:
+                print(f"Prefetch: process pool unavailable, using threads: {e}")
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def start(self, paths):
+        """Replace the queue with a new folder listing (display order)."""
+        with self._cond:
+            self._queue = deque(paths)
+            self._scrub_queue = deque(p for p in paths if os.path.splitext(p)[1].lower() in VIDEO_EXTS)
+            self._urgent.clear()
+            self._cancelled.clear()
+            self._finished.clear()
+            self._listed = set(self._queue)
+            self._total = len(self._listed)
+            self._done = 0
+            self._generation += 1
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def prioritize(self, paths):
+        """Move the visible range to the front of the queue."""
+        with self._cond:
+            self._urgent = deque(p for p in paths if p not in self._finished)
+            self._cond.notify_all()
+
+    def cancel(self, path):
+        """Drop queued/running work for a file that was moved or deleted."""
+        with self._cond:
+            self._cancelled.add(path)
+            for entry in (self._inflight.get(path), self._scrub_jobs.get(path)):
+                if entry is not None:
+                    entry[0].cancel()
+            self._cond.notify_all()
+
+    def request(self, path):
+        """Future for a thumbnail needed right now (shares in-flight work)."""
+        with self._cond:
+            self._cancelled.discard(path)
+            entry = self._inflight.get(path)
+            if entry is None:
+                return self._submit(path)
+            return entry[1]
+
+    def request_hashes(self, path):
+        """Future for a file's perceptual hashes, computed on the worker pool."""
+        with self._cond:
+            return self._get_pool().submit(hash_job, path)
+
+    def request_scrub(self, path):
+        """Future for a video's scrub strip (shares in-flight work)."""
+        with self._cond:
+            self._cancelled.discard(path)
+            entry = self._scrub_jobs.get(path)
+            if entry is None:
+                return self._submit_scrub(path)
+            return entry[1]
+
+    def warm(self):
+        """Spawn the workers now (importing the decode stack) rather than on the first thumbnail."""
+        with self._cond:
+            pool = self._get_pool()
+        for future in [pool.submit(warm_worker) for _ in range(self.max_workers)]:
+            future.result()
+
+    def progress(self):
+        with self._cond:
+            return {
+                "total": self._total,
+                "done": self._done,
+                "queued": len(self._queue) + len(self._urgent),
+                "in_flight": len(self._inflight),
+                "scrub_queued": len(self._scrub_queue),
+            }
+
+    def _submit(self, path):
+        # Caller holds self._cond
+        signature = file_signature(path)
+        result = Future()
+        job = self._get_pool().submit(thumbnail_job, path)
+        self._inflight[path] = (job, result, self._generation)
+        job.add_done_callback(lambda f, p=path, sig=signature, r=result: self._on_done(p, sig, f, r))
+        return result
+
+    def _submit_scrub(self, path):
+        # Caller holds self._cond
+        signature = file_signature(path)
+        result = Future()
+        job = self._get_pool().submit(scrub_job, path)
+        self._scrub_jobs[path] = (job, result)
+        job.add_done_callback(lambda f, p=path, sig=signature, r=result: self._on_scrub_done(p, sig, f, r))
+        return result
+
+    def _on_scrub_done(self, path, signature, job, result):
+        data = None
+        if job.cancelled():
+            result.cancel()
+        else:
+            try:
+                data = job.result()
+            except Exception as e:
+                print(f"Scrub prefetch error {path}: {e}")
+            if not result.done():
+                result.set_result(data)
+        with self._cond:
+            self._scrub_jobs.pop(path, None)
+            cancelled = path in self._cancelled
+            self._cond.notify_all()
+        if data and signature and not cancelled:
+            thumb_cache.put(path, data, variant='scrub', signature=signature)
+
+    def _on_done(self, path, signature, job, result):
+        data = hashes = None
+        if job.cancelled():
+            result.cancel()
+        else:
+            try:
+                data, hashes, timings = job.result()
+                if metrics.enabled:
+                    for stage, seconds in timings.items():
+                        metrics.observe('mediasort_render_seconds', seconds, stage=stage, size_class='thumb')
+            except Exception as e:
+                print(f"Prefetch error {path}: {e}")
+            if not result.done():
+                result.set_result(data)
+        with self._cond:
+            entry = self._inflight.pop(path, None)
+            cancelled = path in self._cancelled
+            if entry is not None and entry[2] == self._generation:
+                self._finish(path)
+            self._cond.notify_all()
+        if data and signature and not cancelled:
+            thumb_cache.put(path, data, signature=signature)
+            if hashes:
+                similarity_index.put(path, signature, hashes)
+
+    def _finish(self, path):
+        # Caller holds self._cond; on-demand requests outside the listing don't count
+        if path in self._listed and path not in self._finished:
+            self._finished.add(path)
+            self._done += 1
+
+    def _next_path(self):
+        # Caller holds self._cond
+        for q in (self._urgent, self._queue):
+            while q:
+                path = q.popleft()
+                if path in self._cancelled or path in self._finished:
+                    continue
+                entry = self._inflight.get(path)
+                if entry is not None:
+                    # Already running, maybe for the previous folder: count it for this one
+                    self._inflight[path] = entry[:2] + (self._generation,)
+                    continue
+                return path
+        return None
+
+    def _next_scrub(self):
+        # Caller holds self._cond; strips wait until no thumbnail work is left
+        if self._urgent or self._queue or self._inflight:
+            return None
+        while self._scrub_queue:
+            path = self._scrub_queue.popleft()
+            if path not in self._cancelled and path not in self._scrub_jobs:
+                return path
+        return None
+
+    def _run_scrub(self, path):
+        if thumb_cache.contains(path, variant='scrub'):
+            return True
+        with self._cond:
+            if path in self._scrub_jobs or path in self._cancelled:
+                return True
+            try:
+                self._submit_scrub(path)
+            except RuntimeError as e:
+                print(f"Prefetch stopped: {e}")
+                return False
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (len(self._inflight) + len(self._scrub_jobs) >= self.max_workers * 2
+                       or not (self._urgent or self._queue or (self._scrub_queue and not self._inflight))):
+                    self._cond.wait()
+                path = self._next_path()
+                generation = self._generation
+                scrub = self._next_scrub() if path is None else None
+            if scrub is not None:
+                if not self._run_scrub(scrub):
+                    return
+                continue
+            if path is None:
+                continue
+            # Cache check happens outside the lock (SQLite lookup)
+            if thumb_cache.contains(path):
+                with self._cond:
+                    if generation == self._generation:
+                        self._finish(path)
+                continue
+            with self._cond:
+                if generation != self._generation:
+                    continue
+                if path not in self._inflight and path not in self._cancelled:
+                    try:
+                        self._submit(path)
+                    except RuntimeError as e:
+                        # Pool shut down (interpreter exiting)
+                        print(f"Prefetch stopped: {e}")
+                        return
+
+thumb_prefetcher = ThumbnailPrefetcher()
+
+# --- Incremental Folder Index ---
+
+_DIGITS_RE = re.compile(r'(\d+)')
+
+def natural_keys(text):
+    return [int(c) if c.isdigit() else c for c in _DIGITS_RE.split(text)]
+
+# Default extensions if none provided (images, RAW and video)
+DEFAULT_MEDIA_EXTS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".arw", ".cr2", ".cr3", ".nef", ".raf", ".dng", ".orf", ".rw2",
+    ".mp4", ".mov", ".avi", ".mkv", ".webm"
+}
+
+def valid_extensions(allowed_extensions=None):
+    if not allowed_extensions:
+        return DEFAULT_MEDIA_EXTS
+    # Ensure extensions start with dot and are lowercase
+    return {f".{ext.lower().lstrip('.')}" for ext in allowed_extensions}
+
+def entry_sort_key(sort_by):
+    """Key for (name, size, mtime) entries; None means directory order."""
+    if sort_by == "none":
+        return None
+    if sort_by == "date":
+        return lambda e: e[2]
+    if sort_by == "size":
+        return lambda e: e[1]
+    # Name (Natural Sort)
+    return lambda e: natural_keys(e[0])
+
+def sort_entries(entries, sort_by="name", order="asc"):
+    key = entry_sort_key(sort_by)
+    if key is not None:
+        entries.sort(key=key, reverse=(order == "desc"))
+    return entries
+
+
+class FolderIndex:
+    """
+    Listing of one folder (name -> (size, mtime)), kept in memory and
+    persisted under the cache dir. It is built with one scandir pass and then
+    updated from watchdog events (including in-place modifications) when
+    watchdog is installed, re-checked against the directory mtime in case
+    events lag; without watchdog every refresh re-stats the folder.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.entries = {}
+        self.dir_mtime_ns = None
+        self._lock = threading.RLock()
+        self._changed = set()
+        self._needs_scan = True
+        self._verified = False
+        self._observer = None
+        self._save_timer = None
+        key = hashlib.sha1(os.path.abspath(folder).encode('utf-8', 'surrogatepass')).hexdigest()
+        self._store_path = os.path.join(get_cache_dir(), 'folders', f"{key}.json")
+        self._load()
+        self._watch()
+
+    def _load(self):
+        try:
+            with open(self._store_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('folder') == self.folder:
+                self.entries = {name: tuple(v) for name, v in data['entries'].items()}
+                self.dir_mtime_ns = data.get('dir_mtime_ns')
+                self._needs_scan = False
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        with self._lock:
+            self._save_timer = None
+            data = {"folder": self.folder, "dir_mtime_ns": self.dir_mtime_ns, "entries": self.entries}
+            try:
+                os.makedirs(os.path.dirname(self._store_path), exist_ok=True)
+                tmp = self._store_path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self._store_path)
+            except OSError as e:
+                print(f"Index: could not save {self.folder}: {e}")
+
+    def _schedule_save(self):
+        # Debounced so keypress-rate moves don't rewrite the file every time
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(2.0, self._save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def _watch(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return
+
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for p in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+                    if p and os.path.dirname(os.fsdecode(p)) == os.path.normpath(index.folder):
+                        with index._lock:
+                            index._changed.add(os.path.basename(os.fsdecode(p)))
+
+        try:
+            observer = Observer()
+            observer.schedule(Handler(), self.folder, recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+        except Exception as e:
+            print(f"Index: watching {self.folder} failed, using mtime checks: {e}")
+
+    def close(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def _stat_into(self, name):
+        # Caller holds self._lock
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+            if os.path.isfile(os.path.join(self.folder, name)):
+                self.entries[name] = (st.st_size, st.st_mtime)
+                return
+        except OSError:
+            pass
+        self.entries.pop(name, None)
+
+    def refresh(self):
+        """Bring the index up to date; returns True if anything changed."""
+        with self._lock:
+            try:
+                dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+            except OSError:
+                self.entries = {}
+                return True
+
+            changed = False
+            # Watcher events can't cover changes made while the app was closed
+            trust_events = self._observer is not None and self._verified
+            self._verified = True
+            # Without events an in-place edit leaves the directory mtime alone, so
+            # every entry is re-stat'ed; with them, a directory mtime the events
+            # don't explain (late or dropped events) still triggers a diff
+            full_stat = self._needs_scan or not trust_events
+            if full_stat or dir_mtime_ns != self.dir_mtime_ns:
+                fresh = {}
+                with os.scandir(self.folder) as it:
+                    for entry in it:
+                        name = entry.name
+                        if not full_stat and name in self.entries and name not in self._changed:
+                            fresh[name] = self.entries[name]
+                        else:
+                            try:
+                                if entry.is_file():
+                                    st = entry.stat()
+                                    fresh[name] = (st.st_size, st.st_mtime)
+                            except OSError:
+                                pass
+                changed = fresh != self.entries or self._needs_scan
+                self.entries = fresh
+                self._needs_scan = False
+                self._changed.clear()
+            elif self._changed:
+                for name in self._changed:
+                    self._stat_into(name)
+                self._changed.clear()
+                changed = True
+
+            if changed or dir_mtime_ns != self.dir_mtime_ns:
+                self.dir_mtime_ns = dir_mtime_ns
+                self._schedule_save()
+            return changed
+
+    def add(self, name):
+        """Apply a file we moved into this folder ourselves."""
+        with self._lock:
+            self._stat_into(name)
+            self._sync_dir_mtime()
+
+    def remove(self, name):
+        """Apply a file we moved out of this folder ourselves."""
+        with self._lock:
+            self.entries.pop(name, None)
+            self._sync_dir_mtime()
+
+    def _sync_dir_mtime(self):
+        # Our own delta explains the directory mtime change, no rescan needed
+        try:
+            self.dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            pass
+        self._schedule_save()
+
+    def is_built(self):
+        with self._lock:
+            return not self._needs_scan
+
+    def replace(self, entries, dir_mtime_ns):
+        """Adopt a listing produced by a full scan done elsewhere."""
+        with self._lock:
+            self.entries = dict(entries)
+            self.dir_mtime_ns = dir_mtime_ns
+            self._needs_scan = False
+            self._verified = True
+            self._changed.clear()
+            self._schedule_save()
+
+    def items(self):
+        """Snapshot as a list of (name, size, mtime)."""
+        with self._lock:
+            return [(name, size, mtime) for name, (size, mtime) in self.entries.items()]
+
+class FolderIndexRegistry:
+    """Keeps the most recently used folder indexes alive (and watched)."""
+
+    def __init__(self, max_folders=8):
+        self.max_folders = max_folders
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, folder):
+        folder = os.path.normpath(folder)
+        with self._lock:
+            index = self._indexes.get(folder)
+            if index is None:
+                index = FolderIndex(folder)
+                self._indexes[folder] = index
+                while len(self._indexes) > self.max_folders:
+                    _, old = self._indexes.popitem(last=False)
+                    old.close()
+            self._indexes.move_to_end(folder)
+            return index
+
+    def peek(self, folder):
+        """Existing index for a folder, without creating one."""
+        with self._lock:
+            return self._indexes.get(os.path.normpath(folder))
+
+folder_indexes = FolderIndexRegistry()
+
+def note_move_queued(src_path, dest_path):
+    """Update the UI mirror and drop cached renders as soon as a move is accepted."""
+    thumb_prefetcher.cancel(src_path)
+    preview_cache.discard(src_path)
+    src_folder, name = os.path.split(src_path)
+    dest_folder, dest_name = os.path.split(dest_path)
+    current_listing.remove(src_folder, name)
+    current_listing.insert_front(dest_folder, dest_name)
+
+def note_file_moved(src_path, dest_path):
+    """Apply a completed move to the folder indexes."""
+    src_folder, name = os.path.split(src_path)
+    dest_folder, dest_name = os.path.split(dest_path)
+    index = folder_indexes.peek(src_folder)
+    if index is not None:
+        index.remove(name)
+    index = folder_indexes.peek(dest_folder)
+    if index is not None:
+        index.add(dest_name)
+
+# --- Metadata Index ---
+
+# EXIF tags shown in the inspector, by TIFF tag id
+EXIF_FIELDS = {
+    0x010F: 'Make',
+    0x0110: 'Model',
+    0x0132: 'DateTime',
+    0x829A: 'ExposureTime',
+    0x829D: 'FNumber',
+    0x8827: 'ISOSpeedRatings',
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+}
+
+def _format_exif_value(name, value):
+    if isinstance(value, str):
+        return value
+    if not value:
+        return ''
+    v = value[0]
+    if isinstance(v, tuple):
+        num, den = v
+        if not den:
+            return ''
+        if name == 'ExposureTime' and 0 < num < den:
+            return f"1/{round(den / num)}"
+        return f"{num / den:g}"
+    return str(v)
+
+def _exif_header_fields(path):
+    """
+    Read EXIF fields and pixel size straight from the file header (JPEG APP1
+    or TIFF/RAW IFDs) without decoding or fully reading the image.
+    Returns (exif_dict, (width, height) or None).
+    """
+    exif = {}
+    dims = None
+    if os.path.getsize(path) == 0:
+        return exif, dims  # mmap refuses empty files
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        base = None
+        if mm[:2] == b'\xff\xd8':
+            p = 2
+            limit = min(len(mm), 256 * 1024)
+            while p + 4 <= limit and mm[p] == 0xFF:
+                marker = mm[p + 1]
+                seg_len = struct.unpack_from('>H', mm, p + 2)[0]
+                if seg_len < 2:
+                    break
+                if marker == 0xE1 and mm[p + 4:p + 10] == b'Exif\0\0' and base is None:
+                    base = p + 10
+                if marker in (0xC0, 0xC1, 0xC2):
+                    if p + 9 <= len(mm):
+                        h, w = struct.unpack_from('>HH', mm, p + 5)
+                        dims = (w, h)
+                    break
+                if marker == 0xDA:
+                    break
+                p += 2 + seg_len
+        elif mm[:2] in (b'II', b'MM'):
+            base = 0
+        if base is None:
+            return exif, dims
+
+        e, ifds = _tiff_ifds(mm, base)
+        pixel_x = pixel_y = None
+        largest = None
+        for tags in ifds:
+            for tag, name in EXIF_FIELDS.items():
+                if name not in exif and tag in tags:
+                    value = _format_exif_value(name, _tiff_value(mm, e, tags[tag]))
+                    if value:
+                        exif[name] = value
+            if 0xA002 in tags and pixel_x is None:
+                pixel_x = _tiff_int(mm, e, tags[0xA002])
+                pixel_y = _tiff_int(mm, e, tags.get(0xA003))
+            if 0x100 in tags and 0x101 in tags:
+                w = _tiff_int(mm, e, tags[0x100], 0)
+                h = _tiff_int(mm, e, tags[0x101], 0)
+                if not largest or w * h > largest[0] * largest[1]:
+                    largest = (w, h)
+        if dims is None:
+            dims = (pixel_x, pixel_y) if pixel_x and pixel_y else largest
+    return exif, dims
+
+def _video_properties(path):
+    """Width, height, fps and duration of a video (PyAV or OpenCV, if available)."""
+    if optional_module('av') is None and optional_module('cv2') is None:
+        return None
+    try:
+        video = open_video(path)
+    except Exception:
+        return None
+    try:
+        return {"width": video.width, "height": video.height, "fps": video.fps, "duration": video.duration}
+    finally:
+        video.close()
+
+def _parse_exif_date(value):
+    try:
+        return datetime.datetime.strptime(value[:19], '%Y:%m:%d %H:%M:%S').timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def extract_metadata(path):
+    """Raw metadata record for one file (no formatting, no caching)."""
+    ext = os.path.splitext(path)[1].lower()
+    record = {"width": 0, "height": 0, "format": "Unknown", "exif": {}, "duration": None, "fps": None}
+
+    if ext in VIDEO_EXTS:
+        record["format"] = f"Video ({ext.strip('.')})"
+        props = _video_properties(path)
+        if props:
+            record.update(props)
+        return record
+
+    try:
+        exif, dims = _exif_header_fields(path)
+        record["exif"] = exif
+        if dims:
+            record["width"], record["height"] = dims
+        if ext in RAW_EXTS:
+            record["format"] = ext.strip('.').upper()
+        elif ext in JPEG_EXTS and dims:
+            record["format"] = "JPEG"
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Error reading metadata header from {path}: {e}")
+
+    if not record["width"] or record["format"] == "Unknown":
+        # Other formats: PIL only parses the header on open
+        try:
+            _import_pil()
+            with Image.open(path) as img:
+                record["width"], record["height"] = img.size
+                record["format"] = img.format or "Unknown"
+        except Exception as read_err:
+            print(f"Error reading metadata from image: {read_err}")
+    return record
+
+class MetadataIndex:
+    """
+    Persistent metadata records keyed on path + mtime + size (SQLite).
+    Sortable fields are kept in their own columns so folder-wide sorts and
+    filters don't need to parse the JSON blobs.
+    """
+
+    def __init__(self, db_path=None, workers=8):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'metadata.db')
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='metadata')
+        self._conn = LazyConnection(self.db_path, self._setup)
+
+    @staticmethod
+    def _setup(conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            ' path TEXT PRIMARY KEY, folder TEXT, mtime_ns INTEGER, size INTEGER, mtime REAL,'
+            ' capture_ts REAL, camera TEXT, iso INTEGER, pixels INTEGER, record TEXT)'
+        )
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(metadata)')}
+        if 'mtime' not in columns:
+            conn.execute('ALTER TABLE metadata ADD COLUMN mtime REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS metadata_folder ON metadata(folder)')
+
+    def _lookup(self, paths):
+        found = {}
+        with self._lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                for path, mtime_ns, size, record in self._conn.execute(
+                        f'SELECT path, mtime_ns, size, record FROM metadata WHERE path IN ({marks})', chunk):
+                    found[path] = (mtime_ns, size, record)
+        return found
+
+    def _store(self, rows):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO metadata'
+                ' (path, folder, mtime_ns, size, mtime, capture_ts, camera, iso, pixels, record)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.execute('COMMIT')
+
+    @staticmethod
+    def _row(path, signature, record, mtime=None):
+        exif = record["exif"]
+        camera = f"{exif.get('Make', '')} {exif.get('Model', '')}".strip()
+        try:
+            iso = int(str(exif.get('ISOSpeedRatings', '')).split()[0])
+        except (ValueError, IndexError):
+            iso = None
+        capture_ts = _parse_exif_date(exif.get('DateTimeOriginal') or exif.get('DateTimeDigitized')
+                                      or exif.get('DateTime'))
+        return (path, os.path.dirname(path), signature[0], signature[1], mtime, capture_ts, camera or None,
+                iso, (record["width"] or 0) * (record["height"] or 0), json.dumps(record))
+
+    def get_many(self, paths):
+        """Records for many paths; stale or missing ones are extracted in parallel."""
+        paths = [os.path.abspath(p) for p in paths]
+        stats = {}
+        for p in paths:
+            try:
+                stats[p] = os.stat(p)
+            except OSError:
+                pass
+        signatures = {p: (st.st_mtime_ns, st.st_size) for p, st in stats.items()}
+        cached = self._lookup(list(signatures))
+        results = {}
+        missing = []
+        for path in paths:
+            sig = signatures.get(path)
+            if sig is None:
+                continue
+            hit = cached.get(path)
+            if hit and (hit[0], hit[1]) == sig:
+                results[path] = json.loads(hit[2])
+            else:
+                missing.append(path)
+
+        if missing:
+            rows = []
+            for path, record in zip(missing, self._pool.map(extract_metadata, missing)):
+                results[path] = record
+                rows.append(self._row(path, signatures[path], record, stats[path].st_mtime))
+            self._store(rows)
+        return results
+
+    def sort_columns(self, folder, entries):
+        """
+        {name: (capture_ts, camera, iso, pixels)} for FolderIndex entries
+        (name, size, mtime). Only files that are new or changed since they were
+        last indexed get extracted, so repeat sorts are a single query.
+        """
+        folder = os.path.abspath(folder)
+        with self._lock:
+            known = {
+                os.path.basename(path): row
+                for path, *row in self._conn.execute(
+                    'SELECT path, size, mtime, capture_ts, camera, iso, pixels FROM metadata WHERE folder=?',
+                    (folder,))
+            }
+        columns = {}
+        missing = []
+        for name, size, mtime in entries:
+            row = known.get(name)
+            if row and row[0] == size and row[1] == mtime:
+                columns[name] = tuple(row[2:])
+            else:
+                missing.append(name)
+        if missing:
+            records = self.get_many([os.path.join(folder, name) for name in missing])
+            for name in missing:
+                record = records.get(os.path.join(folder, name))
+                if record is not None:
+                    row = self._row(name, (0, 0), record)
+                    columns[name] = (row[5], row[6], row[7], row[8])
+        return columns
+
+    def get(self, path):
+        return self.get_many([path]).get(os.path.abspath(path))
+
+metadata_index = MetadataIndex()
+
+def format_metadata(path, record, stats):
+    """Inspector-panel view of a metadata record."""
+    size_mb = stats.st_size / (1024 * 1024)
+    exif_data = record.get("exif", {})
+
+    # Format specific values
+    iso = exif_data.get('ISOSpeedRatings', '')
+
+    aperture = ""
+    if 'FNumber' in exif_data:
+        aperture = f"f/{exif_data['FNumber']}"
+
+    # Date Logic with fallbacks
+    date_str = exif_data.get('DateTimeOriginal') or exif_data.get('DateTime') or exif_data.get('DateTimeDigitized')
+    if not date_str or date_str == 'Unknown':
+        # Fallback to file modification time
+        date_str = datetime.datetime.fromtimestamp(stats.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+    result = {
+        "filename": os.path.basename(path),
+        "resolution": f"{record.get('width') or 0} x {record.get('height') or 0}",
+        "size": f"{size_mb:.2f} MB",
+        "format": record.get("format", "Unknown"),
+        "date": date_str,
+        "camera": f"{exif_data.get('Make', '')} {exif_data.get('Model', '')}".strip() or "Unknown",
+        "iso": iso,
+        "aperture": aperture,
+        "shutter": exif_data.get('ExposureTime', '')
+    }
+    if record.get("duration"):
+        result["duration"] = f"{record['duration']:.1f} s"
+        result["fps"] = f"{record['fps']:.2f}"
+    return result
+
+# --- Folder Listing ---
+
+# Sorts served from the metadata index rather than the folder index
+METADATA_SORTS = {"capture", "camera", "iso", "resolution"}
+
+def metadata_sort_key(sort_by, columns):
+    """Key for (name, size, mtime) entries using MetadataIndex.sort_columns output."""
+    empty = (None, None, None, None)
+
+    def capture(e):
+        ts = columns.get(e[0], empty)[0]
+        return ts if ts is not None else e[2]
+
+    if sort_by == "capture":
+        return lambda e: (capture(e), natural_keys(e[0]))
+    if sort_by == "camera":
+        return lambda e: (columns.get(e[0], empty)[1] or "", capture(e), natural_keys(e[0]))
+    if sort_by == "iso":
+        return lambda e: (columns.get(e[0], empty)[2] or 0, natural_keys(e[0]))
+    # resolution
+    return lambda e: (columns.get(e[0], empty)[3] or 0, natural_keys(e[0]))
+
+def list_folder(folder_path, valid_exts, sort_by="name", order="asc", camera=None):
+    """Sorted (and optionally camera-filtered) names from the folder index."""
+    index = folder_indexes.get(folder_path)
+    index.refresh()
+    entries = [e for e in index.items() if os.path.splitext(e[0])[1].lower() in valid_exts]
+
+    if sort_by in METADATA_SORTS or camera:
+        columns = metadata_index.sort_columns(folder_path, entries)
+        if camera:
+            entries = [e for e in entries if (columns.get(e[0]) or (None, None))[1] == camera]
+        if sort_by in METADATA_SORTS:
+            entries.sort(key=metadata_sort_key(sort_by, columns), reverse=(order == "desc"))
+            return [e[0] for e in entries]
+    return [e[0] for e in sort_entries(entries, sort_by, order)]
+
+# --- Near-Duplicate / Burst Detection ---
+
+_DCT_MATRIX = None
+
+def _dct_matrix(n=32):
+    """Orthonormal DCT-II basis (cached), so a 2D DCT is two matrix products."""
+    global _DCT_MATRIX
+    if _DCT_MATRIX is None:
+        import numpy as np
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        m[0] /= np.sqrt(2.0)
+        _DCT_MATRIX = m
+    return _DCT_MATRIX
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+def image_hashes(img):
+    """(dHash, pHash) of a PIL image as unsigned 64-bit ints."""
+    import numpy as np
+    _import_pil()
+    gray = img.convert('L')
+    # dHash: horizontal gradient sign on a 9x8 grid
+    small = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+    # pHash: low-frequency 8x8 block of a 32x32 DCT against its median
+    pixels = np.asarray(gray.resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    d = _dct_matrix(32)
+    low = (d @ pixels @ d.T)[:8, :8]
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+    return dhash, phash
+
+def _to_signed64(value):
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _to_unsigned64(value):
+    return value + (1 << 64) if value < 0 else value
+
+class SimilarityIndex:
+    """Persistent perceptual hashes keyed on path + mtime + size (SQLite)."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'similarity.db')
+        self._lock = threading.Lock()
+        self._conn = LazyConnection(self.db_path, self._setup)
+
+    @staticmethod
+    def _setup(conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            ' path TEXT PRIMARY KEY, folder TEXT, mtime_ns INTEGER, size INTEGER, dhash INTEGER, phash INTEGER)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS hashes_folder ON hashes(folder)')
+        if conn.execute('PRAGMA user_version').fetchone()[0] < 1:
+            # Older rows were hashed from re-decoded thumbnail JPEGs rather than source pixels
+            conn.execute('DELETE FROM hashes')
+            conn.execute('PRAGMA user_version=1')
+
+    def put(self, path, signature, hashes):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO hashes (path, folder, mtime_ns, size, dhash, phash) VALUES (?, ?, ?, ?, ?, ?)',
+                (path, os.path.dirname(path), signature[0], signature[1],
+                 _to_signed64(hashes[0]), _to_signed64(hashes[1])))
+
+    def folder_hashes(self, folder):
+        """{path: (mtime_ns, size, dhash, phash)} for everything indexed in a folder."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, mtime_ns, size, dhash, phash FROM hashes WHERE folder=?',
+                (os.path.abspath(folder),)).fetchall()
+        return {r[0]: (r[1], r[2], _to_unsigned64(r[3]), _to_unsigned64(r[4])) for r in rows}
+
+similarity_index = SimilarityIndex()
+
+_POPCOUNT_TABLE = None
+
+def _popcount64(values):
+    """Per-element bit count of a uint64 NumPy array."""
+    global _POPCOUNT_TABLE
+    import numpy as np
+    if _POPCOUNT_TABLE is None:
+        _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    values = np.ascontiguousarray(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+def _close_pairs(phash, dhash, members, threshold, block=1024):
+    """
+    Index pairs among `members` within threshold (pHash) confirmed by dHash.
+    Compares block x block tiles, so memory stays bounded however large the
+    bucket is.
+    """
+    import numpy as np
+    p = phash[members]
+    d = dhash[members]
+    for row_start in range(0, len(members), block):
+        rows = slice(row_start, row_start + block)
+        # Only tiles on or above the diagonal; pairs are unordered
+        for col_start in range(row_start, len(members), block):
+            cols = slice(col_start, col_start + block)
+            near = _popcount64(p[rows, None] ^ p[None, cols]) <= threshold
+            near &= _popcount64(d[rows, None] ^ d[None, cols]) <= threshold * 2
+            ii, jj = np.nonzero(near)
+            ii += row_start
+            jj += col_start
+            keep = ii < jj
+            yield from zip(members[ii[keep]], members[jj[keep]])
+
+def find_similar_groups(paths, threshold=6, progress=None):
+    """
+    Group near-duplicate images: pHash within `threshold` bits, confirmed by
+    dHash. Uses multi-index hashing: the 64-bit hash is split into
+    threshold + 1 chunks, and any pair that close must match exactly on at
+    least one chunk (pigeonhole). Only same-bucket pairs get compared, with a
+    vectorized popcount, and union-find joins them. Identical hashes (blank
+    or repeated frames) are joined up front and compared once. Groups keep
+    the order of `paths`.
+    """
+    import numpy as np
+    hashes = hash_files([p for p in paths if os.path.splitext(p)[1].lower() not in VIDEO_EXTS], progress)
+    items = [p for p in paths if p in hashes]
+    if len(items) < 2:
+        return []
+    pairs = np.array([hashes[p] for p in items], dtype=np.uint64)
+    # first: index of the first item with each distinct (dHash, pHash)
+    _, first, inverse = np.unique(pairs, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    dhash = pairs[first, 0]
+    phash = pairs[first, 1]
+
+    parent = [int(first[inverse[i]]) for i in range(len(items))]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    chunks = threshold + 1
+    bounds = [64 * k // chunks for k in range(chunks + 1)]
+    for k in range(chunks):
+        width = bounds[k + 1] - bounds[k]
+        keys = (phash >> np.uint64(bounds[k])) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind='stable')
+        _, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        for start, count in zip(starts[counts > 1], counts[counts > 1]):
+            for i, j in _close_pairs(phash, dhash, order[start:start + count], threshold):
+                a, b = find(int(first[i])), find(int(first[j]))
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for i in range(len(items)):
+        groups.setdefault(find(i), []).append(i)
+    # Members were appended in listing order; order groups by their first member
+    return [[items[i] for i in m] for m in sorted(groups.values(), key=lambda m: m[0]) if len(m) > 1]
+
+def hash_files(paths, progress=None):
+    """
+    {path: (dhash, phash)}, from the index or hashed on the worker pool.
+    progress(done, total) is called as files are hashed.
+    """
+    results = {}
+    missing = []
+    by_folder = {}
+    for path in paths:
+        by_folder.setdefault(os.path.dirname(os.path.abspath(path)), []).append(path)
+    for folder, folder_paths in by_folder.items():
+        known = similarity_index.folder_hashes(folder)
+        for path in folder_paths:
+            row = known.get(os.path.abspath(path))
+            if row and (row[0], row[1]) == file_signature(path):
+                results[path] = (row[2], row[3])
+            else:
+                missing.append(path)
+
+    # Always hashed from decoded source pixels (as thumbnail_job does), never
+    # from a cached thumbnail JPEG, so a file hashes the same either way.
+    # Submitted a few at a time so thumbnail work isn't stuck behind them.
+    batch = thumb_prefetcher.max_workers * 2
+    for start in range(0, len(missing), batch):
+        if progress:
+            progress(len(results), len(paths))
+        chunk = missing[start:start + batch]
+        futures = [(path, file_signature(path), thumb_prefetcher.request_hashes(path)) for path in chunk]
+        for path, signature, future in futures:
+            try:
+                hashes = future.result(timeout=60)
+                if not hashes or signature is None:
+                    continue
+                similarity_index.put(path, signature, hashes)
+                results[path] = hashes
+            except Exception as e:
+                print(f"Hash Error {path}: {e}")
+    if progress:
+        progress(len(results), len(paths))
+    return results
+
+class BackgroundSearch:
+    """
+    One long search at a time on a daemon thread. start() runs fn(update)
+    in the background: fn reports progress with update(**fields) and
+    returns the result fields. Poll status() for both.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {"state": "idle"}
+
+    def start(self, fn, **status):
+        """False if a search is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._status = dict(status, state="running")
+            self._thread = Thread(target=self._run, args=(fn,), daemon=True, name=self.name)
+            self._thread.start()
+        return True
+
+    def _update(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+
+    def _run(self, fn):
+        try:
+            self._update(state="done", **fn(self._update))
+        except Exception as e:
+            print(f"Error in {self.name}: {e}")
+            self._update(state="error", error=str(e))
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+def burst_groups(paths, threshold, update):
+    """BackgroundSearch task: find_similar_groups as listing indexes and names."""
+    index_of = {p: i for i, p in enumerate(paths)}
+    groups = find_similar_groups(paths, threshold, lambda done, total: update(done=done))
+    return {"groups": [{"indexes": [index_of[p] for p in group],
+                        "names": [os.path.basename(p) for p in group]} for group in groups]}
+
+burst_search = BackgroundSearch('burst-search')
+
+# --- Exact Duplicate Finder ---
+
+def _content_hasher():
+    """New hash object from the fastest available library: xxh3 > BLAKE3 > BLAKE2b."""
+    xxhash = optional_module('xxhash')
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    blake3 = optional_module('blake3')
+    if blake3 is not None:
+        return blake3.blake3()
+    return hashlib.blake2b(digest_size=16)
+
+class ContentHashIndex:
+    """
+    Finds byte-identical files. Candidates are bucketed by size, then by a
+    hash of the head and tail blocks, and only the survivors get a full-content
+    hash. Hashes are cached by path + mtime + size, so repeat runs only read
+    new or changed files.
+    """
+
+    BLOCK = 64 * 1024
+    CHUNK = 4 * 1024 * 1024
+
+    def __init__(self, db_path=None, workers=8):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'content_hashes.db')
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._conn = LazyConnection(self.db_path, self._setup)
+
+    @staticmethod
+    def _setup(conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS content ('
+            ' path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, partial TEXT, full TEXT)'
+        )
+
+    def _cached(self, paths):
+        found = {}
+        with self._lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                for row in self._conn.execute(
+                        f'SELECT path, mtime_ns, size, partial, full FROM content WHERE path IN ({marks})', chunk):
+                    found[row[0]] = row[1:]
+        return found
+
+    def _store(self, column, rows):
+        # rows: [(path, mtime_ns, size, digest)]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            if column == 'partial':
+                # A new partial hash means the file changed: drop any old full hash
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO content (path, mtime_ns, size, partial, full) VALUES (?, ?, ?, ?, NULL)',
+                    rows)
+            else:
+                self._conn.executemany(
+                    'UPDATE content SET full=? WHERE path=? AND mtime_ns=? AND size=?',
+                    [(digest, path, mtime_ns, size) for path, mtime_ns, size, digest in rows])
+            self._conn.execute('COMMIT')
+
+    def _partial_hash(self, path, size):
+        h = _content_hasher()
+        with open(path, 'rb') as f:
+            h.update(f.read(self.BLOCK))
+            if size > 2 * self.BLOCK:
+                f.seek(-self.BLOCK, os.SEEK_END)
+                h.update(f.read(self.BLOCK))
+            elif size > self.BLOCK:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def _full_hash(self, path, size):
+        if size <= 2 * self.BLOCK:
+            return self._partial_hash(path, size)  # Already covers every byte
+        h = _content_hasher()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _hash_stage(self, files, column, func, progress=None):
+        """
+        {path: digest} for files [(path, mtime_ns, size)], using and filling
+        the cache. progress(stage=column, done=n, total=n) follows along.
+        """
+        cached = self._cached([f[0] for f in files])
+        results = {}
+        todo = []
+        for path, mtime_ns, size in files:
+            row = cached.get(path)
+            digest = row and (row[2] if column == 'partial' else row[3])
+            if row and row[0] == mtime_ns and row[1] == size and digest:
+                results[path] = digest
+            else:
+                todo.append((path, mtime_ns, size))
+
+        def work(item):
+            try:
+                return item, func(item[0], item[2])
+            except OSError as e:
+                print(f"Duplicate scan: cannot read {item[0]}: {e}")
+                return item, None
+
+        rows = []
+        if progress:
+            progress(stage=column, done=len(results), total=len(files))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for done, ((path, mtime_ns, size), digest) in enumerate(pool.map(work, todo), len(results) + 1):
+                if digest:
+                    results[path] = digest
+                    rows.append((path, mtime_ns, size, digest))
+                if progress:
+                    progress(done=done)
+        if rows:
+            self._store(column, rows)
+        return results
+
+    @staticmethod
+    def collect(folders, valid_exts, recursive=True):
+        """[(path, mtime_ns, size)] for media files under the folders (skipping .trash)."""
+        files = []
+        seen = set()
+        pending = [f for f in folders if f and os.path.isdir(f)]
+        while pending:
+            folder = pending.pop()
+            real = os.path.realpath(folder)
+            if real in seen:
+                continue
+            seen.add(real)
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and not entry.name.startswith('.'):
+                                pending.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in valid_exts:
+                            st = entry.stat()
+                            files.append((entry.path, st.st_mtime_ns, st.st_size))
+            except OSError as e:
+                print(f"Duplicate scan: cannot list {folder}: {e}")
+        return files
+
+    def find_duplicates(self, folders, valid_exts=None, recursive=True, progress=None):
+        """
+        Groups of identical files as [{"size": n, "files": [path, ...]}],
+        largest first. progress(**fields) gets the stage (listing, partial,
+        full) and its done/total counts.
+        """
+        if progress:
+            progress(stage="listing")
+        files = self.collect(folders, valid_exts or DEFAULT_MEDIA_EXTS, recursive)
+        if progress:
+            progress(files=len(files))
+
+        # 1. Size buckets (free: st_size comes with the scandir pass)
+        by_size = {}
+        for item in files:
+            if item[2] > 0:
+                by_size.setdefault(item[2], []).append(item)
+        candidates = [item for group in by_size.values() if len(group) > 1 for item in group]
+
+        # 2. Head + tail blocks
+        partial = self._hash_stage(candidates, 'partial', self._partial_hash, progress)
+        by_partial = {}
+        for item in candidates:
+            if item[0] in partial:
+                by_partial.setdefault((item[2], partial[item[0]]), []).append(item)
+        survivors = [item for group in by_partial.values() if len(group) > 1 for item in group]
+
+        # 3. Full content, only for files that still collide
+        full = self._hash_stage(survivors, 'full', self._full_hash, progress)
+        by_full = {}
+        for item in survivors:
+            if item[0] in full:
+                by_full.setdefault((item[2], full[item[0]]), []).append(item[0])
+
+        groups = [{"size": size, "files": sorted(paths)}
+                  for (size, _), paths in by_full.items() if len(paths) > 1]
+        groups.sort(key=lambda g: g["size"] * (len(g["files"]) - 1), reverse=True)
+        return groups
+
+content_hashes = ContentHashIndex()
+
+def duplicate_groups(folders, update):
+    """BackgroundSearch task: identical files under the folders, with the space they waste."""
+    groups = content_hashes.find_duplicates(folders, progress=update)
+    return {"groups": groups, "wasted_bytes": sum(g["size"] * (len(g["files"]) - 1) for g in groups)}
+
+duplicate_search = BackgroundSearch('duplicate-search')
+
+# --- Paginated Scan Sessions ---
+
+# Date/size scans stat files in chunks on this many threads (stat releases the GIL)
+STAT_WORKERS = 8
+STAT_CHUNK = 256
+
+def _stat_entries(entries):
+    """os.stat results for DirEntries, None for files that vanished."""
+    stats = []
+    for entry in entries:
         try:
-            from PIL import Image, ImageOps
-            import io
-            
-            # Use cached converter logic if possible, or just do it here
-            with Image.open(path) as img:
-                img = ImageOps.exif_transpose(img)
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                else: 
-                     img = img.convert('RGB')
-                
-                # Resize for performance (max FHD)
-                img.thumbnail((1920, 1080))
-                
-                buffer = io.BytesIO()
-                img.save(buffer, format="JPEG", quality=85)
-                buffer.seek(0)
-                return send_file(buffer, mimetype='image/jpeg')
+            stats.append(entry.stat())
+        except OSError:
+            stats.append(None)
+    return stats
+
+class ScanCursor:
+    """
+    A chunked scan of one folder, produced on a background thread. Pages are
+    released as soon as their order is final: in directory order immediately,
+    otherwise the first page is resolved with a partial top-k selection before
+    the full sort finishes. A sorted first page needs every key, so date/size
+    scans stat in parallel to get there sooner. A warm FolderIndex answers
+    everything at once.
+    """
+
+    def __init__(self, folder, valid_exts, sort_by="name", order="asc", page_size=200, camera=None):
+        self.folder = folder
+        self.valid_exts = valid_exts
+        self.sort_by = sort_by
+        self.order = order
+        self.camera = camera
+        self.page_size = page_size
+        self.names = []
+        self.done = False
+        self.error = None
+        self.last_access = time.time()
+        self._position = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _publish(self, names, done=False):
+        with self._cond:
+            self.names = names
+            self.done = done
+            self._cond.notify_all()
+
+    def _run(self):
+        try:
+            index = folder_indexes.get(self.folder)
+            if index.is_built() or self.camera or self.sort_by in METADATA_SORTS:
+                # Metadata sorts/filters need the whole folder before the first page
+                self._publish(list_folder(self.folder, self.valid_exts, self.sort_by, self.order, self.camera),
+                              done=True)
+                return
+            self._scan_fresh(index)
         except Exception as e:
-            print(f"Error converting view for {path}: {e}")
-            return str(e), 500
+            print(f"Error scanning folder: {e}")
+            with self._cond:
+                self.error = str(e)
+                self.done = True
+                self._cond.notify_all()
 
-@server.route('/video')
-def serve_video():
-    path = request.args.get('path')
-    if not path: return "No path", 400
-    return send_file(path)
+    def close(self):
+        """Stop a scan nobody will page through any more."""
+        self._closed = True
 
-@lru_cache(maxsize=1000)
-def get_thumbnail_bytes(path):
-    """Generate and cache thumbnail bytes."""
-    if not path or not os.path.exists(path):
-        return None
-    
-    img = None
-    ext = os.path.splitext(path)[1].lower()
-    is_video = ext in {".mp4", ".mov", ".avi", ".mkv", ".webm"}
-    
-    try:
-        from PIL import Image, ImageOps
-        if is_video:
-            # Video Thumbnail Logic
+    def _scan_fresh(self, index):
+        key = entry_sort_key(self.sort_by)
+        dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        needs_stat = self.sort_by in ("date", "size")
+        files = []
+        streamed = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if self._closed:
+                    return
+                if not entry.is_file():
+                    continue
+                files.append(entry)
+                if key is None and os.path.splitext(entry.name)[1].lower() in self.valid_exts:
+                    streamed.append(entry.name)
+                    if len(streamed) % self.page_size == 0:
+                        self._publish(list(streamed))
+
+        if key is None:
+            self._publish(streamed, done=True)
+        stats = [None] * len(files)
+        if needs_stat:
+            if os.name == 'nt' or len(files) <= STAT_CHUNK:
+                # Windows: DirEntry.stat() is served from the directory listing
+                stats = _stat_entries(files)
+            else:
+                chunks = [files[i:i + STAT_CHUNK] for i in range(0, len(files), STAT_CHUNK)]
+                with ThreadPoolExecutor(max_workers=STAT_WORKERS) as pool:
+                    stats = [st for part in pool.map(_stat_entries, chunks) for st in part]
+        all_entries = {}
+        matched = []
+        for entry, st in zip(files, stats):
+            if needs_stat and st is None:
+                continue
+            item = (entry.name, st.st_size if st else 0, st.st_mtime if st else 0)
+            all_entries[entry.name] = item[1:]
+            if os.path.splitext(entry.name)[1].lower() in self.valid_exts:
+                matched.append(item)
+
+        if key is not None and not self._closed:
+            # First page via top-k (O(n log k)), then the full sort
+            pick = heapq.nlargest if self.order == "desc" else heapq.nsmallest
+            self._publish([e[0] for e in pick(self.page_size, matched, key=key)])
+            self._publish([e[0] for e in sort_entries(matched, self.sort_by, self.order)], done=True)
+
+        if needs_stat:
+            index.replace(all_entries, dir_mtime_ns)
+        else:
+            # Names-only pass: let the index stat everything on its own thread
+            Thread(target=index.refresh, daemon=True).start()
+
+    def _ready(self, count):
+        # Caller holds self._cond
+        if self.sort_by == "none":
+            return len(self.names) > self._position
+        return len(self.names) >= self._position + count
+
+    def next_page(self, count, timeout=5.0):
+        """Next `count` names once they are final; waits up to `timeout` seconds."""
+        self.last_access = time.time()
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self.done and not self._ready(count):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            page = self.names[self._position:self._position + count]
+            self._position += len(page)
+            return {
+                "entries": page,
+                "done": self.done and self._position >= len(self.names),
+                "total": len(self.names) if self.done else None,
+                "error": self.error,
+            }
+
+
+# --- Library Catalog ---
+
+# Capture column: NaN = not looked up yet, -1 = the file has no capture time
+NO_CAPTURE = -1.0
+LIBRARY_SORTS = {"path", "name", "date", "size", "capture", "none"}
+# Rows of capture times looked up between shard saves
+LIBRARY_SAVE_EVERY = 5000
+
+class LibraryShard:
+    """
+    One root folder's recursive listing as parallel NumPy columns. File names
+    live in one UTF-8 blob sliced by offsets and folders in a small table of
+    relative paths, so a million-file shard is a handful of arrays rather than
+    a million Python strings. Rows are stored in natural path order.
+    """
+
+    COLUMNS = ('dir_id', 'name_off', 'names', 'size', 'mtime', 'capture', 'ext_id')
+
+    def __init__(self, root, dirs, exts, columns, scanned_at):
+        self.root = root
+        self.dirs = dirs
+        self.exts = exts
+        self.scanned_at = scanned_at
+        self.dir_id = columns['dir_id']
+        self.name_off = columns['name_off']
+        self.names = columns['names']
+        self.size = columns['size']
+        self.mtime = columns['mtime']
+        self.capture = columns['capture']
+        self.ext_id = columns['ext_id']
+        self._dir_index = None
+        self._lower = None
+
+    def __len__(self):
+        return len(self.size)
+
+    @classmethod
+    def scan(cls, root, exts, previous=None, progress=None):
+        """
+        Walk root recursively. Capture times of files unchanged since the
+        previous shard are carried over; everything else is left pending.
+        """
+        import numpy as np
+        from array import array
+        ext_list = sorted(exts)
+        ext_ids = {ext: i for i, ext in enumerate(ext_list)}
+        dirs, spans = [], []
+        names = bytearray()
+        name_off, sizes, mtimes, captures, kinds = array('q', [0]), array('q'), array('d'), array('d'), array('b')
+        stack = ['']
+        while stack:
+            rel = stack.pop()
+            files = []
             try:
-                import cv2
-                cap = cv2.VideoCapture(path)
-                if cap.isOpened():
-                    try:
-                        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                    except: total = 0
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 30 if total > 60 else 0)
-                    ret, frame = cap.read()
-                    if ret:
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        img = Image.fromarray(frame_rgb)
-                    cap.release()
-            except: pass
-            
-            if img is None:
-                # Fallback video placeholder
-                img = Image.new('RGB', (150, 150), color='#334155') 
-                from PIL import ImageDraw
-                draw = ImageDraw.Draw(img)
-                for y in range(10, 150, 20):
-                    draw.rectangle([5, y, 15, y+10], fill='white')
-                    draw.rectangle([135, y, 145, y+10], fill='white')
-                draw.rectangle([40, 60, 110, 90], outline='white', width=2)
-                draw.line([50, 65, 75, 85], fill='white', width=3)
-                draw.line([75, 85, 100, 65], fill='white', width=3)
+                with os.scandir(os.path.join(root, rel)) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(os.path.join(rel, entry.name))
+                            elif os.path.splitext(entry.name)[1].lower() in ext_ids:
+                                st = entry.stat()
+                                files.append((entry.name, st.st_size, st.st_mtime))
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            if not files:
+                continue
+            files.sort(key=lambda f: natural_keys(f[0]))
+            known = previous.folder_files(rel) if previous is not None else {}
+            spans.append((len(sizes), len(sizes) + len(files)))
+            dirs.append(rel)
+            for name, size, mtime in files:
+                names += name.encode('utf-8', 'surrogateescape')
+                name_off.append(len(names))
+                sizes.append(size)
+                mtimes.append(mtime)
+                kinds.append(ext_ids[os.path.splitext(name)[1].lower()])
+                old = known.get(name)
+                captures.append(old[2] if old and old[0] == size and old[1] == mtime else float('nan'))
+            if progress:
+                progress(len(sizes))
+
+        # Folders were visited depth-first; store them (and their rows) in natural order
+        order = sorted(range(len(dirs)), key=lambda d: natural_keys(dirs[d]))
+        offsets = np.frombuffer(name_off, dtype=np.int64)
+        rows = (np.concatenate([np.arange(*spans[d]) for d in order]) if order
+                else np.zeros(0, dtype=np.int64))
+        lengths = np.diff(offsets)[rows]
+        columns = {
+            'dir_id': np.repeat(np.arange(len(order), dtype=np.int32),
+                                [spans[d][1] - spans[d][0] for d in order]).astype(np.int32),
+            'name_off': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            'names': b''.join(bytes(names[offsets[spans[d][0]]:offsets[spans[d][1]]]) for d in order),
+            'size': np.frombuffer(sizes, dtype=np.int64)[rows],
+            'mtime': np.frombuffer(mtimes, dtype=np.float64)[rows],
+            'capture': np.frombuffer(captures, dtype=np.float64)[rows],
+            'ext_id': np.frombuffer(kinds, dtype=np.int8)[rows],
+        }
+        return cls(root, [dirs[d] for d in order], ext_list, columns, time.time())
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            columns = {key: data[key] for key in cls.COLUMNS}
+        columns['names'] = columns['names'].tobytes()
+        return cls(meta['root'], meta['dirs'], meta['exts'], columns, meta['scanned_at'])
+
+    def save(self, path):
+        import numpy as np
+        meta = {'root': self.root, 'dirs': self.dirs, 'exts': self.exts, 'scanned_at': self.scanned_at}
+        columns = {key: getattr(self, key) for key in self.COLUMNS}
+        columns['names'] = np.frombuffer(self.names, dtype=np.uint8)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **columns)
+        os.replace(path + '.tmp', path)
+
+    def _dir_rows(self, dir_id):
+        import numpy as np
+        return (int(np.searchsorted(self.dir_id, dir_id, 'left')),
+                int(np.searchsorted(self.dir_id, dir_id, 'right')))
+
+    def name(self, row):
+        return self.names[self.name_off[row]:self.name_off[row + 1]].decode('utf-8', 'surrogateescape')
+
+    def path(self, row):
+        return os.path.join(self.root, self.dirs[self.dir_id[row]], self.name(row))
+
+    def folder_files(self, rel):
+        """{name: (size, mtime, capture)} for one folder of the shard."""
+        if self._dir_index is None:
+            self._dir_index = {d: i for i, d in enumerate(self.dirs)}
+        dir_id = self._dir_index.get(rel)
+        if dir_id is None:
+            return {}
+        start, end = self._dir_rows(dir_id)
+        return {self.name(row): (int(self.size[row]), float(self.mtime[row]), float(self.capture[row]))
+                for row in range(start, end)}
+
+    def _name_contains(self, text):
+        """Rows whose file name contains text (ASCII case-insensitive), found in the blob."""
+        import numpy as np
+        if self._lower is None:
+            self._lower = self.names.lower()
+        needle = text.encode('utf-8', 'surrogateescape').lower()
+        hits = np.zeros(len(self), dtype=bool)
+        offsets = self.name_off
+        pos = self._lower.find(needle)
+        while pos >= 0:
+            row = int(np.searchsorted(offsets, pos, 'right')) - 1
+            end = int(offsets[row + 1])
+            if pos + len(needle) <= end:
+                hits[row] = True
+                pos = self._lower.find(needle, end)
+            else:
+                pos = self._lower.find(needle, pos + 1)
+        return hits
+
+    def match(self, filters):
+        """
+        Boolean row mask for library_query filters (None when every row
+        matches): exts, folder, text, min_size/max_size, date_from/date_to
+        (mtime) and capture_from/capture_to (epoch seconds).
+        """
+        import numpy as np
+        conditions = []
+        if filters.get('exts'):
+            wanted = valid_extensions(filters['exts'])
+            conditions.append(np.isin(self.ext_id, [i for i, ext in enumerate(self.exts) if ext in wanted]))
+        folder = os.path.abspath(filters['folder']) if filters.get('folder') else None
+        if folder and not self.root.startswith(os.path.join(folder, '')):
+            rel = os.path.relpath(folder, self.root)
+            if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+                return np.zeros(len(self), dtype=bool)
+            if rel != os.curdir:
+                ids = [i for i, d in enumerate(self.dirs) if d == rel or d.startswith(rel + os.sep)]
+                conditions.append(np.isin(self.dir_id, ids))
+        if filters.get('text'):
+            conditions.append(self._name_contains(filters['text']))
+        for key, column, op in (('min_size', self.size, np.greater_equal), ('max_size', self.size, np.less_equal),
+                                ('date_from', self.mtime, np.greater_equal), ('date_to', self.mtime, np.less_equal),
+                                ('capture_from', self.capture, np.greater_equal),
+                                ('capture_to', self.capture, np.less_equal)):
+            if filters.get(key) is not None:
+                conditions.append(op(column, float(filters[key])))
+        if filters.get('capture_from') is not None or filters.get('capture_to') is not None:
+            conditions.append(self.capture >= 0)
+        if not conditions:
+            return None
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask &= condition
+        return mask
+
+    def entry(self, row):
+        capture = float(self.capture[row])
+        return {
+            "path": self.path(row),
+            "size": int(self.size[row]),
+            "mtime": float(self.mtime[row]),
+            "capture": capture if capture >= 0 else None,
+        }
+
+class LibraryCatalog:
+    """
+    Library mode: many root folders indexed recursively into one catalog of
+    LibraryShards, one per root, persisted under cache/library. Roots are
+    walked in parallel with one worker per device, so each disk is still read
+    sequentially, then capture times are filled in from the metadata index.
+    Queries filter and sort the columns with NumPy and decode only the page
+    of paths they return.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_dir(), 'library')
+        self._lock = threading.Lock()
+        self._roots = None
+        self._shards = {}
+        self._progress = {}
+        self._thread = None
+
+    def _shard_path(self, root):
+        return os.path.join(self.path, hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()[:16] + '.npz')
+
+    def roots(self):
+        with self._lock:
+            if self._roots is None:
+                try:
+                    with open(os.path.join(self.path, 'roots.json'), encoding='utf-8') as f:
+                        self._roots = json.load(f)
+                except (OSError, ValueError):
+                    self._roots = []
+            return list(self._roots)
+
+    def _save_roots(self, roots):
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, 'roots.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(roots, f)
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self._roots = roots
+
+    def add_root(self, folder):
+        """Add a root; roots nested inside it are folded into it."""
+        folder = os.path.abspath(folder)
+        if not os.path.isdir(folder):
+            raise ValueError(f"Not a folder: {folder}")
+        roots = self.roots()
+        for root in roots:
+            if folder == root or folder.startswith(os.path.join(root, '')):
+                raise ValueError(f"Already in the library under {root}")
+        for root in [r for r in roots if r.startswith(os.path.join(folder, ''))]:
+            self.remove_root(root)
+        self._save_roots(sorted(self.roots() + [folder], key=natural_keys))
+        return self.roots()
+
+    def remove_root(self, folder):
+        folder = os.path.abspath(folder)
+        self._save_roots([r for r in self.roots() if r != folder])
+        with self._lock:
+            self._shards.pop(folder, None)
+            self._progress.pop(folder, None)
+        try:
+            os.remove(self._shard_path(folder))
+        except OSError:
+            pass
+        return self.roots()
+
+    def shard(self, root):
+        """The root's shard, loaded from disk on first use (None before its first scan)."""
+        with self._lock:
+            if root in self._shards:
+                return self._shards[root]
+        try:
+            shard = LibraryShard.load(self._shard_path(root))
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Library shard for {root} unreadable: {e}")
+            shard = None
+        with self._lock:
+            return self._shards.setdefault(root, shard)
+
+    def scan(self, roots=None, captures=True):
+        """Rescan roots (default: all) in the background; False if a scan is already running."""
+        roots = [os.path.abspath(r) for r in roots] if roots else self.roots()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            for root in roots:
+                self._progress[root] = {"state": "queued", "files": 0, "captured": 0}
+            self._thread = Thread(target=self._run, args=(roots, captures), daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self, roots, captures):
+        groups = {}
+        for root in roots:
+            try:
+                groups.setdefault(os.stat(root).st_dev, []).append(root)
+            except OSError as e:
+                self._set_progress(root, state="error", error=str(e))
+        if groups:
+            with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                list(pool.map(lambda group: self._scan_group(group, captures), groups.values()))
+
+    def _set_progress(self, root, **changes):
+        with self._lock:
+            self._progress.setdefault(root, {}).update(changes)
+
+    def _scan_group(self, roots, captures):
+        """Scan the roots of one device one after another."""
+        for root in roots:
+            try:
+                self._set_progress(root, state="scanning")
+                shard = LibraryShard.scan(root, DEFAULT_MEDIA_EXTS, self.shard(root),
+                                          lambda n, root=root: self._set_progress(root, files=n))
+                os.makedirs(self.path, exist_ok=True)
+                shard.save(self._shard_path(root))
+                with self._lock:
+                    self._shards[root] = shard
+                self._set_progress(root, files=len(shard))
+                if captures:
+                    self._set_progress(root, state="metadata")
+                    self._fill_captures(shard)
+                self._set_progress(root, state="done")
+            except Exception as e:
+                print(f"Library scan of {root} failed: {e}")
+                self._set_progress(root, state="error", error=str(e))
+
+    def _fill_captures(self, shard):
+        """Look up pending capture times folder by folder through the metadata index."""
+        import numpy as np
+        pending = np.flatnonzero(np.isnan(shard.capture))
+        done = len(shard) - len(pending)
+        self._set_progress(shard.root, captured=int(done))
+        unsaved = 0
+        for dir_id in np.unique(shard.dir_id[pending]):
+            start, end = shard._dir_rows(int(dir_id))
+            rows = [row for row in range(start, end) if np.isnan(shard.capture[row])]
+            folder = os.path.join(shard.root, shard.dirs[dir_id])
+            columns = metadata_index.sort_columns(
+                folder, [(shard.name(row), int(shard.size[row]), float(shard.mtime[row])) for row in rows])
+            for row in rows:
+                capture = columns.get(shard.name(row), (None,))[0]
+                shard.capture[row] = capture if capture is not None else NO_CAPTURE
+            done += len(rows)
+            unsaved += len(rows)
+            self._set_progress(shard.root, captured=int(done))
+            if unsaved >= LIBRARY_SAVE_EVERY:
+                shard.save(self._shard_path(shard.root))
+                unsaved = 0
+        if unsaved:
+            shard.save(self._shard_path(shard.root))
+
+    def status(self):
+        roots = self.roots()
+        with self._lock:
+            scanning = self._thread is not None and self._thread.is_alive()
+            progress = {root: dict(self._progress.get(root, {})) for root in roots}
+        result = []
+        for root in roots:
+            shard = self.shard(root)
+            info = {"root": root, "files": len(shard) if shard is not None else 0,
+                    "scanned_at": shard.scanned_at if shard is not None else None}
+            info.update(progress[root])
+            result.append(info)
+        return {"scanning": scanning, "roots": result}
+
+    def query(self, filters=None, sort_by="date", order="desc", offset=0, limit=200):
+        """
+        One page of the catalog: {"total": n, "entries": [...]}. sort_by is
+        path (folder, then natural name; "name" is an alias), date, size,
+        capture (unknown last) or none; filters as in LibraryShard.match,
+        plus roots to restrict the query to some roots.
+        """
+        import numpy as np
+        filters = filters or {}
+        roots = self.roots()
+        if filters.get('roots'):
+            wanted = {os.path.abspath(r) for r in filters['roots']}
+            roots = [r for r in roots if r in wanted]
+        shards = [s for s in (self.shard(r) for r in roots) if s is not None]
+
+        parts = []
+        for shard in shards:
+            mask = shard.match(filters)
+            parts.append(np.arange(len(shard)) if mask is None else np.flatnonzero(mask))
+        total = sum(len(rows) for rows in parts)
+        if not total:
+            return {"total": 0, "entries": []}
+        owners = np.repeat(np.arange(len(shards)), [len(rows) for rows in parts])
+        rows = np.concatenate(parts)
+        offset, limit = max(0, int(offset)), max(0, int(limit))
+        descending = order == "desc"
+
+        if sort_by not in ("date", "size", "capture"):
+            # Shards hold their rows in path order and roots are kept sorted
+            selected = np.arange(total)[::-1] if descending else np.arange(total)
         else:
-            # Image Thumbnail Logic
-            with Image.open(path) as i:
-                i = ImageOps.exif_transpose(i)
-                if i.mode in ('RGBA', 'P'): 
-                    i = i.convert('RGB')
-                i.thumbnail((150, 150))
-                img = i.copy()
-                
-        if img:
-            # Ensure max size (already done for image, do for video)
-            img.thumbnail((150, 150))
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=70)
-            return buffer.getvalue()
-            
-    except Exception as e:
-        print(f"Thumb Gen Error {path}: {e}")
-        
-    return None
+            column = {"date": "mtime", "size": "size", "capture": "capture"}[sort_by]
+            keys = np.concatenate([getattr(s, column)[p] for s, p in zip(shards, parts)]).astype(np.float64)
+            if sort_by == "capture":
+                keys[~(keys >= 0)] = np.nan
+            if descending:
+                keys = -keys
+            keys[np.isnan(keys)] = np.inf
+            wanted = offset + limit
+            if 0 < wanted < total // 4:
+                # Partial selection: every row up to the k-th key (ties included,
+                # so pages agree with a full stable sort), then order just those
+                kth = np.partition(keys, wanted - 1)[wanted - 1]
+                selected = np.flatnonzero(keys <= kth)
+                selected = selected[np.argsort(keys[selected], kind='stable')]
+            else:
+                selected = np.argsort(keys, kind='stable')
+        page = selected[offset:offset + limit]
+        return {"total": int(total), "entries": [shards[owners[i]].entry(int(rows[i])) for i in page]}
 
-@server.route('/thumbnail')
-def serve_thumbnail():
-    path = request.args.get('path')
-    if not path: return "Missing path", 400
-    
-    data = get_thumbnail_bytes(path)
-    if data:
-        return send_file(io.BytesIO(data), mimetype='image/jpeg')
-    return "Error", 500
+library = LibraryCatalog()
 
-def start_server():
-    server.run(host='127.0.0.1', port=PORT, threaded=True)
+# --- Background File Operations ---
+
+class FileOpQueue:
+    """
+    Journaled background queue for move/delete/restore. Calls return as soon
+    as the op is recorded; worker threads then perform it. Same-device moves
+    are a single atomic os.rename, cross-device moves copy to a temporary file
+    (one copy at a time) and rename it into place. Ops touching the same path
+    run in submission order, and unfinished ops in the journal are replayed
+    on the next start. The last KEEP_DONE completed ops stay in the journal
+    so they can still be undone after a restart.
+    """
+
+    PART_SUFFIX = '.mediasort-part'
+    KEEP_DONE = 200
+
+    def __init__(self, journal_path=None, workers=3, copy_slots=1, chunk_size=4 * 1024 * 1024):
+        self.journal_path = journal_path or os.path.join(get_cache_dir(), 'fileops.journal')
+        self.chunk_size = chunk_size
+        self._ops = OrderedDict()
+        self._done = OrderedDict()  # id -> journal record of recently completed ops
+        self._cond = threading.Condition()
+        self._copy_slots = threading.BoundedSemaphore(copy_slots)
+        self._counter = 0
+        self._journal = None
+        self._recovered = False
+        self._workers = []
+        self._worker_count = workers
+
+    # Journal
+
+    def _log(self, event, op):
+        # Caller holds self._cond
+        record = {"event": event, "id": op["id"], "kind": op["kind"], "src": op["src"], "dest": op["dest"],
+                  "overwrite": op.get("overwrite", False)}
+        if event == "done":
+            self._keep_done(record)
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(json.dumps(record) + '\n')
+            self._journal.flush()
+        except OSError as e:
+            print(f"FileOps: journal write failed: {e}")
+
+    def _keep_done(self, record):
+        # Caller holds self._cond
+        self._done[record["id"]] = record
+        self._done.move_to_end(record["id"])
+        while len(self._done) > self.KEEP_DONE:
+            self._done.popitem(last=False)
+
+    def _compact(self):
+        # Caller holds self._cond; once nothing is pending or awaiting a conflict
+        # decision the journal is cut down to the recently completed ops (but
+        # not before recover() has read what the last run left in it)
+        if not self._recovered:
+            return
+        if any(op["status"] in ("queued", "running", "conflict") for op in self._ops.values()):
+            return
+        try:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            tmp_path = self.journal_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(record) + '\n' for record in self._done.values())
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            print(f"FileOps: journal compaction failed: {e}")
 
-# Start server in background thread
-t = Thread(target=start_server, daemon=True)
-t.start()
+    def recover(self):
+        """
+        Replay ops that were queued or running when the app last exited.
+        Runs in the background at launch, so ops already submitted this run
+        are left alone.
+        """
+        with self._cond:
+            try:
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            except (OSError, ValueError):
+                records = []
+            # Completed ops from earlier runs go before this run's
+            done = self._done
+            self._done = OrderedDict()
+            for record in records:
+                if record["event"] == "done":
+                    self._keep_done(record)
+            for record in done.values():
+                self._keep_done(record)
+            self._recovered = True
+        open_ops = OrderedDict()
+        for record in records:
+            if record["id"] in self._ops:
+                continue
+            if record["event"] == "queued":
+                open_ops[record["id"]] = record
+            else:
+                open_ops.pop(record["id"], None)
+
+        replayed = []
+        for record in open_ops.values():
+            try:
+                part = record["dest"] + self.PART_SUFFIX
+                if os.path.exists(part):
+                    os.remove(part)  # Interrupted cross-device copy
+                # Ops left in conflict come back as conflicts for the user to decide
+                if os.path.exists(record["src"]):
+                    replayed.append(self.submit(record["kind"], record["src"], record["dest"],
+                                                record.get("overwrite", False)))
+            except (OSError, KeyError) as e:
+                print(f"FileOps: could not replay {record.get('id')}: {e}")
+        with self._cond:
+            self._compact()
+        return replayed
+
+    # Queue
+
+    def _start_workers(self):
+        # Caller holds self._cond
+        while len(self._workers) < self._worker_count:
+            worker = Thread(target=self._run, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _pending_dest(self, path):
+        # Caller holds self._cond
+        return any(op["dest"] == path and op["status"] in ("queued", "running") for op in self._ops.values())
+
+    def submit(self, kind, src, dest, overwrite=False):
+        """Queue an op; returns its id, or raises FileNotFoundError."""
+        with self._cond:
+            if not os.path.exists(src) and not self._pending_dest(src):
+                raise FileNotFoundError(src)
+            self._counter += 1
+            op = {
+                "id": f"{int(time.time() * 1000)}-{self._counter}",
+                "kind": kind, "src": src, "dest": dest,
+                "status": "queued", "error": None, "overwrite": overwrite,
+                "bytes_total": 0, "bytes_done": 0,
+                # Earlier unfinished ops on the same paths must complete first
+                "after": [o["id"] for o in self._ops.values()
+                          if o["status"] in ("queued", "running") and {o["src"], o["dest"]} & {src, dest}],
+            }
+            self._ops[op["id"]] = op
+            self._log("queued", op)
+            self._start_workers()
+            self._cond.notify_all()
+        note_move_queued(src, dest)
+        return op["id"]
+
+    def _ready(self, op):
+        return all(self._ops[i]["status"] not in ("queued", "running") for i in op["after"] if i in self._ops)
+
+    def _next_op(self):
+        # Caller holds self._cond
+        for op in self._ops.values():
+            if op["status"] == "queued" and self._ready(op):
+                return op
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                op = self._next_op()
+                while op is None:
+                    self._cond.wait()
+                    op = self._next_op()
+                op["status"] = "running"
+            try:
+                status = self._perform(op)
+                error = op["error"] if status == "conflict" else None
+            except Exception as e:
+                status, error = "failed", str(e)
+                print(f"FileOps: {op['kind']} {op['src']} failed: {e}")
+            with self._cond:
+                op["status"] = status
+                op["error"] = error
+                if status in ("done", "failed"):
+                    self._log(status, op)
+                self._compact()
+                self._prune()
+                self._cond.notify_all()
+            if status == "done":
+                note_file_moved(op["src"], op["dest"])
+
+    def _perform(self, op):
+        src, dest = op["src"], op["dest"]
+        if not os.path.exists(src):
+            raise FileNotFoundError(f"File not found: {src}")
+        if os.path.exists(dest) and not op["overwrite"]:
+            op["error"] = f"Destination exists: {dest}"
+            return "conflict"
+        dest_folder = os.path.dirname(dest)
+        os.makedirs(dest_folder, exist_ok=True)
+
+        if os.stat(src).st_dev == os.stat(dest_folder).st_dev:
+            # os.replace swaps an overwritten destination atomically
+            (os.replace if op["overwrite"] else os.rename)(src, dest)
+            return "done"
+
+        # Cross-device: throttled chunked copy to a temp name, then swap in
+        with self._copy_slots:
+            part = dest + self.PART_SUFFIX
+            op["bytes_total"] = os.path.getsize(src)
+            with open(src, 'rb') as fsrc, open(part, 'wb') as fdst:
+                while True:
+                    chunk = fsrc.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    fdst.write(chunk)
+                    op["bytes_done"] += len(chunk)
+            shutil.copystat(src, part)
+            os.replace(part, dest)
+            os.remove(src)
+        return "done"
+
+    def _prune(self, keep=1000):
+        # Caller holds self._cond; forget the oldest finished ops
+        for op_id in list(self._ops):
+            if len(self._ops) <= keep:
+                break
+            if self._ops[op_id]["status"] in ("done", "failed"):
+                del self._ops[op_id]
+
+    # Control
+
+    def resolve_conflict(self, op_id, action):
+        """action: 'rename' (keep both), 'overwrite' or 'skip'."""
+        with self._cond:
+            op = self._ops.get(op_id)
+            if op is None or op["status"] != "conflict":
+                return False
+            if action == "skip":
+                op["status"] = "failed"
+                op["error"] = "Skipped"
+                self._log("failed", op)
+            else:
+                if action == "overwrite":
+                    # Journaled before anything is touched; the destination is
+                    # replaced atomically by _perform, never deleted up front
+                    op["overwrite"] = True
+                else:
+                    base, ext = os.path.splitext(op["dest"])
+                    n = 1
+                    while os.path.exists(f"{base} ({n}){ext}"):
+                        n += 1
+                    op["dest"] = f"{base} ({n}){ext}"
+                self._log("queued", op)
+                op["status"] = "queued"
+                op["error"] = None
+            self._compact()
+            self._cond.notify_all()
+            return True
+
+    def undo(self, op_id):
+        """Queue the inverse of a finished op; returns the new op id."""
+        with self._cond:
+            op = self._ops.get(op_id)
+            if op is None:
+                # Completed in an earlier run (or pruned): look it up in the journal
+                op = self._done.get(op_id)
+                if op is None:
+                    return None
+            elif op["status"] != "done":
+                return None
+        return self.submit(op["kind"], op["dest"], op["src"])
+
+    def status(self, op_ids=None):
+        with self._cond:
+            ops = [self._ops[i] for i in op_ids if i in self._ops] if op_ids else list(self._ops.values())
+            return [{k: v for k, v in op.items() if k != "after"} for op in ops]
+
+    def summary(self):
+        with self._cond:
+            counts = {}
+            for op in self._ops.values():
+                counts[op["status"]] = counts.get(op["status"], 0) + 1
+            return counts
+
+file_ops = FileOpQueue()
+
+# --- Warm Start ---
+
+# Thumbnails of the last folder paged in from the cache at launch
+WARM_THUMBNAILS = 60
+
+# state.json as last read or written; scans compare against this copy
+_app_state = None
+_app_state_lock = threading.Lock()
+
+def load_app_state():
+    """Persisted UI state (last folder and its sort), {} before the first scan."""
+    global _app_state
+    with _app_state_lock:
+        if _app_state is None:
+            try:
+                with open(os.path.join(get_cache_dir(), 'state.json'), encoding='utf-8') as f:
+                    _app_state = json.load(f)
+            except (OSError, ValueError):
+                _app_state = {}
+        return dict(_app_state)
+
+def save_app_state(**changes):
+    """Merge changes into state.json; no disk access when nothing changed."""
+    global _app_state
+    state = load_app_state()
+    if all(state.get(k) == v for k, v in changes.items()):
+        return
+    state.update(changes)
+    path = os.path.join(get_cache_dir(), 'state.json')
+    with _app_state_lock:
+        _app_state = state
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"State save failed: {e}")
+
+def warm_worker():
+    """Pool task run once per worker at launch: import the decode stack."""
+    _import_pil()
+    optional_module('numpy')
+    return os.getpid()
+
+def warm_start():
+    """
+    Background warm-up after launch: finish interrupted file operations,
+    spawn the thumbnail workers, open the thumbnail cache and reload the
+    last folder's index, paging its first thumbnails in so reopening it is
+    served from memory.
+    """
+    # Finish file operations interrupted by a crash or forced quit
+    try:
+        file_ops.recover()
+    except Exception as e:
+        print(f"File op recovery failed: {e}")
+    server_ready.wait(timeout=10)
+    try:
+        thumb_prefetcher.warm()
+        state = load_app_state()
+        folder = state.get('last_folder')
+        if folder and os.path.isdir(folder):
+            sort_by = state.get('sort_by', 'name')
+            if sort_by in METADATA_SORTS:
+                sort_by = 'name'
+            names = list_folder(folder, valid_extensions(None), sort_by, state.get('order', 'asc'))
+            thumb_cache.warm([os.path.join(folder, name) for name in names[:WARM_THUMBNAILS]])
+        else:
+            thumb_cache.warm([])
+    except Exception as e:
+        print(f"Warm start failed: {e}")
+    startup.mark('warm_done')
 
 # Define the API class that will be exposed to JavaScript
+@instrument_methods
 class Api:
     def __init__(self):
         self._window = None
+        self._scans = {}
+        self._scan_counter = 0
+        self._scans_lock = threading.Lock()
 
     def set_window(self, window):
         self._window = window
 
+    def get_server_url(self):
+        """Base URL of the media server (the port may have fallen back from 23456)."""
+        server_ready.wait(timeout=10)
+        return f"http://127.0.0.1:{PORT}"
+
     def select_folder(self):
         """Open a folder selection dialog and return the path."""
         print("API: select_folder called (using Native PyWebView)")
         try:
             if self._window:
+                import webview
                 # Returns a tuple of file paths
-                result = self._window.create_file_dialog(webview.FOLDER_DIALOG)
+                result = self._window.create_file_dialog(
+                    webview.FOLDER_DIALOG, directory=load_app_state().get('last_folder') or '')
                 if result and len(result) > 0:
                     folder_path = result[0]
                     print(f"API: Selected path: {folder_path}")
@@ -162,165 +3906,234 @@ class Api:
             print(f"API: Error opening dialog: {e}")
             return None
 
-    def scan_images(self, folder_path, allowed_extensions=None, sort_by="name", order="asc"):
+    def get_thumbnail_cache_stats(self):
+        """Hit/miss counters and size of the persistent thumbnail cache."""
+        return thumb_cache.stats()
+
+    def mark_startup(self, name):
+        """UI milestones for the startup report ('ui_ready', 'first_image')."""
+        if name in ('ui_ready', 'first_image'):
+            startup.mark(name)
+        return True
+
+    def get_startup_report(self):
+        """Launch timeline: marks, phases and time-to-first-image (seconds)."""
+        return startup.report()
+
+    def set_profiling(self, enabled):
+        """Start/stop the sampling profiler; stopping returns the folded stacks."""
+        if enabled:
+            return {"running": True, "started": profiler.start()}
+        return {"running": False, "stacks": profiler.stop()}
+
+    def scan_images(self, folder_path, allowed_extensions=None, sort_by="name", order="asc", camera=None):
         """
         Return a list of image and video filenames in the folder.
-        sort_by: name, date, size
+        sort_by: name, date, size, none (directory order),
+                 capture, camera, iso, resolution (from the metadata index)
         order: asc, desc
+        camera: only keep files shot with this "Make Model"
         """
         if not folder_path or not os.path.exists(folder_path):
             return []
-        
-        # Default extensions if none provided
-        if not allowed_extensions:
-            # Added video extensions
-            valid_exts = {
-                ".png", ".jpg", ".jpeg", ".gif", ".webp", 
-                ".arw", ".cr2", ".cr3", ".nef", ".raf", ".dng", ".orf", ".rw2",
-                ".mp4", ".mov", ".avi", ".mkv", ".webm"
-            }
-        else:
-            # Ensure extensions start with dot and are lowercase
-            valid_exts = {f".{ext.lower().lstrip('.')}" for ext in allowed_extensions}
-            
-        try:
-            # Collect file entries first to allow sorting
-            entries_list = []
-            with os.scandir(folder_path) as entries:
-                for entry in entries:
-                    if entry.is_file():
-                        ext = os.path.splitext(entry.name)[1].lower()
-                        if ext in valid_exts:
-                            entries_list.append(entry)
-            
-            # Sort Logic
-            reverse = (order == "desc")
-            if sort_by == "date":
-                # Mtime
-                entries_list.sort(key=lambda e: e.stat().st_mtime, reverse=reverse)
-            elif sort_by == "size":
-                # Size
-                entries_list.sort(key=lambda e: e.stat().st_size, reverse=reverse)
-            else:
-                # Name (Natural Sort)
-                import re
-                def natural_keys(text):
-                    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', text)]
-                entries_list.sort(key=lambda e: natural_keys(e.name), reverse=reverse)
-            
-            # Return filenames only
-            return [e.name for e in entries_list]
+
+        valid_exts = valid_extensions(allowed_extensions)
+        try:
+            # Incremental index: only changes since the last scan hit the disk
+            startup.mark('folder_opened')
+            save_app_state(last_folder=folder_path, sort_by=sort_by, order=order)
+            names = list_folder(folder_path, valid_exts, sort_by, order, camera)
+            current_listing.set(folder_path, names)
+            thumb_prefetcher.start(current_listing.paths())
+            return names
 
         except Exception as e:
             print(f"Error scanning folder: {e}")
             return []
 
-    def load_image(self, path, is_thumbnail=False):
+    def get_cameras(self, folder_path, allowed_extensions=None):
+        """Cameras ("Make Model") found in a folder with their file counts, for the camera filter."""
+        try:
+            index = folder_indexes.get(folder_path)
+            index.refresh()
+            valid_exts = valid_extensions(allowed_extensions)
+            entries = [e for e in index.items() if os.path.splitext(e[0])[1].lower() in valid_exts]
+            counts = {}
+            for columns in metadata_index.sort_columns(folder_path, entries).values():
+                if columns[1]:
+                    counts[columns[1]] = counts.get(columns[1], 0) + 1
+            return [{"camera": name, "count": counts[name]} for name in sorted(counts)]
+        except Exception as e:
+            print(f"Error listing cameras: {e}")
+            return []
+
+    def scan_images_start(self, folder_path, allowed_extensions=None, sort_by="name", order="asc", page_size=200,
+                          camera=None):
+        """
+        Chunked variant of scan_images for very large folders. Returns the
+        first page as soon as it is known plus a cursor for scan_images_next.
+        """
+        if not folder_path or not os.path.exists(folder_path):
+            return {"cursor": None, "entries": [], "done": True, "total": 0, "error": None}
+
+        startup.mark('folder_opened')
+        save_app_state(last_folder=folder_path, sort_by=sort_by, order=order)
+        cursor = ScanCursor(folder_path, valid_extensions(allowed_extensions), sort_by, order, int(page_size), camera)
+        with self._scans_lock:
+            # Forget cursors the UI abandoned
+            now = time.time()
+            for cursor_id, old in list(self._scans.items()):
+                if now - old.last_access > 600:
+                    self._scans.pop(cursor_id).close()
+            self._scan_counter += 1
+            cursor_id = str(self._scan_counter)
+            self._scans[cursor_id] = cursor
+        # The listing follows the pages the UI has received, so selection,
+        # thumbnails and move bookkeeping see them while the rest streams in
+        current_listing.set(folder_path, [], source=cursor_id)
+        result = self.scan_images_next(cursor_id, int(page_size))
+        if not result["done"]:
+            thumb_prefetcher.start(current_listing.paths())
+        result["cursor"] = cursor_id
+        return result
+
+    def scan_images_next(self, cursor, count=1000):
+        """Next batch of names from a scan_images_start cursor."""
+        with self._scans_lock:
+            scan = self._scans.get(cursor)
+        if scan is None:
+            return {"entries": [], "done": True, "total": None, "error": "Unknown cursor"}
+        result = scan.next_page(int(count))
+        current = current_listing.extend(cursor, result["entries"])
+        if result["done"]:
+            with self._scans_lock:
+                self._scans.pop(cursor, None)
+            if current:
+                thumb_prefetcher.start(current_listing.paths())
+        return result
+
+    def scan_images_close(self, cursor):
+        """Drop a cursor early (e.g. the user switched folders)."""
+        with self._scans_lock:
+            scan = self._scans.pop(cursor, None)
+        if scan is not None:
+            scan.close()
+        return True
+
+    def library_roots(self):
+        """Root folders of the library with file counts and scan progress."""
+        return library.status()
+
+    def library_add_root(self, folder_path, scan=True):
+        """Add a root folder (indexed recursively) and start scanning it."""
+        try:
+            library.add_root(folder_path)
+            if scan:
+                library.scan([folder_path])
+            return library.status()
+        except Exception as e:
+            print(f"Error adding library root: {e}")
+            return {"error": str(e)}
+
+    def library_remove_root(self, folder_path):
+        try:
+            library.remove_root(folder_path)
+            return library.status()
+        except Exception as e:
+            print(f"Error removing library root: {e}")
+            return {"error": str(e)}
+
+    def library_scan(self, roots=None, captures=True):
+        """Rescan library roots (default: all) in the background; poll library_roots for progress."""
+        return {"started": library.scan(roots, captures)}
+
+    def library_query(self, filters=None, sort_by="date", order="desc", offset=0, limit=200):
+        """
+        A page of the whole library: {"total": n, "entries": [{path, size,
+        mtime, capture}]}.
+        filters: exts, folder, text, roots, min_size/max_size,
+                 date_from/date_to, capture_from/capture_to (epoch seconds)
+        sort_by: path (alias name), date, size, capture, none
+        """
+        if sort_by not in LIBRARY_SORTS:
+            sort_by = "path"
+        try:
+            return library.query(filters, sort_by, order, offset, limit)
+        except Exception as e:
+            print(f"Error querying library: {e}")
+            return {"total": 0, "entries": [], "error": str(e)}
+
+    def find_bursts(self, threshold=6):
+        """
+        Look for near-duplicate / burst groups in the current scan_images
+        result in the background; poll get_bursts for progress and groups.
+        """
+        paths = current_listing.paths()
+        threshold = int(threshold)
+        return {"started": burst_search.start(lambda update: burst_groups(paths, threshold, update),
+                                              folder=current_listing.folder, done=0, total=len(paths))}
+
+    def get_bursts(self):
+        """
+        Burst search status: {"state": idle|running|done|error, "folder",
+        "done", "total"}, plus "groups" as [{"indexes": [...], "names": [...]}]
+        in listing order once done.
+        """
+        return burst_search.status()
+
+    def find_duplicates(self, src_folder, dest_folders=None):
+        """
+        Look for byte-identical media files across the source and destination
+        folders (recursively), e.g. the same card copied twice, in the
+        background; poll get_duplicates for progress and groups.
+        """
+        folders = [src_folder] + list(dest_folders or [])
+        return {"started": duplicate_search.start(lambda update: duplicate_groups(folders, update),
+                                                  folders=folders)}
+
+    def get_duplicates(self):
+        """
+        Duplicate search status: {"state": idle|running|done|error, "folders",
+        "stage": listing|partial|full, "files", "done", "total"}, plus
+        "groups" ([{"size", "files"}], largest waste first) and "wasted_bytes"
+        once done.
         """
-        Read an image file, resize if needed, and return as base64 string.
+        return duplicate_search.status()
+
+    def set_visible_range(self, start, end):
+        """Move thumbnails for listing[start:end] to the front of the prefetch queue."""
+        thumb_prefetcher.prioritize(current_listing.paths(max(0, int(start)), int(end)))
+        return True
+
+    def set_view_position(self, index, direction=1):
+        """Current /view index and travel direction; prefetches the neighbours."""
+        preview_cache.set_position(current_listing.paths(), int(index), int(direction))
+        return True
+
+    def get_thumbnail_progress(self):
+        """Progress of background thumbnail generation for the current folder."""
+        return thumb_prefetcher.progress()
+
+    def load_image(self, path, is_thumbnail=False, original=False):
+        """
+        Return a media server URL for an image instead of inlining its bytes:
+        the bounded preview rendition, or with original=True (zoom) the file.
         For videos:
-         - if is_thumbnail: return a generated placeholder image.
-         - else: return the absolute file path prefixed with 'video|' for the frontend to handle.
+         - if is_thumbnail: the thumbnail URL (a frame, or a placeholder).
+         - else: the streaming URL prefixed with 'video|' for the frontend to handle.
         """
         if not path or not os.path.exists(path):
             return None
-        
-        ext = os.path.splitext(path)[1].lower()
-        is_video = ext in {".mp4", ".mov", ".avi", ".mkv", ".webm"}
 
-        if is_video and not is_thumbnail:
-            # Return Streaming URL via Flask
-            import urllib.parse
-            quoted_path = urllib.parse.quote(path) # Quote safely
+        ext = os.path.splitext(path)[1].lower()
+        if ext in VIDEO_EXTS and not is_thumbnail:
             # Note: 127.0.0.1 is safer than localhost for some windows setups
-            return f"video|http://127.0.0.1:{PORT}/video?path={quoted_path}"
+            import urllib.parse
+            return f"video|http://127.0.0.1:{PORT}/video?path={urllib.parse.quote(path)}"
 
-        try:
-            if is_video and is_thumbnail:
-                img = None
-                try:
-                    # Try to generate real thumbnail using OpenCV
-                    import cv2
-                    # print(f"DEBUG: Generating thumb for {path}")
-                    cap = cv2.VideoCapture(path)
-                    if cap.isOpened():
-                        # Try to read a frame from the middle or at least 1 second in (approx 30 frames)
-                        # to avoid black fading in
-                        try:
-                            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                        except:
-                            total_frames = 0
-                            
-                        if total_frames > 60:
-                            cap.set(cv2.CAP_PROP_POS_FRAMES, 30)
-                        else:
-                            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                            
-                        ret, frame = cap.read()
-                        if ret:
-                            # Convert BGR (OpenCV) to RGB (PIL)
-                            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                            img = Image.fromarray(frame_rgb)
-                        else:
-                            print(f"Warning: Could not read frame from {path}")
-                        
-                        cap.release()
-                    else:
-                        print(f"Warning: Could not open video file for thumbnail: {path}")
-                except ImportError as e:
-                    print(f"OpenCV Import Error: {e}")
-                except Exception as e:
-                    print(f"Error generating video thumbnail: {e}")
-
-                if img is None:
-                    # Fallback: Generate a placeholder for video thumbnail using PIL
-                    # Lighter background to be visible
-                    img = Image.new('RGB', (150, 150), color='#334155') 
-                    from PIL import ImageDraw
-                    draw = ImageDraw.Draw(img)
-                    
-                    # Draw film strip holes on left and right
-                    for y in range(10, 150, 20):
-                        draw.rectangle([5, y, 15, y+10], fill='white')
-                        draw.rectangle([135, y, 145, y+10], fill='white')
-                    
-                    # Draw a text-like rect in center
-                    draw.rectangle([40, 60, 110, 90], outline='white', width=2)
-                    # Maybe just a "V" shape
-                    draw.line([50, 65, 75, 85], fill='white', width=3)
-                    draw.line([75, 85, 100, 65], fill='white', width=3)
-                
-                # Ensure resize happens for both cases
-                img.thumbnail((150, 150))
-
-                
-            else:
-                # Use PIL to load and resize image
-                from PIL import Image, ImageOps
-                with Image.open(path) as img:
-                    # Handle orientation metadata
-                    img = ImageOps.exif_transpose(img)
-                    
-                    # Convert to RGB to avoid alpha channel issues with JPEG
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Resize logic
-                    if is_thumbnail:
-                        img.thumbnail((150, 150)) # Efficient resize
-                    else:
-                        img.thumbnail((1920, 1080))
-            
-            # Save to buffer (common for both image and video thumbnail)
-            buffer = io.BytesIO()
-            # If it was a PIL image (either loaded or generated)
-            img.save(buffer, format="JPEG", quality=80 if is_thumbnail else 90)
-            b64_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            return f"data:image/jpeg;base64,{b64_data}"
-                
-        except Exception as e:
-            print(f"API: Error loading asset {path}: {e}")
-            return None
+        if original and not is_thumbnail:
+            return render_service.original_url(path)
+        return render_service.url(path, 'thumb' if is_thumbnail else 'preview')
 
     def get_image_metadata(self, path):
         """Get resolution, size, and EXIF data."""
@@ -328,89 +4141,37 @@ class Api:
             # path is now the full path passed from frontend
             if not os.path.exists(path):
                 return {}
-            
-            filename = os.path.basename(path)
-            # File size
-            stats = os.stat(path)
-            size_mb = stats.st_size / (1024 * 1024)
-            
-            width = 0
-            height = 0
-            img_format = "Unknown"
-            exif_data = {}
-
-            # Check if video
-            ext = os.path.splitext(filename)[1].lower()
-            is_video = ext in {".mp4", ".mov", ".avi", ".mkv", ".webm"}
-            
-            if is_video:
-                img_format = f"Video ({ext.strip('.')})"
-                # For now getting video resolution is complex without ffmpeg/opencv dependency
-                # which we want to avoid if possible for simplicity or handle gracefully
-                # We can just leave width/height 0 or generic
-            else:
-                try:
-                    from PIL import Image, ExifTags
-                    with Image.open(path) as img:
-                        width, height = img.size
-                        img_format = img.format or "Unknown"
-                        
-                        if hasattr(img, '_getexif') and img._getexif():
-                            exif = img._getexif()
-                            for tag, value in exif.items():
-                                decoded = ExifTags.TAGS.get(tag, tag)
-                                if decoded in ['DateTimeOrigin', 'DateTimeOriginal', 'DateTime', 'DateTimeDigitized', 'Make', 'Model', 'ISOSpeedRatings', 'ExposureTime', 'FNumber']:
-                                    exif_data[decoded] = str(value)
-                except Exception as read_err:
-                    print(f"Error reading metadata from image: {read_err}")
-                
-            # Proceed with basic file stats
-
-            # Format specific values
-            iso = exif_data.get('ISOSpeedRatings', '')
-            
-            aperture = ""
-            if 'FNumber' in exif_data:
-                try:
-                    aperture = f"f/{exif_data['FNumber']}"
-                except: pass
+            record = metadata_index.get(path)
+            return format_metadata(path, record, os.stat(path))
+        except Exception as e:
+            return {"error": str(e)}
 
-            # Date Logic with fallbacks
-            date_str = exif_data.get('DateTimeOriginal') or exif_data.get('DateTime') or exif_data.get('DateTimeDigitized')
-            if not date_str or date_str == 'Unknown':
-                # Fallback to file modification time
+    def get_images_metadata(self, paths):
+        """Batch variant of get_image_metadata: {path: metadata} for many files."""
+        try:
+            records = metadata_index.get_many(paths or [])
+            results = {}
+            for path in paths or []:
+                record = records.get(os.path.abspath(path))
+                if record is None:
+                    continue
                 try:
-                    mtime = os.path.getmtime(path)
-                    date_str = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    date_str = "Unknown"
-
-            return {
-                "filename": filename,
-                "resolution": f"{width} x {height}",
-                "size": f"{size_mb:.2f} MB",
-                "format": img_format,
-                "date": date_str,
-                "camera": f"{exif_data.get('Make', '')} {exif_data.get('Model', '')}".strip() or "Unknown",
-                "iso": iso,
-                "aperture": aperture,
-                "shutter": exif_data.get('ExposureTime', '')
-            }
+                    results[path] = format_metadata(path, record, os.stat(path))
+                except OSError:
+                    pass
+            return results
         except Exception as e:
             return {"error": str(e)}
 
     def move_image(self, filename, src_folder, dest_folder):
-        """Move an image from src to dest."""
+        """Move an image from src to dest (queued; returns immediately)."""
         try:
             src_path = os.path.join(src_folder, filename)
             dest_path = os.path.join(dest_folder, filename)
-            
-            # Ensure dest folder exists
-            if not os.path.exists(dest_folder):
-                os.makedirs(dest_folder)
-                
-            shutil.move(src_path, dest_path)
-            return {"success": True}
+            op_id = file_ops.submit("move", src_path, dest_path)
+            return {"success": True, "op_id": op_id}
+        except FileNotFoundError:
+            return {"success": False, "error": "File not found"}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
@@ -418,17 +4179,12 @@ class Api:
         """Soft delete: Move image to a .trash folder inside src_folder."""
         try:
             trash_path = os.path.join(src_folder, '.trash')
-            if not os.path.exists(trash_path):
-                os.makedirs(trash_path)
-            
             src_path = os.path.join(src_folder, filename)
             dest_path = os.path.join(trash_path, filename)
-            
-            if os.path.exists(src_path):
-                shutil.move(src_path, dest_path)
-                return {"success": True}
-            else:
-                return {"success": False, "error": "File not found"}
+            op_id = file_ops.submit("delete", src_path, dest_path)
+            return {"success": True, "op_id": op_id}
+        except FileNotFoundError:
+            return {"success": False, "error": "File not found"}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
@@ -436,18 +4192,45 @@ class Api:
         """Restore image from .trash folder."""
         try:
             trash_path = os.path.join(src_folder, '.trash')
-            src_path = os.path.join(trash_path, filename) # It is now in trash
+            src_path = os.path.join(trash_path, filename) # It is now in trash (or about to be)
             dest_path = os.path.join(src_folder, filename) # Moving back to original source
-            
-            if os.path.exists(src_path):
-                shutil.move(src_path, dest_path)
-                return {"success": True}
-            else:
-                return {"success": False, "error": "File in trash not found"}
+            op_id = file_ops.submit("restore", src_path, dest_path)
+            return {"success": True, "op_id": op_id}
+        except FileNotFoundError:
+            return {"success": False, "error": "File in trash not found"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_file_ops(self, op_ids=None):
+        """Status/progress of queued file operations (all, or the given ids)."""
+        return {"ops": file_ops.status(op_ids), "summary": file_ops.summary()}
+
+    def resolve_file_op_conflict(self, op_id, action):
+        """Retry a conflicting op: action is 'rename', 'overwrite' or 'skip'."""
+        try:
+            return {"success": file_ops.resolve_conflict(op_id, action)}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def undo_file_op(self, op_id):
+        """Queue the inverse of a completed op."""
+        op_id = file_ops.undo(op_id)
+        if op_id is None:
+            return {"success": False, "error": "Operation not undoable"}
+        return {"success": True, "op_id": op_id}
+
 def start_app():
+    startup.mark('app_started')
+    # The media server (and its Flask import) comes up on a background thread
+    # while the window opens; not at import time, since the thumbnail process
+    # pool re-imports this module in its workers
+    Thread(target=start_server, daemon=True, name='media-server').start()
+    Thread(target=warm_start, daemon=True, name='warm-start').start()
+
+    # Profile from launch; stop with Api.set_profiling(False)
+    if os.environ.get('MEDIASORT_PROFILE'):
+        profiler.start()
+
     api = Api()
     
     # Determine if we are running in dev mode (npm run dev running separate) or prod
@@ -478,6 +4261,9 @@ def start_app():
     if len(sys.argv) > 1:
         url = sys.argv[1]
 
+    import webview
+    startup.mark('webview_imported')
+
     # Enable File Access (Attempt to fix video playback)
     # Note: These flags depend on the underlying browser engine (CEF/WebView2/etc)
     try:
@@ -494,8 +4280,13 @@ def start_app():
         height=800,
         background_color='#0f172a' # Match the theme
     )
+    window.events.shown += lambda: startup.mark('window_shown')
     api.set_window(window)
     webview.start(debug=False)
 
+startup.mark('module_loaded')
+
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()  # Needed for the process pool in PyInstaller builds
     start_app()
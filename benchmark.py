@@ -0,0 +1,392 @@
+"""
+Reproducible performance benchmarks for MediaSort.
+
+Generates a synthetic library (small EXIF-tagged JPEG/PNG files in bulk,
+multi-megapixel JPEG/PNG/TIFF samples, short videos), times the hot paths
+and writes machine-readable JSON:
+
+    python benchmark.py --files 1000 --output bench.json
+    python benchmark.py --files 1000 --baseline bench.json
+
+With --baseline, metrics slower than the baseline by more than --tolerance
+are listed and the exit code is 1. App caches go to a scratch folder, so the
+user's thumbnail/metadata caches are never touched.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SORT_MODES = ["none", "name", "date", "size", "capture", "camera", "iso", "resolution"]
+CAMERAS = [("Canon", "EOS R5"), ("Canon", "EOS 5D Mark IV"), ("NIKON CORPORATION", "NIKON Z 6"),
+           ("SONY", "ILCE-7M3"), ("FUJIFILM", "X-T4"), ("Apple", "iPhone 15 Pro")]
+TEMPLATES = 64
+
+# --- Synthetic Library ---
+
+def _frame_size(megapixels):
+    width = int((megapixels * 1000000 * 3 / 2) ** 0.5)
+    return width, width * 2 // 3
+
+def _sample_image(size, seed):
+    """Smooth gradient with mild noise: realistic entropy without huge files."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x[::-1] + y) / 2], axis=-1)
+    noise = rng.normal(0, 6, (h, w, 1)).astype(np.float32)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+def _bulk_templates(rng):
+    """Small encoded files with varied EXIF (camera, ISO, capture date, size)."""
+    from PIL import Image
+    templates = []
+    for i in range(TEMPLATES):
+        w, h = rng.choice([(64, 48), (48, 64), (96, 64), (160, 90)])
+        img = Image.new('RGB', (w, h), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        buffer = io.BytesIO()
+        if i % 4 == 3:
+            img.save(buffer, format="PNG")
+            templates.append(('.png', buffer.getvalue()))
+            continue
+        make, model = rng.choice(CAMERAS)
+        exif = Image.Exif()
+        exif[0x010F] = make
+        exif[0x0110] = model
+        sub = exif.get_ifd(0x8769)
+        sub[0x9003] = datetime(2018 + rng.randrange(7), 1 + rng.randrange(12), 1 + rng.randrange(28),
+                               rng.randrange(24), rng.randrange(60)).strftime("%Y:%m:%d %H:%M:%S")
+        sub[0x8827] = rng.choice([100, 200, 400, 800, 1600, 3200, 6400])
+        img.save(buffer, format="JPEG", quality=80, exif=exif)
+        templates.append(('.jpg', buffer.getvalue()))
+    return templates
+
+def _write_bulk(folder, count, rng, templates):
+    os.makedirs(folder, exist_ok=True)
+    now = time.time()
+    for i in range(count):
+        ext, data = templates[rng.randrange(len(templates))]
+        path = os.path.join(folder, f"IMG_{rng.randrange(10 ** 7):07d}_{i}{ext}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        mtime = now - rng.randrange(5 * 365 * 86400)
+        os.utime(path, (mtime, mtime))
+
+def _write_videos(folder, count, seed):
+    """Short 720p clips via PyAV, else OpenCV; returns how many were written."""
+    import numpy as np
+    frames, size = 90, (1280, 720)
+    for i in range(count):
+        path = os.path.join(folder, f"clip_{i}.mp4")
+        pixels = lambda n: np.full((size[1], size[0], 3), (n * 3 + seed + i * 40) % 256, np.uint8)
+        try:
+            import av
+            container = av.open(path, 'w')
+            stream = container.add_stream('libx264', rate=30)
+            stream.width, stream.height = size
+            stream.pix_fmt = 'yuv420p'
+            for n in range(frames):
+                for packet in stream.encode(av.VideoFrame.from_ndarray(pixels(n), format='rgb24')):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+            container.close()
+            continue
+        except ImportError:
+            pass
+        try:
+            import cv2
+        except ImportError:
+            print("No video encoder (PyAV or OpenCV); skipping videos")
+            return i
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+        for n in range(frames):
+            writer.write(pixels(n))
+        writer.release()
+    return count
+
+def generate_library(root, args):
+    """Create (or reuse) the synthetic library described by args."""
+    params = {"files": args.files, "seed": args.seed, "megapixels": args.megapixels,
+              "copies": args.copies, "videos": args.videos}
+    manifest_path = os.path.join(root, 'manifest.json')
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            if json.load(f) == params:
+                print(f"Reusing library in {root}")
+                return params
+    except (OSError, ValueError):
+        pass
+
+    print(f"Generating library in {root} ...")
+    for name in ('bulk', 'samples'):
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    rng = random.Random(args.seed)
+    _write_bulk(os.path.join(root, 'bulk'), args.files, rng, _bulk_templates(rng))
+
+    samples = os.path.join(root, 'samples')
+    os.makedirs(samples)
+    for mp in args.megapixels:
+        img = _sample_image(_frame_size(mp), args.seed + int(mp * 10))
+        for ext, fmt in (('.jpg', 'JPEG'), ('.png', 'PNG'), ('.tif', 'TIFF')):
+            first = os.path.join(samples, f"sample_{mp:g}mp_0{ext}")
+            img.save(first, format=fmt, **({"quality": 92} if fmt == 'JPEG' else {}))
+            for n in range(1, args.copies):
+                shutil.copyfile(first, os.path.join(samples, f"sample_{mp:g}mp_{n}{ext}"))
+    params["videos"] = _write_videos(samples, args.videos, args.seed)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return params
+
+# --- Timing ---
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def record(self, name, samples, ops=None):
+        """samples: per-call seconds; ops: operations covered by one aggregate sample."""
+        if not samples:
+            return
+        total = sum(samples)
+        n = ops or len(samples)
+        per_op = [s / (ops or 1) for s in samples]
+        ordered = sorted(per_op)
+        self.metrics[name] = {
+            "n": n,
+            "total_s": round(total, 6),
+            "mean_ms": round(statistics.fmean(per_op) * 1000, 3),
+            "p50_ms": round(statistics.median(per_op) * 1000, 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            "ops_per_s": round(n / total, 2) if total > 0 else None,
+        }
+        m = self.metrics[name]
+        print(f"  {name:<32} n={n:<7} p50={m['p50_ms']:>10.3f} ms  p95={m['p95_ms']:>10.3f} ms  {m['ops_per_s']} ops/s")
+
+    def time_each(self, name, fn, items):
+        samples = []
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+        self.record(name, samples)
+
+def quiesce(app, timeout=120):
+    """Stop background thumbnail work started by a scan so it can't skew timings."""
+    app.thumb_prefetcher.start([])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app.thumb_prefetcher.progress()["in_flight"] == 0 and not app.thumb_prefetcher._scrub_jobs:
+            return
+        time.sleep(0.05)
+
+def wait_ops(app, op_ids, timeout=600):
+    pending = set(op_ids)
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        # Pruned ops are finished ones
+        active = {op["id"] for op in app.file_ops.status(list(pending)) if op["status"] in ("queued", "running")}
+        pending &= active
+        if pending:
+            time.sleep(0.01)
+    return not pending
+
+# --- Benchmarks ---
+
+def bench_scan(app, api, results, folder, repeats):
+    start = time.perf_counter()
+    names = api.scan_images(folder, None, "name", "asc")
+    results.record("scan.cold", [time.perf_counter() - start])
+    quiesce(app)
+    print(f"  ({len(names)} files)")
+    for sort_by in SORT_MODES:
+        samples = []
+        for i in range(repeats + 1):
+            start = time.perf_counter()
+            api.scan_images(folder, None, sort_by, "asc")
+            samples.append(time.perf_counter() - start)
+            quiesce(app)
+        # The first metadata sort extracts EXIF for the whole folder
+        results.record(f"scan.{sort_by}.first", samples[:1])
+        results.record(f"scan.{sort_by}", samples[1:])
+
+def bench_thumbnails(app, results, paths):
+    # Spawn the process pool outside the timed region
+    app.thumb_prefetcher._get_pool().submit(len, "").result()
+    for label, group in _by_kind(paths).items():
+        results.time_each(f"thumbnail.cold.{label}", app.get_thumbnail_bytes, group)
+        results.time_each(f"thumbnail.warm.{label}", app.get_thumbnail_bytes, group)
+
+def bench_view(app, results, paths):
+    client = app.create_media_server().test_client()
+    rendered = [p for p in paths if app.PreviewCache.needs_render(p)]
+
+    def fetch(path):
+        response = client.get('/view', query_string={'path': path})
+        if response.status_code != 200:
+            raise RuntimeError(f"/view {path}: HTTP {response.status_code}")
+        response.close()
+
+    for label, group in _by_kind(rendered).items():
+        results.time_each(f"view.cold.{label}", fetch, group)
+        results.time_each(f"view.warm.{label}", fetch, group)
+
+def bench_metadata(api, results, root, count, seed, samples):
+    # Fresh files: scans have already indexed the bulk folder
+    folder = os.path.join(root, 'meta_src')
+    shutil.rmtree(folder, ignore_errors=True)
+    rng = random.Random(seed + 1)
+    _write_bulk(folder, count, rng, _bulk_templates(rng))
+    paths = sorted(os.path.join(folder, n) for n in os.listdir(folder)) + samples
+    results.time_each("metadata.cold", api.get_image_metadata, paths)
+    results.time_each("metadata.warm", api.get_image_metadata, paths)
+
+def bench_file_ops(app, api, results, root, count, seed):
+    src = os.path.join(root, 'ops_src')
+    dest = os.path.join(root, 'ops_dest')
+    for folder in (src, dest):
+        shutil.rmtree(folder, ignore_errors=True)
+    rng = random.Random(seed)
+    _write_bulk(src, count, rng, _bulk_templates(rng))
+    names = sorted(os.listdir(src))
+    half = len(names) // 2
+
+    for label, submit in (("move", lambda n: api.move_image(n, src, dest)),
+                          ("delete", lambda n: api.delete_image(n, src))):
+        batch = names[:half] if label == "move" else names[half:]
+        start = time.perf_counter()
+        results_ = [submit(n) for n in batch]
+        submitted = time.perf_counter() - start
+        if not wait_ops(app, [r["op_id"] for r in results_ if r.get("success")]):
+            print(f"  {label}: timed out waiting for the queue")
+        results.record(f"fileops.{label}.submit", [submitted], ops=len(batch))
+        results.record(f"fileops.{label}", [time.perf_counter() - start], ops=len(batch))
+
+def _by_kind(paths):
+    """Group sample paths by 'ext' / 'ext.<mp>mp' for per-format metrics."""
+    groups = {}
+    for path in paths:
+        name = os.path.basename(path)
+        ext = os.path.splitext(name)[1].lstrip('.').lower()
+        label = f"{ext}.{name.split('_')[1]}" if name.startswith('sample_') else ext
+        groups.setdefault(label, []).append(path)
+    return dict(sorted(groups.items()))
+
+# --- Baseline Comparison ---
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """Metrics whose p50 grew beyond tolerance (and the noise floor)."""
+    regressions = []
+    print(f"\n{'metric':<34}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, metric in current.items():
+        old = baseline.get(name)
+        if not old or not old.get("p50_ms"):
+            continue
+        before, after = old["p50_ms"], metric["p50_ms"]
+        change = after / before - 1
+        flag = ""
+        if change > tolerance and after - before > min_delta_ms:
+            regressions.append({"metric": name, "baseline_ms": before, "current_ms": after,
+                                "change": round(change, 3)})
+            flag = "  REGRESSION"
+        print(f"{name:<34}{before:>12.3f}{after:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="MediaSort performance benchmarks")
+    parser.add_argument("--files", type=int, default=1000, help="bulk folder size (1k-100k)")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12, 24])
+    parser.add_argument("--copies", type=int, default=3, help="sample files per format and size")
+    parser.add_argument("--videos", type=int, default=3)
+    parser.add_argument("--ops", type=int, default=1000, help="files for move/delete throughput")
+    parser.add_argument("--metadata-files", type=int, default=500, help="fresh files for metadata timings")
+    parser.add_argument("--repeats", type=int, default=3, help="warm scans per sort mode")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--data", help="keep the generated library here and reuse it")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore smaller absolute changes")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="mediasort-bench-")
+    root = os.path.abspath(args.data) if args.data else os.path.join(scratch, 'library')
+    os.makedirs(root, exist_ok=True)
+    # Isolated app caches (LOCALAPPDATA wins over XDG_CACHE_HOME)
+    os.environ['LOCALAPPDATA'] = os.path.join(scratch, 'cache')
+    try:
+        library = generate_library(root, args)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app
+        api = app.Api()
+        results = Results()
+
+        bulk = os.path.join(root, 'bulk')
+        samples_dir = os.path.join(root, 'samples')
+        samples = sorted(os.path.join(samples_dir, n) for n in os.listdir(samples_dir))
+        work = root if args.data else scratch
+
+        print("scan_images")
+        bench_scan(app, api, results, bulk, args.repeats)
+        print("get_thumbnail_bytes")
+        bench_thumbnails(app, results, samples)
+        print("/view")
+        bench_view(app, results, samples)
+        print("get_image_metadata")
+        bench_metadata(api, results, work, args.metadata_files, args.seed,
+                       [p for p in samples if not p.endswith('.mp4')])
+        print("move_image / delete_image")
+        bench_file_ops(app, api, results, work, args.ops, args.seed)
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec='seconds'),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "library": library,
+            },
+            "metrics": results.metrics,
+        }
+        exit_code = 0
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare(results.metrics, baseline.get("metrics", {}), args.tolerance, args.min_delta_ms)
+            report["baseline"] = {"file": args.baseline, "meta": baseline.get("meta"), "regressions": regressions}
+            if regressions:
+                print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+                exit_code = 1
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResults written to {args.output}")
+        return exit_code
+    finally:
+        for name in ('ops_src', 'ops_dest', 'meta_src'):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
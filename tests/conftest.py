@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# app.py lives at the repository root and creates its caches on import;
+# keep them out of the real user cache
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('LOCALAPPDATA', None)
+os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='mediasort-tests-')
@@ -0,0 +1,136 @@
+import io
+import struct
+import time
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def jpeg_bytes(size=(40, 30), **kwargs):
+    out = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(out, 'JPEG', **kwargs)
+    return out.getvalue()
+
+
+def tiff(endian, ifds, tail=b''):
+    """
+    TIFF with the IFDs laid out back to back after the header, then `tail`.
+    Each IFD is ([(tag, type, count, value)], next) where value is an int
+    (inline) and next is an IFD index, an absolute offset (('at', n)) or None.
+    """
+    e = '<' if endian == 'II' else '>'
+    offsets, pos = [], 8
+    for entries, _ in ifds:
+        offsets.append(pos)
+        pos += 2 + 12 * len(entries) + 4
+    tail_offset = pos
+
+    out = bytearray(endian.encode() + struct.pack(e + 'HI', 42, offsets[0]))
+    for entries, nxt in ifds:
+        out += struct.pack(e + 'H', len(entries))
+        for tag, typ, count, value in entries:
+            if typ == 3 and count == 1:
+                out += struct.pack(e + 'HHIHH', tag, typ, count, value, 0)
+            else:
+                out += struct.pack(e + 'HHII', tag, typ, count, value)
+        if nxt is None:
+            out += struct.pack(e + 'I', 0)
+        elif isinstance(nxt, tuple):
+            out += struct.pack(e + 'I', nxt[1])
+        else:
+            out += struct.pack(e + 'I', offsets[nxt])
+    assert len(out) == tail_offset
+    return bytes(out + tail), tail_offset
+
+
+def tiff_with_preview(endian):
+    preview = jpeg_bytes()
+    # The tail offset only depends on the entry count, so lay out twice
+    entries = [(0x112, 3, 1, 6), (0x201, 4, 1, 0), (0x202, 4, 1, len(preview))]
+    _, tail_offset = tiff(endian, [(entries, None)])
+    entries[1] = (0x201, 4, 1, tail_offset)
+    data, _ = tiff(endian, [(entries, None)], preview)
+    return data, tail_offset, preview
+
+
+@pytest.mark.parametrize('endian', ['II', 'MM'])
+def test_embedded_preview_in_either_byte_order(endian, tmp_path):
+    data, offset, preview = tiff_with_preview(endian)
+    candidates, orientation = app._embedded_jpegs(data)
+    assert candidates == [(offset, len(preview), (40, 30))]
+    assert orientation == 6
+
+    path = tmp_path / 'shot.dng'
+    path.write_bytes(data)
+    assert app._raw_preview(str(path), (256, 256)) == (preview, 6)
+
+
+def test_cyclic_ifd_chain_terminates():
+    # IFD0 -> IFD1 -> IFD0, and IFD1 lists itself as a SubIFD
+    ifd1 = 8 + 2 + 12 + 4
+    data, _ = tiff('MM', [([(0x100, 3, 1, 1)], 1), ([(0x101, 3, 1, 1), (0x14A, 4, 1, ifd1)], 0)])
+    endian, ifds = app._tiff_ifds(data)
+    assert endian == '>'
+    assert [sorted(tags) for tags in ifds] == [[0x100], [0x101, 0x14A]]
+
+
+def test_thousands_of_subifds_stay_cheap():
+    count = 4096
+    entries = [(0x14A, 4, count, 0)]
+    _, tail_offset = tiff('II', [(entries, None)])
+    entries[0] = (0x14A, 4, count, tail_offset)
+    # Every SubIFD offset points at the same bogus spot
+    data, _ = tiff('II', [(entries, None)], struct.pack('<I', 5) * count)
+    start = time.perf_counter()
+    _, ifds = app._tiff_ifds(data)
+    assert time.perf_counter() - start < 1
+    assert len(ifds) <= 32
+
+
+def test_malformed_tag_types_are_ignored():
+    # Preview offset stored as ASCII, length as a negative SLONG offset
+    data, _ = tiff('II', [([(0x112, 2, 1, 0x36), (0x201, 2, 1, 0x30), (0x202, 9, 1, 0xFFFFFFF0)], None)])
+    assert app._embedded_jpegs(data) == ([], 1)
+    data, _ = tiff('II', [([(0x201, 9, 1, 0xFFFFFFF0), (0x202, 4, 1, 10)], None)])
+    assert app._embedded_jpegs(data) == ([], 1)
+
+
+def test_jpeg_size_rejects_bad_segment_lengths():
+    assert app._jpeg_size(b'\xff\xd8\xff\xe0\x00\x00' + b'\x00' * 16, 0) is None
+    assert app._jpeg_size(b'\xff\xd8\xff\xc0\x00\x11\x08', 0) is None
+    assert app._jpeg_size(jpeg_bytes(), 0) == (40, 30)
+    assert app._jpeg_size(jpeg_bytes(), -5) is None
+
+
+@pytest.mark.parametrize('sample', ['tiff-le', 'tiff-be', 'jpeg-exif', 'raf'])
+def test_truncated_files_do_not_raise(sample, tmp_path):
+    if sample == 'jpeg-exif':
+        exif = Image.Exif()
+        exif[0x112] = 6
+        exif[0x110] = 'Model'
+        data = jpeg_bytes(exif=exif.tobytes())
+    elif sample == 'raf':
+        preview = jpeg_bytes()
+        header = b'FUJIFILMCCD-RAW'.ljust(84, b'\0') + struct.pack('>II', 92, len(preview))
+        data = header + preview
+    else:
+        data = tiff_with_preview('II' if sample == 'tiff-le' else 'MM')[0]
+
+    path = tmp_path / ('sample.jpg' if sample == 'jpeg-exif' else 'sample.raf')
+    for length in range(len(data) + 1):
+        prefix = data[:length]
+        path.write_bytes(prefix)
+        app._tiff_ifds(prefix)
+        app._embedded_jpegs(prefix)
+        app._jpeg_size(prefix, 0)
+        app._raw_preview(str(path), (256, 256))
+        app._exif_header_fields(str(path))
+        if sample == 'jpeg-exif':
+            app._exif_thumbnail(str(path))
+    # The complete file still parses
+    if sample == 'jpeg-exif':
+        assert app._exif_header_fields(str(path)) == ({'Model': 'Model'}, (40, 30))
+    else:
+        assert app._raw_preview(str(path), (256, 256))[0] is not None
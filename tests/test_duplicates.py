@@ -0,0 +1,53 @@
+import os
+import time
+
+import app
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_find_duplicates_reports_stages(tmp_path):
+    block = app.ContentHashIndex.BLOCK
+    same = b'a' * (3 * block)
+    write(str(tmp_path / 'card' / 'IMG_1.jpg'), same)
+    write(str(tmp_path / 'copy' / 'IMG_1.jpg'), same)
+    # Same size, head and tail as the others; differs only in the middle
+    write(str(tmp_path / 'copy' / 'IMG_2.jpg'), b'a' * block + b'b' * block + b'a' * block)
+    write(str(tmp_path / 'copy' / 'small.jpg'), b'c')
+
+    index = app.ContentHashIndex(str(tmp_path / 'hashes.db'))
+    updates = []
+    groups = index.find_duplicates([str(tmp_path / 'card'), str(tmp_path / 'copy')],
+                                   progress=lambda **fields: updates.append(fields))
+    assert groups == [{"size": 3 * block, "files": sorted([str(tmp_path / 'card' / 'IMG_1.jpg'),
+                                                            str(tmp_path / 'copy' / 'IMG_1.jpg')])}]
+    assert updates[0] == {"stage": "listing"}
+    assert {"files": 4} in updates
+    assert {"stage": "partial", "done": 0, "total": 3} in updates
+    assert {"stage": "full", "done": 0, "total": 3} in updates
+    assert updates[-1] == {"done": 3}
+
+
+def test_background_search_runs_once_at_a_time():
+    search = app.BackgroundSearch('test-search')
+    assert search.status() == {"state": "idle"}
+
+    def task(update):
+        update(done=1)
+        time.sleep(0.2)
+        return {"groups": []}
+
+    assert search.start(task, total=2)
+    assert not search.start(task, total=2)
+    while search.status()["state"] == "running":
+        time.sleep(0.01)
+    assert search.status() == {"state": "done", "total": 2, "done": 1, "groups": []}
+
+    assert search.start(lambda update: 1 / 0)
+    while search.status()["state"] == "running":
+        time.sleep(0.01)
+    assert search.status()["state"] == "error"
@@ -0,0 +1,52 @@
+import time
+
+import app
+
+
+def wait_idle(queue, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not any(op["status"] in ("queued", "running") for op in queue.status()):
+            return
+        time.sleep(0.01)
+    raise AssertionError("file ops still pending")
+
+
+def test_completed_ops_can_be_undone_after_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'note_move_queued', lambda src, dest: None)
+    monkeypatch.setattr(app, 'note_file_moved', lambda src, dest: None)
+    src, dest = tmp_path / 'a.jpg', tmp_path / 'sorted' / 'a.jpg'
+    src.write_bytes(b'x')
+
+    queue = app.FileOpQueue(str(tmp_path / 'fileops.journal'))
+    queue.recover()
+    op_id = queue.submit('move', str(src), str(dest))
+    wait_idle(queue)
+    assert dest.exists()
+
+    restarted = app.FileOpQueue(queue.journal_path)
+    assert restarted.recover() == []  # Completed ops are kept, not replayed
+    undo_id = restarted.undo(op_id)
+    assert undo_id is not None
+    wait_idle(restarted)
+    assert src.exists() and not dest.exists()
+
+
+def test_journal_keeps_a_bounded_number_of_completed_ops(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'note_move_queued', lambda src, dest: None)
+    monkeypatch.setattr(app, 'note_file_moved', lambda src, dest: None)
+    monkeypatch.setattr(app.FileOpQueue, 'KEEP_DONE', 2)
+    queue = app.FileOpQueue(str(tmp_path / 'fileops.journal'))
+    queue.recover()
+    op_ids = []
+    for i in range(4):
+        (tmp_path / f'{i}.jpg').write_bytes(b'x')
+        op_ids.append(queue.submit('move', str(tmp_path / f'{i}.jpg'), str(tmp_path / 'out' / f'{i}.jpg')))
+        wait_idle(queue)
+
+    restarted = app.FileOpQueue(queue.journal_path)
+    restarted.recover()
+    with open(queue.journal_path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+    assert restarted.undo(op_ids[0]) is None
+    assert restarted.undo(op_ids[3]) is not None
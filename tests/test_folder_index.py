@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import app
+
+
+def write(path, data, mtime):
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    write(str(tmp_path / 'a.jpg'), b'a', 1000)
+    write(str(tmp_path / 'b.jpg'), b'bb', 1000)
+    return str(tmp_path)
+
+
+def test_in_place_edit_is_picked_up_without_watcher(folder):
+    index = app.FolderIndex(folder)
+    index._observer = None
+    index.refresh()
+    dir_mtime = os.stat(folder).st_mtime_ns
+
+    write(os.path.join(folder, 'a.jpg'), b'edited', 2000)
+    os.utime(folder, ns=(dir_mtime, dir_mtime))  # an edit doesn't touch the directory
+    assert index.refresh()
+    assert dict((n, (s, m)) for n, s, m in index.items())['a.jpg'] == (6, 2000)
+    assert not index.refresh()
+
+
+def test_watched_index_rescans_when_events_lag(folder):
+    index = app.FolderIndex(folder)
+    index._observer = object()  # pretend watchdog is running
+    index.refresh()
+    index.refresh()  # now trusting events
+
+    # A new file whose event has not arrived yet
+    write(os.path.join(folder, 'c.jpg'), b'c', 1000)
+    os.utime(folder, ns=(index.dir_mtime_ns + 10**9,) * 2)
+    assert index.refresh()
+    assert {n for n, _, _ in index.items()} == {'a.jpg', 'b.jpg', 'c.jpg'}
+
+    # A modified event re-stats just that file
+    write(os.path.join(folder, 'b.jpg'), b'bbbb', 3000)
+    index._changed.add('b.jpg')
+    assert index.refresh()
+    assert dict((n, (s, m)) for n, s, m in index.items())['b.jpg'] == (4, 3000)
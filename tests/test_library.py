@@ -0,0 +1,160 @@
+import math
+import os
+
+import numpy as np
+import pytest
+
+import app
+
+
+def touch(path, size=1, mtime=1000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (mtime, mtime))
+
+
+def make_shard(keys, capture=None):
+    """In-memory shard with one folder and a size column of `keys`."""
+    n = len(keys)
+    names = [f'IMG_{i:05d}.jpg'.encode() for i in range(n)]
+    columns = {
+        'dir_id': np.zeros(n, dtype=np.int32),
+        'name_off': np.concatenate([[0], np.cumsum([len(b) for b in names])]).astype(np.int64),
+        'names': b''.join(names),
+        'size': np.asarray(keys, dtype=np.int64),
+        'mtime': np.zeros(n),
+        'capture': np.full(n, np.nan) if capture is None else np.asarray(capture, dtype=np.float64),
+        'ext_id': np.zeros(n, dtype=np.int8),
+    }
+    return app.LibraryShard('/lib', [''], ['.jpg'], columns, 0)
+
+
+def catalog_with(tmp_path, shard):
+    catalog = app.LibraryCatalog(str(tmp_path / 'catalog'))
+    catalog._roots = [shard.root]
+    catalog._shards[shard.root] = shard
+    return catalog
+
+
+@pytest.fixture
+def library_root(tmp_path):
+    root = tmp_path / 'card'
+    touch(str(root / 'DCIM' / '100CANON' / 'IMG_10.jpg'), size=10, mtime=1010)
+    touch(str(root / 'DCIM' / '100CANON' / 'IMG_2.jpg'), size=20, mtime=1002)
+    touch(str(root / 'DCIM' / '20CANON' / 'clip.MP4'), size=30, mtime=1030)
+    touch(str(root / 'DCIM' / '20CANON' / 'notes.txt'))
+    touch(str(root / 'top.png'), size=5, mtime=1005)
+    touch(str(root / '.hidden' / 'secret.jpg'))
+    touch(str(root / 'DCIM' / '100CANON' / 'ümlaut.jpg'), size=15, mtime=1015)
+    return str(root)
+
+
+def rel_paths(shard):
+    return [os.path.relpath(shard.path(row), shard.root) for row in range(len(shard))]
+
+
+def test_scan_orders_rows_naturally_and_skips_hidden(library_root):
+    shard = app.LibraryShard.scan(library_root, app.DEFAULT_MEDIA_EXTS)
+    assert rel_paths(shard) == [
+        'top.png',
+        os.path.join('DCIM', '20CANON', 'clip.MP4'),
+        os.path.join('DCIM', '100CANON', 'IMG_2.jpg'),
+        os.path.join('DCIM', '100CANON', 'IMG_10.jpg'),
+        os.path.join('DCIM', '100CANON', 'ümlaut.jpg'),
+    ]
+    assert list(shard.size) == [5, 30, 20, 10, 15]
+    assert (np.diff(shard.dir_id) >= 0).all()  # each folder's rows are contiguous
+    assert np.isnan(shard.capture).all()
+
+
+def test_scan_carries_over_unchanged_captures(library_root):
+    first = app.LibraryShard.scan(library_root, app.DEFAULT_MEDIA_EXTS)
+    first.capture[:] = np.arange(len(first), dtype=np.float64)
+    captures = {rel: first.capture[row] for row, rel in enumerate(rel_paths(first))}
+    edited = os.path.join(library_root, 'DCIM', '100CANON', 'IMG_2.jpg')
+    touch(edited, size=21, mtime=2000)
+
+    second = app.LibraryShard.scan(library_root, app.DEFAULT_MEDIA_EXTS, previous=first)
+    for row, rel in enumerate(rel_paths(second)):
+        if rel.endswith('IMG_2.jpg'):
+            assert math.isnan(second.capture[row])
+        else:
+            assert second.capture[row] == captures[rel]
+
+
+def test_save_load_round_trip(library_root, tmp_path):
+    shard = app.LibraryShard.scan(library_root, app.DEFAULT_MEDIA_EXTS)
+    path = str(tmp_path / 'shard.npz')
+    shard.save(path)
+    loaded = app.LibraryShard.load(path)
+    assert rel_paths(loaded) == rel_paths(shard)
+    assert loaded.dirs == shard.dirs and loaded.exts == shard.exts
+    np.testing.assert_array_equal(loaded.size, shard.size)
+
+
+def test_match_filters(library_root):
+    shard = app.LibraryShard.scan(library_root, app.DEFAULT_MEDIA_EXTS)
+
+    def names(filters):
+        mask = shard.match(filters)
+        rows = range(len(shard)) if mask is None else np.flatnonzero(mask)
+        return [shard.name(int(row)) for row in rows]
+
+    assert shard.match({}) is None
+    assert names({'exts': ['mp4']}) == ['clip.MP4']
+    assert names({'folder': os.path.join(library_root, 'DCIM', '100CANON')}) == ['IMG_2.jpg', 'IMG_10.jpg', 'ümlaut.jpg']
+    assert names({'folder': os.path.dirname(library_root)}) == names({})
+    assert names({'folder': os.path.join(os.path.dirname(library_root), 'elsewhere')}) == []
+    assert names({'min_size': 10, 'max_size': 20}) == ['IMG_2.jpg', 'IMG_10.jpg', 'ümlaut.jpg']
+    assert names({'date_from': 1010}) == ['clip.MP4', 'IMG_10.jpg', 'ümlaut.jpg']
+    assert names({'text': 'img_1'}) == ['IMG_10.jpg']
+    assert names({'text': 'ümlaut'}) == ['ümlaut.jpg']
+    # A match straddling two adjacent names in the blob is not a match
+    assert names({'text': 'pngclip'}) == []
+
+
+def test_match_capture_range_excludes_unknown(tmp_path):
+    shard = make_shard([1, 2, 3, 4], capture=[np.nan, app.NO_CAPTURE, 100.0, 200.0])
+    assert list(np.flatnonzero(shard.match({'capture_to': 150}))) == [2]
+    assert list(np.flatnonzero(shard.match({'capture_from': 0}))) == [2, 3]
+
+
+def test_query_pages_match_full_stable_sort(tmp_path):
+    # Few known keys and many ties, like unknown capture times
+    keys = np.full(10000, 7)
+    keys[np.random.default_rng(1).choice(10000, 50, replace=False)] = np.arange(50)
+    catalog = catalog_with(tmp_path, make_shard(keys))
+    expected = np.argsort(keys, kind='stable')
+
+    seen = []
+    for offset in range(0, 1000, 200):
+        page = catalog.query(None, 'size', 'asc', offset, 200)
+        assert page['total'] == 10000
+        seen += [int(e['path'][-9:-4]) for e in page['entries']]
+    assert seen == list(expected[:1000])
+
+
+def test_query_sorts_and_filters_across_shards(tmp_path):
+    catalog = app.LibraryCatalog(str(tmp_path / 'catalog'))
+    for name, size in (('a', 1), ('b', 3)):
+        root = str(tmp_path / name)
+        touch(os.path.join(root, 'x.jpg'), size=size)
+        touch(os.path.join(root, 'sub', 'y.jpg'), size=size + 1)
+        catalog.add_root(root)
+        shard = app.LibraryShard.scan(root, app.DEFAULT_MEDIA_EXTS)
+        catalog._shards[root] = shard
+    with pytest.raises(ValueError):
+        catalog.add_root(str(tmp_path / 'a' / 'sub'))
+
+    def paths(**kwargs):
+        return [os.path.relpath(e['path'], str(tmp_path)) for e in catalog.query(**kwargs)['entries']]
+
+    assert paths(sort_by='size', order='desc') == [
+        os.path.join('b', 'sub', 'y.jpg'), os.path.join('b', 'x.jpg'),
+        os.path.join('a', 'sub', 'y.jpg'), os.path.join('a', 'x.jpg')]
+    assert paths(sort_by='path', order='asc', offset=1, limit=2) == [
+        os.path.join('a', 'sub', 'y.jpg'), os.path.join('b', 'x.jpg')]
+    assert paths(filters={'roots': [str(tmp_path / 'b')]}, sort_by='path', order='asc') == [
+        os.path.join('b', 'x.jpg'), os.path.join('b', 'sub', 'y.jpg')]
+    assert catalog.query({'text': 'nothing'})['total'] == 0
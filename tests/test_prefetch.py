@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_jobs_from_previous_folder_do_not_count(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def slow_job(path):
+        release.wait(5)
+        return b'jpeg', None, {}
+
+    monkeypatch.setattr(app, 'thumbnail_job', slow_job)
+    monkeypatch.setattr(app.thumb_cache, 'contains', lambda path, **kwargs: False)
+    monkeypatch.setattr(app.thumb_cache, 'put', lambda *args, **kwargs: None)
+    prefetcher = app.ThumbnailPrefetcher(max_workers=2)
+    prefetcher._pool = ThreadPoolExecutor(max_workers=2)
+
+    old = [str(tmp_path / 'old' / f'{i}.jpg') for i in range(2)]
+    prefetcher.start(old)
+    wait_for(lambda: prefetcher.progress()['in_flight'] == 2)
+
+    # New folder: one file of the old folder is listed again, one is new
+    new = [old[1], str(tmp_path / 'new' / 'a.jpg')]
+    prefetcher.start(new)
+    release.set()
+    wait_for(lambda: prefetcher.progress()['in_flight'] == 0 and prefetcher.progress()['queued'] == 0)
+    assert prefetcher.progress()['total'] == 2
+    assert prefetcher.progress()['done'] == 2
+
+
+def test_on_demand_requests_outside_the_listing_do_not_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'thumbnail_job', lambda path: (b'jpeg', None, {}))
+    monkeypatch.setattr(app.thumb_cache, 'contains', lambda path, **kwargs: False)
+    monkeypatch.setattr(app.thumb_cache, 'put', lambda *args, **kwargs: None)
+    prefetcher = app.ThumbnailPrefetcher(max_workers=2)
+    prefetcher._pool = ThreadPoolExecutor(max_workers=2)
+
+    listed = [str(tmp_path / f'{i}.jpg') for i in range(2)]
+    prefetcher.start(listed)
+    for i in range(3):
+        prefetcher.request(str(tmp_path / 'elsewhere' / f'{i}.jpg')).result(5)
+    wait_for(lambda: prefetcher.progress()['done'] == 2 and prefetcher.progress()['in_flight'] == 0)
+    assert prefetcher.progress()['total'] == 2
+    assert prefetcher.progress()['done'] == 2
@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def blocked_cache(tmp_path, monkeypatch):
+    """PreviewCache with one worker whose renders wait for `release`."""
+    release = threading.Event()
+    rendered = []
+
+    def render(path, size_class):
+        release.wait(5)
+        rendered.append(path)
+        return b'jpeg'
+
+    monkeypatch.setattr(app, 'render_image', render)
+    paths = []
+    for name in ('a.tif', 'b.tif'):
+        (tmp_path / name).write_bytes(b'x')
+        paths.append(str(tmp_path / name))
+    cache = app.PreviewCache(workers=1, ahead=0, behind=0)
+    yield cache, paths, release, rendered
+    release.set()
+
+
+def test_cancelled_render_is_not_resubmitted(blocked_cache):
+    cache, (a, b), release, rendered = blocked_cache
+    cache.set_position([a], 0)  # occupies the only worker
+    errors = []
+    waiter = threading.Thread(target=lambda: errors.append(pytest.raises(app.RenderBusy, cache.get, b)))
+    waiter.start()
+    while cache.stats()['pending'] < 2:
+        time.sleep(0.01)
+    cache.set_position([a], 0)  # b fell out of the window
+    waiter.join(5)
+    release.set()
+    assert errors and not waiter.is_alive()
+    cache._pool.shutdown(wait=True)
+    assert rendered == [a]
+
+
+def test_wait_is_bounded(blocked_cache, monkeypatch):
+    cache, (a, _), _, _ = blocked_cache
+    monkeypatch.setattr(app, 'POOL_WAIT_TIMEOUT', 0.05)
+    with pytest.raises(FutureTimeoutError):
+        cache.get(a)
+
+
+def test_miss_without_a_free_slot_is_busy(blocked_cache, monkeypatch):
+    cache, (a, _), _, rendered = blocked_cache
+    monkeypatch.setattr(app, 'render_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(app, 'RENDER_WAIT_TIMEOUT', 0.05)
+    app.render_slots.acquire()
+    with pytest.raises(app.RenderBusy):
+        cache.get(a)
+    assert cache.stats()['pending'] == 0
@@ -0,0 +1,29 @@
+import numpy as np
+
+import app
+
+
+def brute_force_pairs(phash, dhash, threshold):
+    def distance(a, b):
+        return bin(int(a) ^ int(b)).count('1')
+    return {(i, j) for i in range(len(phash)) for j in range(i + 1, len(phash))
+            if distance(phash[i], phash[j]) <= threshold and distance(dhash[i], dhash[j]) <= threshold * 2}
+
+
+def test_close_pairs_tiles_match_brute_force():
+    rng = np.random.default_rng(3)
+    base = rng.integers(0, 2**63, dtype=np.uint64)
+    # Hashes a few bits away from one another, so many pairs are close
+    flips = np.uint64(1) << rng.integers(0, 64, (300, 4)).astype(np.uint64)
+    phash = base ^ np.bitwise_xor.reduce(flips, axis=1)
+    dhash = phash ^ (np.uint64(1) << rng.integers(0, 64, 300).astype(np.uint64))
+    members = np.arange(300)
+    pairs = {(int(i), int(j)) for i, j in app._close_pairs(phash, dhash, members, 6, block=64)}
+    assert pairs == brute_force_pairs(phash, dhash, 6)
+
+
+def test_identical_hashes_group_in_listing_order(monkeypatch):
+    hashes = {'a': (1, 1), 'b': (5, 0b1111), 'c': (1, 1), 'd': (2**64 - 1, 2**64 - 1), 'e': (1, 1), 'f': (5, 0b0111)}
+    monkeypatch.setattr(app, 'hash_files', lambda paths, progress=None: {p: hashes[p] for p in paths})
+    assert app.find_similar_groups(list('abcdef')) == [['a', 'b', 'c', 'e', 'f']]
+    assert app.find_similar_groups(list('abcdef'), threshold=0) == [['a', 'c', 'e']]
@@ -0,0 +1,53 @@
+import pytest
+
+import app
+
+
+def test_internal_checks_do_not_count(tmp_path):
+    cache = app.ThumbnailCache(str(tmp_path / 'thumbs.db'))
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'x')
+    assert not cache.contains(str(path))
+    cache.put(str(path), b'jpeg')
+    assert cache.contains(str(path))
+    assert not cache.contains(str(path), variant='scrub')
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (0, 0)
+
+    assert cache.get(str(path)) == b'jpeg'
+    assert cache.get(str(path), variant='scrub') is None
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_thumbnail_request_counts_once(tmp_path, monkeypatch):
+    cache = app.ThumbnailCache(str(tmp_path / 'thumbs.db'))
+    monkeypatch.setattr(app, 'thumb_cache', cache)
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'x')
+
+    class Done:
+        def result(self, timeout=None):
+            return b'jpeg'
+
+    monkeypatch.setattr(app.thumb_prefetcher, 'request', lambda p: Done())
+    client = app.create_media_server().test_client()
+    assert client.get('/thumbnail', query_string={'path': str(path)}).data == b'jpeg'
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (0, 1)
+
+
+def test_batch_returns_hits_without_waiting_for_misses(tmp_path, monkeypatch):
+    import json
+    import struct
+
+    cache = app.ThumbnailCache(str(tmp_path / 'thumbs.db'))
+    monkeypatch.setattr(app, 'thumb_cache', cache)
+    for name in ('a.jpg', 'b.jpg'):
+        (tmp_path / name).write_bytes(b'x')
+    cache.put(str(tmp_path / 'a.jpg'), b'jpeg')
+    monkeypatch.setattr(app.thumb_prefetcher, 'request', lambda p: pytest.fail('batch waited on a render'))
+
+    client = app.create_media_server().test_client()
+    body = client.get('/thumbnails', query_string=[('folder', str(tmp_path)), ('name', 'a.jpg'), ('name', 'b.jpg')]).data
+    (header_len,) = struct.unpack('>I', body[:4])
+    items = json.loads(body[4:4 + header_len])['items']
+    assert [(item['name'], item['length']) for item in items] == [('a.jpg', 4), ('b.jpg', 0)]
+    assert body[4 + header_len:] == b'jpeg'
@@ -33,6 +33,7 @@ import {
   Video,
   Play,
   ArrowUpDown,
+  Camera,
 } from "lucide-react";
 import clsx from "clsx";
 
@@ -40,8 +41,10 @@ import clsx from "clsx";
 
 // ... (Other components)
 
-const ZoomableImage = forwardRef(({ src, alt }, ref) => {
+const ZoomableImage = forwardRef(({ src, fullSrc, alt, onLoad }, ref) => {
   const [scale, setScale] = useState(1);
+  // Switch from the preview rendition to the original once zoomed in
+  const [useFull, setUseFull] = useState(false);
   const containerRef = useRef(null);
   const dragControls = useDragControls();
   const x = useMotionValue(0);
@@ -62,10 +65,15 @@ const ZoomableImage = forwardRef(({ src, alt }, ref) => {
   useEffect(() => {
     // Instant reset without animation when image changes
     setScale(1);
+    setUseFull(false);
     x.set(0);
     y.set(0);
   }, [src]);
 
+  useEffect(() => {
+    if (scale > 1 && fullSrc) setUseFull(true);
+  }, [scale, fullSrc]);
+
   const handleWheel = (e) => {
     e.stopPropagation();
     const delta = -Math.sign(e.deltaY) * 0.25;
@@ -132,8 +140,9 @@ const ZoomableImage = forwardRef(({ src, alt }, ref) => {
       </div>
 
       <motion.img
-        src={src}
+        src={useFull ? fullSrc : src}
         alt={alt}
+        onLoad={onLoad}
         className={clsx(
           "relative max-w-full max-h-full object-contain z-10 transition-shadow",
           scale > 1 ? "cursor-grab active:cursor-grabbing" : "cursor-default",
@@ -220,6 +229,18 @@ const MetadataPanel = ({ data, onClose }) => {
 
 // --- API HANDLING ---
 
+// Media server base URL; the backend may fall back to another port when
+// 23456 is busy, so App asks for the real one on startup.
+let mediaServer = "http://127.0.0.1:23456";
+
+// Startup report: the first decoded image/video frame marks time-to-first-image
+let firstImageMarked = false;
+const markFirstImage = () => {
+  if (firstImageMarked || !window.pywebview) return;
+  firstImageMarked = true;
+  window.pywebview.api.mark_startup("first_image");
+};
+
 const callApi = async (method, ...args) => {
   // Check dynamically because pywebview is injected asynchronously
   if (window.pywebview) {
@@ -257,6 +278,18 @@ const callApi = async (method, ...args) => {
 
 // --- SETTINGS POPUP ---
 
+// Poll a queued file op until it is done, failed or waiting on a conflict
+const watchFileOp = async (opId) => {
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, 250));
+    const res = await callApi("get_file_ops", [opId]);
+    const op = res?.ops?.[0];
+    // Mock mode (or an op already pruned) counts as settled
+    if (!op) return { status: "done" };
+    if (["done", "failed", "conflict"].includes(op.status)) return op;
+  }
+};
+
 const SettingsPopup = ({ isOpen, onClose, shortcuts, onSave }) => {
   const [localShortcuts, setLocalShortcuts] = useState(shortcuts);
   const [listening, setListening] = useState(null); // 'next', 'prev', 'delete'
@@ -480,7 +513,14 @@ const DestinationCard = ({ path, index, onClick, onRemove }) => {
   );
 };
 
-const FilterPopup = ({ filters, onToggle, onClose }) => {
+const FilterPopup = ({
+  filters,
+  onToggle,
+  cameras,
+  camera,
+  onCamera,
+  onClose,
+}) => {
   // Grouped filters for better UX
   const groups = [
     { name: "Common", exts: ["jpg", "jpeg", "png", "webp", "gif"] },
@@ -538,25 +578,249 @@ const FilterPopup = ({ filters, onToggle, onClose }) => {
             </div>
           </div>
         ))}
+
+        {(cameras.length > 1 || camera) && (
+          <div className="space-y-2">
+            <div className="text-xs font-bold text-indigo-400 uppercase tracking-wider pl-1 flex items-center gap-2">
+              <Camera size={12} />
+              Camera
+            </div>
+            <div className="flex flex-col gap-1">
+              {[{ camera: null }, ...cameras].map((c) => (
+                <button
+                  key={c.camera ?? ""}
+                  onClick={() => onCamera(c.camera)}
+                  className={clsx(
+                    "px-2 py-1.5 text-xs rounded-md border transition-all flex justify-between items-center",
+                    camera === c.camera
+                      ? "bg-indigo-500/20 border-indigo-500/50 text-indigo-300"
+                      : "bg-white/5 border-white/5 text-gray-500 hover:border-white/20 hover:text-gray-400",
+                  )}
+                >
+                  <span className="truncate">{c.camera ?? "All cameras"}</span>
+                  {c.count != null && (
+                    <span className="font-mono text-[10px]">{c.count}</span>
+                  )}
+                </button>
+              ))}
+            </div>
+          </div>
+        )}
       </div>
     </motion.div>
   );
 };
 
+// --- BATCHED THUMBNAILS ---
+
+// Loads the visible filmstrip window with one /thumbnails request and hands
+// out object URLs. Returns a lookup: URL when loaded, null when the batch
+// could not provide it (use the per-file URL), undefined while pending.
+// Object URLs kept alive at most; the oldest outside the filmstrip are revoked
+const THUMB_URL_LIMIT = 150;
+
+const useThumbnailBatch = (sourcePath, images, start, end) => {
+  const urls = useRef(new Map()); // name -> object URL, least recently shown first
+  const settled = useRef(new Set());
+  const inFlight = useRef(new Set()); // names some batch request is loading
+  const folderRef = useRef(sourcePath);
+  const [, setVersion] = useState(0);
+  folderRef.current = sourcePath;
+
+  useEffect(() => {
+    const cache = urls.current;
+    const done = settled.current;
+    const loading = inFlight.current;
+    return () => {
+      cache.forEach((url) => URL.revokeObjectURL(url));
+      cache.clear();
+      done.clear();
+      loading.clear();
+    };
+  }, [sourcePath]);
+
+  useEffect(() => {
+    if (!window.pywebview || !sourcePath) return;
+    const wanted = images.slice(start, end);
+    const cache = urls.current;
+
+    // Mark the window as most recently shown, then revoke past the limit
+    wanted.forEach((name) => {
+      if (cache.has(name)) {
+        const url = cache.get(name);
+        cache.delete(name);
+        cache.set(name, url);
+      }
+    });
+    const visible = new Set(wanted);
+    for (const [name, url] of cache) {
+      if (cache.size <= THUMB_URL_LIMIT) break;
+      if (visible.has(name)) continue;
+      URL.revokeObjectURL(url);
+      cache.delete(name);
+      settled.current.delete(name);
+    }
+
+    // Skip names an earlier request is still loading: `images` changes
+    // while a scan streams in and would otherwise re-request the window
+    const missing = wanted.filter(
+      (name) => !settled.current.has(name) && !inFlight.current.has(name),
+    );
+    if (!missing.length) return;
+    missing.forEach((name) => inFlight.current.add(name));
+
+    let cancelled = false;
+    const load = async () => {
+      try {
+        // Ask by name: the server's listing may lag behind (streaming, moves)
+        const names = missing
+          .map((name) => `&name=${encodeURIComponent(name)}`)
+          .join("");
+        const res = await fetch(
+          `${mediaServer}/thumbnails?folder=${encodeURIComponent(sourcePath)}${names}`,
+        );
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const buf = await res.arrayBuffer();
+        if (folderRef.current !== sourcePath) return; // Folder changed meanwhile
+        const headerLen = new DataView(buf).getUint32(0);
+        const header = JSON.parse(
+          new TextDecoder().decode(new Uint8Array(buf, 4, headerLen)),
+        );
+        const base = 4 + headerLen;
+        for (const item of header.items) {
+          if (item.length && !cache.has(item.name)) {
+            const blob = new Blob(
+              [new Uint8Array(buf, base + item.offset, item.length)],
+              { type: "image/jpeg" },
+            );
+            cache.set(item.name, URL.createObjectURL(blob));
+          }
+        }
+      } catch (err) {
+        console.error("Thumbnail batch failed:", err);
+      }
+      if (folderRef.current !== sourcePath) return; // Sets belong to the new folder
+      // Anything still missing falls back to per-file requests
+      missing.forEach((name) => {
+        inFlight.current.delete(name);
+        settled.current.add(name);
+      });
+      if (!cancelled) setVersion((v) => v + 1);
+    };
+    load();
+    return () => {
+      cancelled = true;
+    };
+  }, [sourcePath, images, start, end]);
+
+  return (name) => {
+    if (urls.current.has(name)) return urls.current.get(name);
+    if (!window.pywebview || settled.current.has(name)) return null;
+    return undefined;
+  };
+};
+
 // --- THUMBNAIL COMPONENT ---
 
-const Thumbnail = ({ filename, sourcePath, current, onClick }) => {
+// Scrub strips are 160x90 cells side by side (see /scrub)
+const SCRUB_CELL_ASPECT = 160 / 90;
+const VIDEO_EXTS = ["mp4", "mov", "avi", "mkv", "webm"];
+// Shown as the original file: a JPEG preview would lose animation / vectors
+const ORIGINAL_PREVIEW_EXTS = ["gif", "svg"];
+// A busy server answers 503 and <img> never retries on its own
+const THUMB_RETRIES = 4;
+
+// Hover scrubbing for video thumbnails: the strip is fetched on first hover
+// (usually already pre-generated) and the cell under the cursor is shown.
+const useScrubStrip = (fullPath, enabled) => {
+  const [strip, setStrip] = useState(null);
+  const [frame, setFrame] = useState(null);
+  const requested = useRef(false);
+
+  useEffect(() => {
+    requested.current = false;
+    setStrip(null);
+    setFrame(null);
+  }, [fullPath]);
+
+  const onMouseMove = (e) => {
+    if (!enabled) return;
+    if (!requested.current) {
+      requested.current = true;
+      const url = `${mediaServer}/scrub?path=${encodeURIComponent(fullPath)}`;
+      const img = new Image();
+      img.onload = () =>
+        setStrip({
+          url,
+          frames: Math.max(
+            1,
+            Math.round(
+              img.naturalWidth / (img.naturalHeight * SCRUB_CELL_ASPECT),
+            ),
+          ),
+        });
+      img.src = url;
+    }
+    const rect = e.currentTarget.getBoundingClientRect();
+    setFrame(
+      Math.min(0.999, Math.max(0, (e.clientX - rect.left) / rect.width)),
+    );
+  };
+
+  const onMouseLeave = () => setFrame(null);
+
+  let style = null;
+  if (strip && frame !== null) {
+    // Cover the square box with one cell, centred like object-cover
+    const index = Math.floor(frame * strip.frames);
+    const cellWidth = SCRUB_CELL_ASPECT * 100;
+    style = {
+      backgroundImage: `url("${strip.url}")`,
+      backgroundSize: `${cellWidth * strip.frames}% 100%`,
+      backgroundPosition: `${
+        strip.frames > 1
+          ? ((index * cellWidth + (cellWidth - 100) / 2) /
+              (cellWidth * strip.frames - 100)) *
+            100
+          : 50
+      }% 0`,
+    };
+  }
+  return { onMouseMove, onMouseLeave, style };
+};
+
+const Thumbnail = ({
+  filename,
+  sourcePath,
+  current,
+  onClick,
+  batchSrc,
+  pending,
+}) => {
   const isActive = current;
 
   const sep = sourcePath.includes("\\") ? "\\" : "/";
   // Double encode if needed? No, Flask request.args handles URL decoding once.
   // encodeURIComponent creates valid generic URL.
   const fullPath = `${sourcePath}${sep}${filename}`;
-  const src = `http://127.0.0.1:23456/thumbnail?path=${encodeURIComponent(fullPath)}`;
+  const [attempt, setAttempt] = useState(0);
+  const retryTimer = useRef(null);
+  useEffect(() => {
+    setAttempt(0);
+    return () => clearTimeout(retryTimer.current);
+  }, [fullPath]);
+  const src =
+    batchSrc ||
+    `${mediaServer}/thumbnail?path=${encodeURIComponent(fullPath)}` +
+      (attempt ? `&retry=${attempt}` : "");
+  const isVideo = VIDEO_EXTS.includes(filename.split(".").pop().toLowerCase());
+  const scrub = useScrubStrip(fullPath, isVideo && !!window.pywebview);
 
   return (
     <div
       onClick={onClick}
+      onMouseMove={scrub.onMouseMove}
+      onMouseLeave={scrub.onMouseLeave}
       className={clsx(
         "flex-shrink-0 w-20 h-20 rounded-lg overflow-hidden border-2 cursor-pointer transition-all relative group",
         isActive
@@ -564,16 +828,30 @@ const Thumbnail = ({ filename, sourcePath, current, onClick }) => {
           : "border-white/10 hover:border-white/30 opacity-60 hover:opacity-100",
       )}
     >
-      <img
-        src={src}
-        className="w-full h-full object-cover"
-        alt={filename}
-        loading="lazy"
-        onError={(e) => {
-          e.target.style.display = "none"; // Hide if fails
-          // e.target.parentElement.classList.add('bg-red-900'); // Optional visual indicator
-        }}
-      />
+      {!pending && (
+        <img
+          src={src}
+          className="w-full h-full object-cover"
+          alt={filename}
+          loading="lazy"
+          onLoad={(e) => {
+            e.target.style.display = "";
+          }}
+          onError={(e) => {
+            e.target.style.display = "none"; // Hide if fails
+            // Server thumbnails are retried with backoff (busy / still rendering)
+            if (!batchSrc && attempt < THUMB_RETRIES) {
+              retryTimer.current = setTimeout(
+                () => setAttempt((a) => a + 1),
+                500 * 2 ** attempt,
+              );
+            }
+          }}
+        />
+      )}
+      {scrub.style && (
+        <div className="absolute inset-0 z-20" style={scrub.style} />
+      )}
       {isActive && (
         <div className="absolute inset-0 ring-2 ring-blue-500 rounded-lg" />
       )}
@@ -617,6 +895,50 @@ const AlertPopup = ({ isOpen, onClose, onConfirm, title, description }) => {
   );
 };
 
+const ConflictPopup = ({ op, onChoose }) => {
+  if (!op) return null;
+  const name = op.dest.split(/[/\\]/).pop();
+  return (
+    <div className="fixed inset-0 z-50 flex items-center justify-center p-4 bg-black/60 backdrop-blur-sm">
+      <motion.div
+        initial={{ opacity: 0, scale: 0.95 }}
+        animate={{ opacity: 1, scale: 1 }}
+        className="bg-[#1e1e1e] border border-white/10 rounded-xl shadow-2xl max-w-sm w-full overflow-hidden"
+      >
+        <div className="p-6">
+          <h3 className="text-lg font-semibold text-white mb-2">
+            File Already Exists
+          </h3>
+          <p className="text-gray-400 text-sm leading-relaxed break-all">
+            "{name}" already exists in the destination folder.
+          </p>
+        </div>
+        <div className="bg-white/5 px-6 py-4 flex justify-end gap-3">
+          <Button
+            onClick={() => onChoose("skip")}
+            className="bg-transparent hover:bg-white/10 text-white border border-white/10"
+          >
+            Skip
+          </Button>
+          <Button
+            onClick={() => onChoose("rename")}
+            className="bg-transparent hover:bg-white/10 text-white border border-white/10"
+          >
+            Keep Both
+          </Button>
+          <Button
+            onClick={() => onChoose("overwrite")}
+            variant="danger"
+            className="bg-red-600 hover:bg-red-700 text-white border-none"
+          >
+            Replace
+          </Button>
+        </div>
+      </motion.div>
+    </div>
+  );
+};
+
 // --- Error Boundary ---
 
 import { Component } from "react";
@@ -663,10 +985,12 @@ class ErrorBoundary extends Component {
 
 function App() {
   // ... (State and hooks)
+  const [, setServerUrl] = useState(mediaServer);
   const [sourcePath, setSourcePath] = useState(null);
   const [images, setImages] = useState([]);
   const [currentIndex, setCurrentIndex] = useState(0);
   const [currentImageSrc, setCurrentImageSrc] = useState(null);
+  const [currentOriginalSrc, setCurrentOriginalSrc] = useState(null);
   const [destinations, setDestinations] = useState([]);
   const [loading, setLoading] = useState(false);
   const [loadingImage, setLoadingImage] = useState(false);
@@ -691,10 +1015,13 @@ function App() {
     "webm",
   ]);
   const [showFilters, setShowFilters] = useState(false);
+  const [camera, setCamera] = useState(null); // "Make Model", or null for all
+  const [cameras, setCameras] = useState([]); // [{ camera, count }] in the folder
   const [showDeleteAlert, setShowDeleteAlert] = useState(false);
   const [history, setHistory] = useState([]);
   const [metadata, setMetadata] = useState(null);
   const [showMetadata, setShowMetadata] = useState(false);
+  const [conflicts, setConflicts] = useState([]); // [{ op, resolve }] awaiting a decision
 
   // Shortcuts State
   const DEFAULT_SHORTCUTS = {
@@ -711,13 +1038,26 @@ function App() {
     }
   });
   const [showSettings, setShowSettings] = useState(false);
-  const [sortConfig, setSortConfig] = useState({ by: "name", order: "asc" }); // 'name', 'date', 'size'
+  const [sortConfig, setSortConfig] = useState({ by: "name", order: "asc" }); // 'name', 'date', 'size', 'capture', 'camera', 'iso', 'resolution'
   const [showSort, setShowSort] = useState(false);
 
   useEffect(() => {
     localStorage.setItem("mediasort_shortcuts", JSON.stringify(shortcuts));
   }, [shortcuts]);
 
+  useEffect(() => {
+    const resolveServer = async () => {
+      callApi("mark_startup", "ui_ready");
+      const url = await callApi("get_server_url");
+      if (url) {
+        mediaServer = url;
+        setServerUrl(url); // Re-render media URLs with the real port
+      }
+    };
+    if (window.pywebview) resolveServer();
+    else window.addEventListener("pywebviewready", resolveServer, { once: true });
+  }, []);
+
   const imageRef = useRef(null);
   const thumbnailRefs = useRef([]); // Ensure initialized
 
@@ -737,24 +1077,73 @@ function App() {
   const carouselStartIndex = Math.max(0, currentIndex - 3);
   const carouselEndIndex = Math.min(images.length, currentIndex + 12);
   const carouselImages = images.slice(carouselStartIndex, carouselEndIndex);
+  const thumbSrc = useThumbnailBatch(
+    sourcePath,
+    images,
+    carouselStartIndex,
+    carouselEndIndex,
+  );
 
   const loadRef = useRef(currentIndex);
 
+  // Let the backend generate the visible filmstrip thumbnails first
+  useEffect(() => {
+    if (images.length) {
+      callApi("set_visible_range", carouselStartIndex, carouselEndIndex);
+    }
+  }, [carouselStartIndex, carouselEndIndex, images]);
+
+  const scanToken = useRef(0);
+
   const scan = async () => {
     if (!sourcePath) return;
+    const token = ++scanToken.current;
     setLoading(true);
-    // Pass sort config to backend
-    const imgs = await callApi(
-      "scan_images",
+    // Chunked scan: show the first page right away, stream the rest in
+    const first = await callApi(
+      "scan_images_start",
       sourcePath,
       filters,
       sortConfig.by,
       sortConfig.order,
+      200,
+      camera,
     );
-    setImages(imgs || []);
+    if (token !== scanToken.current) {
+      if (first && !first.done) callApi("scan_images_close", first.cursor);
+      return;
+    }
+    if (!first) {
+      // Fallback (mock mode / older backend)
+      const imgs = await callApi(
+        "scan_images",
+        sourcePath,
+        filters,
+        sortConfig.by,
+        sortConfig.order,
+        camera,
+      );
+      setImages(imgs || []);
+      setCurrentIndex(0);
+      setLoading(false);
+      return;
+    }
+    setImages(first.entries || []);
     // Reset index if out of bounds or just 0
     setCurrentIndex(0);
     setLoading(false);
+
+    let done = first.done;
+    while (!done && token === scanToken.current) {
+      const page = await callApi("scan_images_next", first.cursor, 2000);
+      if (!page || token !== scanToken.current) break;
+      if (page.entries.length) {
+        setImages((prev) => [...prev, ...page.entries]);
+      }
+      done = page.done;
+    }
+    // Superseded by a newer scan: release the backend cursor
+    if (!done) callApi("scan_images_close", first.cursor);
   };
 
   // Rescan when filters change, but only if source is selected
@@ -762,26 +1151,48 @@ function App() {
     if (sourcePath) {
       scan();
     }
-  }, [filters, sourcePath, sortConfig]);
+  }, [filters, sourcePath, sortConfig, camera]);
+
+  // Cameras come from the metadata index, so only look them up once the filters are opened
+  useEffect(() => {
+    if (!showFilters || !sourcePath) return;
+    let stale = false;
+    callApi("get_cameras", sourcePath, filters).then((res) => {
+      if (!stale) setCameras(res || []);
+    });
+    return () => {
+      stale = true;
+    };
+  }, [showFilters, sourcePath, filters]);
+
+  // Keyed on the file rather than the list, so pages streaming in don't reload it
+  const currentFile = images[currentIndex];
 
   useEffect(() => {
+    // Tell the backend where we are so it can pre-render the next previews
+    const direction = currentIndex >= loadRef.current ? 1 : -1;
     loadRef.current = currentIndex; // Update ref
+    if (currentFile) callApi("set_view_position", currentIndex, direction);
+  }, [currentIndex, currentFile]);
 
-    if (!images.length || currentIndex >= images.length) {
+  useEffect(() => {
+    if (!currentFile) {
       setCurrentImageSrc(null);
       setMetadata(null);
       return;
     }
 
+    let stale = false;
     const load = async () => {
       setLoadingImage(true);
-      const filename = images[currentIndex];
+      const filename = currentFile;
       const sep = sourcePath.includes("\\") ? "\\" : "/";
       const fullPath = `${sourcePath}${sep}${filename}`;
 
       // OPTIMIZATION: Use direct HTTP URL instead of Base64 via Bridge
       // This is much faster and lighter on memory
-      const url = `http://127.0.0.1:23456/view?path=${encodeURIComponent(fullPath)}`;
+      const query = `path=${encodeURIComponent(fullPath)}`;
+      const url = `${mediaServer}/view?${query}`;
 
       const ext = filename.split(".").pop().toLowerCase();
       const isVideo = ["mp4", "mov", "avi", "mkv", "webm"].includes(ext);
@@ -789,20 +1200,66 @@ function App() {
       if (isVideo) {
         // Keep video| prefix for render logic
         setCurrentImageSrc(`video|${url}`);
-      } else {
+        setCurrentOriginalSrc(null);
+      } else if (ORIGINAL_PREVIEW_EXTS.includes(ext)) {
         setCurrentImageSrc(url);
+        setCurrentOriginalSrc(null);
+      } else {
+        // Bounded preview rendition; the original only once zoomed in
+        setCurrentImageSrc(
+          `${mediaServer}/render?${query}&size=preview&fmt=jpeg`,
+        );
+        setCurrentOriginalSrc(url);
       }
 
       setLoadingImage(false);
 
       // Fetch metadata (keep as API call since it uses Pillow/Exif)
       const meta = await callApi("get_image_metadata", fullPath);
-      if (currentIndex === loadRef.current) {
+      if (!stale) {
         setMetadata(meta);
       }
     };
     load();
-  }, [currentIndex, images, sourcePath]);
+    return () => {
+      stale = true;
+    };
+  }, [currentFile, sourcePath]);
+
+  // Follow a queued op to the end, asking the user about conflicts
+  const settleFileOp = async (opId) => {
+    let op = await watchFileOp(opId);
+    while (op.status === "conflict") {
+      const action = await new Promise((resolve) =>
+        setConflicts((prev) => [...prev, { op, resolve }]),
+      );
+      await callApi("resolve_file_op_conflict", opId, action);
+      op = await watchFileOp(opId);
+    }
+    return op;
+  };
+
+  const chooseConflict = (action) => {
+    const [first, ...rest] = conflicts;
+    setConflicts(rest);
+    first?.resolve(action);
+  };
+
+  // The item left the list optimistically; put it back if its op fails
+  const trackRemoval = (opId, filename, index, label) => {
+    settleFileOp(opId).then((op) => {
+      if (op.status !== "failed") return;
+      setHistory((prev) => prev.filter((h) => h.opId !== opId));
+      setImages((prev) =>
+        prev.includes(filename)
+          ? prev
+          : [...prev.slice(0, index), filename, ...prev.slice(index)],
+      );
+      if (op.error !== "Skipped") {
+        alert(`Failed to ${label} ${filename}: ${op.error || "Unknown error"}`);
+      }
+    });
+  };
 
   const handleUndo = async () => {
     if (history.length === 0) return;
@@ -810,19 +1267,25 @@ function App() {
     const lastAction = history[history.length - 1];
     let res;
 
-    if (lastAction.type === "move") {
-      res = await callApi(
-        "move_image",
-        lastAction.filename,
-        lastAction.to,
-        lastAction.from,
-      );
-    } else if (lastAction.type === "delete") {
-      res = await callApi(
-        "restore_image",
-        lastAction.filename,
-        lastAction.from,
-      );
+    if (lastAction.opId) {
+      // Inverse of the op as performed (the destination may have been renamed)
+      res = await callApi("undo_file_op", lastAction.opId);
+    }
+    if (!res?.success) {
+      if (lastAction.type === "move") {
+        res = await callApi(
+          "move_image",
+          lastAction.filename,
+          lastAction.to,
+          lastAction.from,
+        );
+      } else if (lastAction.type === "delete") {
+        res = await callApi(
+          "restore_image",
+          lastAction.filename,
+          lastAction.from,
+        );
+      }
     }
 
     if (res && res.success) {
@@ -830,6 +1293,16 @@ function App() {
       const newImages = [lastAction.filename, ...images];
       setImages(newImages);
       setCurrentIndex(0);
+      if (res.op_id) {
+        settleFileOp(res.op_id).then((op) => {
+          if (op.status !== "failed") return;
+          setImages((prev) => prev.filter((f) => f !== lastAction.filename));
+          setHistory((prev) => [...prev, lastAction]);
+          if (op.error !== "Skipped") {
+            alert("Undo failed: " + (op.error || "Unknown error"));
+          }
+        });
+      }
     } else {
       alert("Undo failed: " + (res?.error || "Unknown error"));
     }
@@ -839,6 +1312,9 @@ function App() {
     const path = await callApi("select_folder");
     if (path) {
       setSourcePath(path);
+      // A camera filter belongs to the folder it was picked in
+      setCamera(null);
+      setCameras([]);
       // The useEffect [filters, sourcePath] will trigger scan() automatically
     }
   };
@@ -869,8 +1345,15 @@ function App() {
     if (res && res.success) {
       setHistory((prev) => [
         ...prev,
-        { type: "move", filename, from: sourcePath, to: destPath },
+        {
+          type: "move",
+          filename,
+          from: sourcePath,
+          to: destPath,
+          opId: res.op_id,
+        },
       ]);
+      if (res.op_id) trackRemoval(res.op_id, filename, currentIndex, "move");
       const newImages = [...images];
       newImages.splice(currentIndex, 1);
       setImages(newImages);
@@ -897,8 +1380,9 @@ function App() {
     if (res && res.success) {
       setHistory((prev) => [
         ...prev,
-        { type: "delete", filename, from: sourcePath },
+        { type: "delete", filename, from: sourcePath, opId: res.op_id },
       ]);
+      if (res.op_id) trackRemoval(res.op_id, filename, currentIndex, "delete");
       const newImages = [...images];
       newImages.splice(currentIndex, 1);
       setImages(newImages);
@@ -1126,6 +1610,11 @@ function App() {
                       { label: "Date (Oldest)", by: "date", order: "asc" },
                       { label: "Size (Largest)", by: "size", order: "desc" },
                       { label: "Size (Smallest)", by: "size", order: "asc" },
+                      { label: "Captured (Oldest)", by: "capture", order: "asc" },
+                      { label: "Captured (Newest)", by: "capture", order: "desc" },
+                      { label: "Camera", by: "camera", order: "asc" },
+                      { label: "ISO (Lowest)", by: "iso", order: "asc" },
+                      { label: "Resolution (Highest)", by: "resolution", order: "desc" },
                     ].map((opt) => {
                       const isActive =
                         sortConfig.by === opt.by &&
@@ -1174,7 +1663,7 @@ function App() {
                 )}
               >
                 <Filter size={18} />
-                {filters.length !== 13 && (
+                {(filters.length !== 13 || camera) && (
                   <span className="absolute top-1.5 right-1.5 w-2 h-2 bg-red-500 rounded-full border border-[#1e1e1e]"></span>
                 )}
               </Button>
@@ -1184,6 +1673,9 @@ function App() {
                   <FilterPopup
                     filters={filters}
                     onToggle={handleToggleFilter}
+                    cameras={cameras}
+                    camera={camera}
+                    onCamera={setCamera}
                     onClose={() => setShowFilters(false)}
                   />
                 )}
@@ -1285,6 +1777,7 @@ function App() {
                               playsInline
                               preload="auto"
                               className="max-w-full max-h-full rounded-lg shadow-2xl"
+                              onLoadedData={markFirstImage}
                               onError={(e) => console.error("Video Error:", e)}
                             />
                           </div>
@@ -1292,7 +1785,9 @@ function App() {
                           <ZoomableImage
                             ref={imageRef}
                             src={currentImageSrc}
+                            fullSrc={currentOriginalSrc}
                             alt=""
+                            onLoad={markFirstImage}
                           />
                         )}
                       </>
@@ -1375,10 +1870,12 @@ function App() {
                       filename={image}
                       sourcePath={sourcePath}
                       current={isCurrent}
+                      batchSrc={thumbSrc(image)}
+                      pending={thumbSrc(image) === undefined}
                     />
 
                     {isVideoFile && (
-                      <div className="absolute inset-0 flex items-center justify-center bg-black/30 backdrop-blur-[1px]">
+                      <div className="pointer-events-none absolute inset-0 flex items-center justify-center bg-black/30 backdrop-blur-[1px]">
                         <div className="w-8 h-8 rounded-full bg-black/50 flex items-center justify-center border border-white/20 shadow-md">
                           <Play
                             size={14}
@@ -1389,7 +1886,7 @@ function App() {
                     )}
 
                     {/* Gradient Overlay for Text */}
-                    <div className="absolute inset-0 bg-gradient-to-t from-black/80 via-transparent to-transparent opacity-60 group-hover:opacity-80 transition-opacity" />
+                    <div className="pointer-events-none absolute inset-0 bg-gradient-to-t from-black/80 via-transparent to-transparent opacity-60 group-hover:opacity-80 transition-opacity" />
                   </button>
                 );
               })}
@@ -1456,6 +1953,8 @@ function App() {
         description={`Are you sure you want to permanently delete "${images[currentIndex] || "this image"}"? This action cannot be undone.`}
       />
 
+      <ConflictPopup op={conflicts[0]?.op} onChoose={chooseConflict} />
+
       <SettingsPopup
         isOpen={showSettings}
         onClose={() => setShowSettings(false)}